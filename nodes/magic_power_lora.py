@@ -5,17 +5,34 @@ import folder_paths
 import comfy.sd
 import comfy.utils
 import comfy.lora
+import comfy.model_management
 from server import PromptServer
+import aiohttp
 from aiohttp import web
+import asyncio
 import numpy as np
 from PIL import Image
 import hashlib
+import io
+import email.utils
 import urllib.request
 import urllib.error
 import urllib.parse
 import re
+import struct
+import sqlite3
+import bisect
+import difflib
 import shutil
 import time
+import threading
+import atexit
+import itertools
+import functools
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import cv2
@@ -23,6 +40,18 @@ try:
 except ImportError:
     CV2_AVAILABLE = False
 
+try:
+    import av
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+
+try:
+    from safetensors import safe_open
+    SAFETENSORS_AVAILABLE = True
+except ImportError:
+    SAFETENSORS_AVAILABLE = False
+
 try:
     from utils import MagicUtils
 except ImportError:
@@ -32,6 +61,13 @@ except ImportError:
 # INT8 LoRA 支持 - 整合的代码（不依赖外部导入）
 # =============================================================================
 
+# 旧版 ComfyUI 没有 lora_convert（用于转换特殊格式的 LoRA）
+try:
+    import comfy.lora_convert
+    _LORA_CONVERT_AVAILABLE = True
+except ImportError:
+    _LORA_CONVERT_AVAILABLE = False
+
 # 尝试导入 LoRAAdapter（ComfyUI 的适配器基类）
 try:
     from comfy.weight_adapter.lora import LoRAAdapter
@@ -41,45 +77,162 @@ except ImportError:
 
 # --- INT8 量化工具函数 ---
 
-def stochastic_round_int8_delta(x: torch.Tensor, scale, seed: int = 0) -> torch.Tensor:
+_HASH_MASK = 0xFFFFFFFF
+
+def _hash32(x):
+    """32 位整数混洗哈希（lowbias32 变体），输入为 int64 张量或 Python int；乘法结果不会超出 int64"""
+    x = x ^ (x >> 16)
+    x = (x * 0x7feb352d) & _HASH_MASK
+    x = x ^ (x >> 15)
+    x = (x * 0x2c1b3c6d) & _HASH_MASK
+    x = x ^ (x >> 16)
+    return x
+
+def counter_uniform(seed: int, offset: int, numel: int, device) -> torch.Tensor:
+    """
+    基于计数器的 [0, 1) 均匀随机数：第 i 个值只取决于 (seed, offset + i)，
+    因此按任意大小分块生成的结果与一次性生成完全一致。
+    """
+    idx = torch.arange(offset, offset + numel, device=device, dtype=torch.int64)
+    key = _hash32(int(seed) & _HASH_MASK)
+    x = _hash32(((idx >> 32) ^ key) & _HASH_MASK)
+    x = _hash32(x ^ (idx & _HASH_MASK))
+    return (x >> 8).to(torch.float32) * (1.0 / 16777216.0)
+
+def normalize_weight_scale(scale, rows, cols):
+    """
+    把 weight_scale 规整为可与 (rows, G, cols // G) 分组视图广播的形状 (R, G)，R 为 1 或 rows。
+    支持：标量、逐输出通道 (rows,)/(rows, 1)、逐组 (rows, G)、逐输入通道 (cols,)/(1, cols)。
+    标量返回 float；无法识别的形状返回 None。
+    """
+    if not isinstance(scale, torch.Tensor):
+        return float(scale)
+    if scale.numel() == 1:
+        return scale.item()
+    s = scale.detach().to(torch.float32)
+    if s.ndim == 1:
+        if s.numel() == rows:
+            return s.reshape(rows, 1)
+        if cols % s.numel() == 0:
+            return s.reshape(1, -1)
+        return None
+    s = s.reshape(s.shape[0], -1)
+    if s.shape[0] in (1, rows) and cols % s.shape[1] == 0:
+        return s
+    return None
+
+def narrow_weight_scale(scale, offset, cols):
+    """
+    split-qkv 等带 offset (dim, start, size) 的补丁：ComfyUI 先把 INT8 权重 narrow 成子块再交给适配器，
+    逐通道/逐组的 weight_scale 仍对应整层，需要按同样的 offset 截取。
+    标量、可广播（该维为 1）和逐输入通道 (cols,) 的 scale 原样返回；长度不够时抛出 ValueError。
+    """
+    if offset is None or not isinstance(scale, torch.Tensor) or scale.numel() == 1:
+        return scale
+    dim, start, size = offset[0], offset[1], offset[2]
+    if scale.ndim == 1 and dim == 0 and scale.numel() == cols:
+        return scale
+    if dim >= scale.ndim or scale.shape[dim] == 1:
+        return scale
+    if scale.shape[dim] < start + size:
+        raise ValueError(f"weight_scale 形状 {tuple(scale.shape)} 无法按 offset {tuple(offset)} 截取")
+    return scale.narrow(dim, start, size)
+
+def stochastic_round_int8_delta(x: torch.Tensor, scale, seed: int = 0, offset: int = 0) -> torch.Tensor:
     """
     使用随机舍入将 delta 张量量化为 INT8。
     用于 LoRA deltas 以最小化量化误差。
+    scale 可以是标量、逐通道或逐组张量（见 normalize_weight_scale），一次广播完成缩放。
+    offset 为 x 第一个元素在整层中的线性下标（分块计算时使用），保证分块结果与整体一致。
     """
-    generator = torch.Generator(device=x.device)
-    generator.manual_seed(seed)
+    x_2d = x.reshape(x.shape[0], -1)
+    rows, cols = x_2d.shape
     
     # 缩放到 INT8 范围
-    if isinstance(scale, torch.Tensor):
-        scale_val = scale.item() if scale.numel() == 1 else scale
+    scale_val = normalize_weight_scale(scale, rows, cols)
+    if scale_val is None:
+        raise ValueError(f"weight_scale 形状 {tuple(scale.shape)} 与权重 ({rows}, {cols}) 不匹配")
+    if isinstance(scale_val, float):
+        x_scaled = x_2d / scale_val
     else:
-        scale_val = float(scale)
-    
-    x_scaled = x / scale_val
+        groups = scale_val.shape[1]
+        scale_val = scale_val.to(x.device)
+        x_scaled = (x_2d.reshape(rows, groups, cols // groups) / scale_val.unsqueeze(-1)).reshape(rows, cols)
     
     # 随机舍入
     x_floor = torch.floor(x_scaled)
     fraction = x_scaled - x_floor
     
     # 在目标设备上直接创建随机值
-    random_vals = torch.rand(x_scaled.shape, generator=generator, device=x.device, dtype=x_scaled.dtype)
-    x_rounded = torch.where(random_vals < fraction, x_floor + 1, x_floor)
+    random_vals = counter_uniform(seed, offset, x_scaled.numel(), x.device).reshape(x_scaled.shape)
+    x_rounded = torch.where(random_vals < fraction.to(torch.float32), x_floor + 1, x_floor)
     
-    return torch.clamp(x_rounded, -128, 127).to(torch.int8)
+    return torch.clamp(x_rounded, -128, 127).to(torch.int8).reshape(x.shape)
+
+def tiled_int8_lora_patch(weight, up, down, scale, weight_scale, seed, comp_device, tile_bytes, intermediate_dtype=torch.float32):
+    """
+    按行分块完成 up·down、随机舍入和 INT8 加法，结果写入预分配的输出张量。
+    峰值内存约为 "权重 + 单个分块的临时张量"，而不是整层大小的多份 fp32 拷贝。
+    随机数按整层线性下标生成，结果与分块大小无关。
+    weight_scale 需已经过 normalize_weight_scale 处理。
+    """
+    rows = weight.shape[0]
+    weight_2d = weight.reshape(rows, -1)
+    cols = weight_2d.shape[1]
+    out = torch.empty_like(weight_2d)
+    if isinstance(weight_scale, torch.Tensor):
+        weight_scale = weight_scale.to(comp_device)
+    per_row = isinstance(weight_scale, torch.Tensor) and weight_scale.shape[0] == rows and rows > 1
+
+    # 每个元素在分块内大约需要 ~40 字节临时空间（fp32 delta/floor/fraction + int64 计数器）
+    tile_rows = max(1, min(rows, int(tile_bytes) // max(1, cols * 40)))
+    up_2d = up.reshape(rows, -1)
+    for r0 in range(0, rows, tile_rows):
+        r1 = min(rows, r0 + tile_rows)
+        w_scale = weight_scale[r0:r1] if per_row else weight_scale
+        up_tile = up_2d[r0:r1].to(comp_device, dtype=intermediate_dtype)
+        delta_f = torch.mm(up_tile, down) * scale
+        delta_int8 = stochastic_round_int8_delta(delta_f, w_scale, seed, offset=r0 * cols)
+        del delta_f
+        res = weight_2d[r0:r1].to(comp_device, torch.int16) + delta_int8.to(torch.int16)
+        out[r0:r1] = torch.clamp(res, -128, 127).to(torch.int8).to(out.device)
+    return out.reshape(weight.shape)
 
 # --- INT8 LoRA 适配器 ---
 
+def write_narrowed_result(weight, result, offset):
+    """
+    带 offset 的补丁中 weight 是整层权重的 narrow 视图，ComfyUI 调用适配器后会丢弃返回值、继续使用整层权重，
+    因此结果必须原地写回视图；不带 offset 时直接返回结果。
+    """
+    if offset is None or result is weight:
+        return result
+    weight.copy_(result)
+    return weight
+
+# 静态模式随机舍入使用的固定 seed（烘焙缓存的键也包含它）
+INT8_STOCHASTIC_SEED = 318008
+
 if _LORA_ADAPTER_AVAILABLE:
     class INT8LoRAPatchAdapter(LoRAAdapter):
         """
         专门的 LoRA 适配器，在 INT8 空间内就地补丁 INT8 权重。
         """
-        def __init__(self, loaded_keys, weights, weight_scale, seed=0):
+        def __init__(self, loaded_keys, weights, weight_scale, seed=0, recorder=None, bake_name=None):
             super().__init__(loaded_keys, weights)
             self.weight_scale = weight_scale
             self.seed = seed
+            # 烘焙缓存记录器（BakedINT8Store），计算结果会交给它写入磁盘
+            self.recorder = recorder
+            self.bake_name = bake_name
 
         def calculate_weight(self, weight, key, strength, strength_model, offset, function, intermediate_dtype=torch.float32, original_weight=None):
+            result = self._calculate_int8(weight, strength, intermediate_dtype, offset)
+            if self.recorder is not None:
+                self.recorder.record(self.bake_name, self, result)
+            return write_narrowed_result(weight, result, offset)
+
+        def _calculate_int8(self, weight, strength, intermediate_dtype=torch.float32, offset=None):
             v = self.weights
             up, down, alpha = v[0], v[1], v[2]
             
@@ -91,40 +244,291 @@ if _LORA_ADAPTER_AVAILABLE:
             # 在高精度 GPU 上计算 LoRA Delta
             comp_device = torch.device("cuda") if torch.cuda.is_available() else device
             
-            up_f = up.to(comp_device, dtype=intermediate_dtype)
-            down_f = down.to(comp_device, dtype=intermediate_dtype)
+            down_f = down.to(comp_device, dtype=intermediate_dtype).flatten(1)
             
             # 处理可能的 mid weights (LoCon/LoHA)
             if v[3] is not None:
                 mid_f = v[3].to(comp_device, dtype=intermediate_dtype)
-                lora_diff = torch.mm(up_f.flatten(1), torch.mm(mid_f.flatten(1), down_f.flatten(1))).reshape(weight.shape)
-            else:
-                lora_diff = torch.mm(up_f.flatten(1), down_f.flatten(1)).reshape(weight.shape)
+                down_f = torch.mm(mid_f.flatten(1), down_f)
             
             # 应用补丁
             if weight.dtype == torch.int8:
-                # --- INT8 空间补丁 ---
-                delta_f = lora_diff * scale
-                delta_int8 = stochastic_round_int8_delta(delta_f, self.weight_scale, self.seed)
-                
-                # 执行整数加法（int32 安全）然后钳制
-                res = weight.to(comp_device, torch.int32) + delta_int8.to(comp_device, torch.int32)
-                return torch.clamp(res, -128, 127).to(torch.int8).to(device)
-            else:
-                # 回退：标准浮点补丁
-                return weight + (lora_diff * scale).to(weight.device, weight.dtype)
+                # --- INT8 空间补丁（按行分块，内存有上限） ---
+                rows, cols = weight.shape[0], weight[0].numel()
+                layer_scale = narrow_weight_scale(self.weight_scale, offset, cols)
+                w_scale = normalize_weight_scale(layer_scale, rows, cols)
+                if w_scale is None:
+                    raise ValueError(f"[MagicPowerLora] weight_scale 形状 {tuple(layer_scale.shape)} "
+                                     f"与 INT8 权重 {tuple(weight.shape)} 不匹配（offset={offset}）")
+                tile_bytes = float(_LORA_PERF.get("int8_tile_mb", 64)) * 1024 * 1024
+                return tiled_int8_lora_patch(weight, up, down_f, scale, w_scale, self.seed,
+                                             comp_device, tile_bytes, intermediate_dtype).to(device)
+
+            # 回退：标准浮点补丁
+            up_f = up.to(comp_device, dtype=intermediate_dtype)
+            lora_diff = torch.mm(up_f.flatten(1), down_f).reshape(weight.shape)
+            return weight + (lora_diff * scale).to(weight.device, weight.dtype)
+    class BakedINT8Adapter(LoRAAdapter):
+        """
+        直接返回磁盘缓存中已烘焙好的层权重（该层所有 LoRA 的合并结果）。
+        形状不匹配或读取失败时，按顺序重新应用该层原本的 INT8 适配器。
+        """
+        def __init__(self, loaded_keys, weights, store, bake_name):
+            super().__init__(loaded_keys, weights)
+            self.store = store
+            self.bake_name = bake_name
+
+        def calculate_weight(self, weight, key, strength, strength_model, offset, function, intermediate_dtype=torch.float32, original_weight=None):
+            baked = self.store.load(self.bake_name)
+            if baked is not None and baked.shape == weight.shape:
+                return write_narrowed_result(weight, baked.to(weight.device, weight.dtype), offset)
+            print(f"⚠️ [MagicPowerLora] Baked INT8 layer unusable, recomputing: {self.bake_name}")
+            result = weight
+            for adapter, adapter_strength in self.store.adapters.get(self.bake_name, []):
+                result = adapter._calculate_int8(result, adapter_strength, intermediate_dtype, offset)
+            return write_narrowed_result(weight, result, offset)
 else:
     INT8LoRAPatchAdapter = None
+    BakedINT8Adapter = None
 
 # --- 动态 LoRA 同步 Hook ---
 
+def _device_free_bytes(device):
+    """CUDA 设备当前可用显存（含 PyTorch 已缓存未使用的部分）；非 CUDA 设备或无法获取时返回 None"""
+    device = torch.device(device)
+    if device.type != "cuda":
+        return None
+    try:
+        return comfy.model_management.get_free_memory(device)
+    except Exception:
+        return None
+
+def _vram_reserve_bytes():
+    return float(_LORA_PERF.get("cache_min_free_vram_mb", 1024)) * 1024 * 1024
+
+def stage_tensors_to_device(tensors, device):
+    """
+    将一组张量批量搬运到目标设备，返回与输入顺序一致的张量列表。
+    - 已在目标设备上的张量原样返回，不做拷贝；
+    - CUDA 目标：同 dtype 的张量先拷入一块连续的锁页内存，再用一次 non_blocking 拷贝上传，
+      返回设备端缓冲区上的视图（这些视图常驻显存，跨任务复用）。
+      只要还有一个视图存活，整块缓冲区都不会释放，统计占用时应按底层存储计算（见 _unique_storage_nbytes）；
+    - 上传后剩余显存会低于 cache_min_free_vram_mb 时不合并缓冲区，逐个拷贝，让每个张量都能单独释放。
+    """
+    device = torch.device(device)
+    staged = list(tensors)
+    groups = {}
+    for i, t in enumerate(tensors):
+        if t.device == device:
+            continue
+        groups.setdefault(t.dtype, []).append(i)
+
+    combine = device.type == "cuda"
+    if combine and groups:
+        free = _device_free_bytes(device)
+        needed = sum(tensors[i].numel() * tensors[i].element_size() for indices in groups.values() for i in indices)
+        if free is not None and free - needed < _vram_reserve_bytes():
+            combine = False
+
+    for dtype, indices in groups.items():
+        if combine and len(indices) > 1:
+            try:
+                total = sum(tensors[i].numel() for i in indices)
+                host = torch.empty(total, dtype=dtype, pin_memory=True)
+                spans = []
+                offset = 0
+                for i in indices:
+                    n = tensors[i].numel()
+                    host[offset:offset + n].copy_(tensors[i].reshape(-1))
+                    spans.append((i, offset, n))
+                    offset += n
+                buffer = host.to(device, non_blocking=True)
+                for i, offset, n in spans:
+                    staged[i] = buffer[offset:offset + n].view(tensors[i].shape)
+                continue
+            except RuntimeError:
+                pass  # 锁页内存不可用时退回逐个拷贝
+        for i in indices:
+            staged[i] = tensors[i].to(device)
+    return staged
+
+def segmented_lora_delta(x, bank_A, bank_B, set_index):
+    """
+    批内多 LoRA 的低秩项：第 b 行使用 bank[set_index[b]]，通过一次 gather + 两次 bmm 完成。
+    x: (B, ..., in)；bank_A: (S, R, in)；bank_B: (S, out, R)；set_index: (B,) -> (B, ..., out)
+    """
+    batch = x.shape[0]
+    x_3d = x.reshape(batch, -1, x.shape[-1])
+    lora_A = bank_A.index_select(0, set_index)  # (B, R, in)
+    lora_B = bank_B.index_select(0, set_index)  # (B, out, R)
+    hidden = torch.bmm(x_3d, lora_A.transpose(1, 2))
+    out = torch.bmm(hidden, lora_B.transpose(1, 2))
+    return out.reshape(*x.shape[:-1], bank_B.shape[1])
+
+def reference_lora_delta_per_item(x, set_factors, set_index):
+    """
+    segmented_lora_delta 的 CPU 参考实现：逐个批次行用各自组合的 (lora_A, lora_B) 计算，
+    在该层没有补丁的组合用 None 表示。用于校验批内多 LoRA 模式的结果。
+    """
+    out_features = next(f[1].shape[0] for f in set_factors if f is not None)
+    outputs = []
+    for b in range(x.shape[0]):
+        x_b = x[b].to("cpu", torch.float32)
+        factors = set_factors[int(set_index[b])]
+        if factors is None:
+            outputs.append(torch.zeros(*x_b.shape[:-1], out_features))
+            continue
+        lora_A = factors[0].to("cpu", torch.float32).reshape(factors[0].shape[0], -1)
+        lora_B = factors[1].to("cpu", torch.float32).reshape(factors[1].shape[0], -1)
+        outputs.append((x_b @ lora_A.T) @ lora_B.T)
+    return torch.stack(outputs)
+
+def set_dynamic_lora_batch(model_patcher, lora_sets, set_index):
+    """
+    克隆 model_patcher 并启用批内多 LoRA 模式。
+    lora_sets: 多个 LoRA 组合，每个都是动态模式产生的 dynamic_loras 列表
+              （即 patcher.model_options["transformer_options"]["dynamic_loras"]）；
+    set_index: 每个批次行使用的组合下标。
+    """
+    patcher = model_patcher.clone()
+    DynamicLoRAHook.register(patcher.model.diffusion_model)
+    opts = patcher.model_options.setdefault("transformer_options", {})
+    opts["dynamic_lora_sets"] = [list(lora_set) for lora_set in lora_sets]
+    opts["dynamic_lora_set_index"] = list(set_index)
+    return patcher
+
+def _unique_storage_nbytes(tensors):
+    """统计张量底层存储的字节数，同一块存储只计一次（视图按整块缓冲区计算）"""
+    seen = set()
+    total = 0
+    for t in tensors:
+        storage = t.untyped_storage()
+        key = (t.device, storage.data_ptr())
+        if key not in seen:
+            seen.add(key)
+            total += storage.nbytes()
+    return total
+
+def _same_patch_refs(a, b):
+    """比较两组 (补丁对象, 强度)：对象按 is 比较，不依赖可能被复用的 id()"""
+    return len(a) == len(b) and all(x[0] is y[0] and x[1] == y[1] for x, y in zip(a, b))
+
+class ComposedLoRACache:
+    """
+    动态模式下已组合好的逐层 (lora_A, lora_B) 缓存，按 LoRA 集合 ID 键控，按字节预算 LRU 淘汰。
+    队列在几组 LoRA 之间来回切换时，切回最近用过的组合只需交换张量指针。
+    写入前检查目标显卡的剩余显存，低于 min_free_bytes 时清空缓存且不再缓存新组合。
+    """
+    def __init__(self, max_bytes, min_free_bytes=0):
+        self.max_bytes = max(0, int(max_bytes))
+        self.min_free_bytes = max(0, int(min_free_bytes))
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pressure_skips = 0
+        # lora_id -> (refs, composed, nbytes)；refs 持有补丁字典的强引用，防止 id 被复用
+        self._entries = OrderedDict()
+
+    def get(self, lora_id, refs):
+        entry = self._entries.get(lora_id)
+        if entry is not None and _same_patch_refs(entry[0], refs):
+            self._entries.move_to_end(lora_id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, lora_id, refs, composed):
+        # 组合结果是共享上传缓冲区上的视图，按缓冲区整体计算才能反映真实占用
+        tensors = [t for _, a, b in composed.values() for t in (a, b)]
+        nbytes = _unique_storage_nbytes(tensors)
+        if nbytes > self.max_bytes:
+            return
+        if self._memory_tight({t.device for t in tensors}):
+            # 显存紧张：丢掉缓存的其他组合（正在使用的张量仍由模块持有），本次也不缓存
+            self.pressure_skips += 1
+            self.evictions += len(self._entries)
+            self.clear()
+            return
+        old = self._entries.pop(lora_id, None)
+        if old is not None:
+            self.current_bytes -= old[2]
+        self._entries[lora_id] = (refs, composed, nbytes)
+        self.current_bytes += nbytes
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+            self.evictions += 1
+
+    def _memory_tight(self, devices):
+        for device in devices:
+            free = _device_free_bytes(device)
+            if free is not None and free < self.min_free_bytes:
+                return True
+        return False
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def get_stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "pressure_skips": self.pressure_skips,
+        }
+
 class DynamicLoRAHook:
     """
     在 diffusion_model 上注册的 Hook，用于在每次前向传播开始时
     将动态 LoRA 属性与当前 ModelPatcher 上下文同步。
     """
+    instances = weakref.WeakSet()
+
     def __init__(self):
         self.current_lora_id = None
+        self.modules = {}        # 模块名 -> Linear 模块
+        self.module_index = {}   # 补丁键 -> (优先级, 模块名)
+        self.applied = {}        # 模块名 -> (补丁签名, lora_A, lora_B)
+        self.cache = ComposedLoRACache(float(_LORA_PERF.get("dynamic_compose_cache_mb", 1024)) * 1024 * 1024,
+                                       _vram_reserve_bytes())
+        # 批内多 LoRA 模式：模块 -> (A 库, B 库)，以及每个批次行使用的 LoRA 组合下标
+        self.batch_banks = {}
+        self.batch_key = None
+        self.batch_refs = ()
+        self.batch_index = None
+        self._batch_hooks_registered = False
+        self._batch_hook_handles = []
+        DynamicLoRAHook.instances.add(self)
+
+    def build_index(self, diffusion_model):
+        """注册时一次性建立 补丁键 -> 线性层 的索引，并初始化动态 LoRA 属性"""
+        self.modules = {}
+        self.module_index = {}
+        for name, module in diffusion_model.named_modules():
+            # 检查是否是线性层（需要支持 LoRA）
+            if not isinstance(module, torch.nn.Linear):
+                continue
+            
+            # 如果模块没有 lora_A 属性，初始化它（用于动态模式）
+            if not hasattr(module, "lora_A"):
+                module.lora_A = None
+            if not hasattr(module, "lora_B"):
+                module.lora_B = None
+            if not hasattr(module, "lora_alpha"):
+                module.lora_alpha = None
+            
+            self.modules[name] = module
+            # ComfyUI 键通常是 'diffusion_model.path.to.weight' 或 'path.to.weight'
+            self.module_index[f"diffusion_model.{name}.weight"] = (0, name)
+            self.module_index.setdefault(f"{name}.weight", (1, name))
+        self.applied = {}
+        self.cache.clear()
 
     def pre_forward(self, module, input_args, input_kwargs):
         # 1. 尝试查找 transformer_options
@@ -135,6 +539,18 @@ class DynamicLoRAHook:
             if isinstance(context, dict) and "transformer_options" in context:
                 transformer_options = context["transformer_options"]
         
+        # 批内多 LoRA 模式：每个批次行按 dynamic_lora_set_index 使用各自的 LoRA 组合
+        lora_sets = transformer_options.get("dynamic_lora_sets")
+        set_index = transformer_options.get("dynamic_lora_set_index")
+        if lora_sets and set_index is not None:
+            if self.current_lora_id is not None:
+                self.apply_composition(module, [], None)
+                self.current_lora_id = None
+            self.prepare_batch(module, lora_sets, set_index)
+            return None
+        if self._batch_hooks_registered:
+            self.clear_batch()
+        
         dynamic_loras = transformer_options.get("dynamic_loras", [])
         
         # 2. 为此 LoRA 集合生成唯一 ID
@@ -144,480 +560,1871 @@ class DynamicLoRAHook:
         if lora_id == self.current_lora_id:
             return None  # 已同步
         
-        # 3. 同步所有线性层
-        self.apply_composition(module, dynamic_loras)
+        # 3. 同步有变化的线性层
+        self.apply_composition(module, dynamic_loras, lora_id)
         self.current_lora_id = lora_id
         return None
 
-    def apply_composition(self, diffusion_model, dynamic_loras):
-        # 按层预分组补丁
+    def apply_composition(self, diffusion_model, dynamic_loras, lora_id=None):
+        if not self.modules:
+            self.build_index(diffusion_model)
+
+        # 最近用过的 LoRA 组合直接从缓存取出，只交换指针
+        refs = tuple((d["patches"], d["strength"]) for d in dynamic_loras) if dynamic_loras else ()
+        composed = self.cache.get(lora_id, refs) if lora_id is not None else None
+        if composed is None:
+            composed = self.compose(dynamic_loras)
+            if lora_id is not None:
+                self.cache.put(lora_id, refs, composed)
+
+        # 不再有补丁的模块：清除
+        for name in [n for n in self.applied if n not in composed]:
+            module = self.modules[name]
+            module.lora_A = None
+            module.lora_B = None
+            module.lora_alpha = None
+            del self.applied[name]
+
+        # 只更新补丁发生变化的模块
+        for name, (signature, lora_A, lora_B) in composed.items():
+            current = self.applied.get(name)
+            if current is not None and current[1] is lora_A and current[2] is lora_B:
+                continue
+            module = self.modules[name]
+            module.lora_A = lora_A
+            module.lora_B = lora_B
+            module.lora_alpha = None
+            self.applied[name] = (signature, lora_A, lora_B)
+
+    def group_patches(self, dynamic_loras):
+        """按层预分组补丁（通过索引直接定位模块，同一模块优先使用带 diffusion_model. 前缀的键）"""
         layer_patches = {}
+        chosen = {}
         if dynamic_loras:
             for entry in dynamic_loras:
                 strength = entry["strength"]
                 for key, adapter in entry["patches"].items():
-                    if key not in layer_patches:
-                        layer_patches[key] = []
-                    layer_patches[key].append((adapter, strength))
+                    target = self.module_index.get(key)
+                    if target is None:
+                        continue
+                    priority, name = target
+                    if name in chosen and chosen[name] != priority:
+                        if priority > chosen[name]:
+                            continue
+                        layer_patches[name] = []
+                    chosen[name] = priority
+                    layer_patches.setdefault(name, []).append((adapter, strength))
+        return layer_patches
 
-        # 更新所有模块
-        for name, module in diffusion_model.named_modules():
-            # 检查是否是线性层（需要支持 LoRA）
-            if not isinstance(module, torch.nn.Linear):
-                continue
-            
-            # 如果模块没有 lora_A 属性，初始化它（用于动态模式）
-            if not hasattr(module, "lora_A"):
-                module.lora_A = None
-            if not hasattr(module, "lora_B"):
-                module.lora_B = None
-            if not hasattr(module, "lora_alpha"):
-                module.lora_alpha = None
+    @staticmethod
+    def compose_layer(patches):
+        """把一层上的多个 LoRA 组合成一对 (lora_A, lora_B)，张量留在源设备上"""
+        all_A = []
+        all_B = []
+        for adapter, strength in patches:
+            v = adapter.weights
+            up, down, alpha, mid = v[0], v[1], v[2], v[3]
+            rank = down.shape[0] if down.ndim >= 2 else 1
+            scale = (alpha / rank) * strength if alpha is not None else strength
             
-            # 查找此模块的补丁
-            # ComfyUI 键通常是 'diffusion_model.path.to.weight' 或 'path.to.weight'
-            possible_keys = [f"diffusion_model.{name}.weight", f"{name}.weight"]
-            patches = None
-            for pk in possible_keys:
-                if pk in layer_patches:
-                    patches = layer_patches[pk]
-                    break
+            curr_A = down
+            if mid is not None:
+                curr_A = torch.mm(mid.flatten(1), down.flatten(1)).reshape(down.shape)
             
-            if not patches:
-                module.lora_A = None
-                module.lora_B = None
-                module.lora_alpha = None
+            all_A.append(curr_A * scale if scale != 1.0 else curr_A)
+            all_B.append(up)
+        
+        # 单个 LoRA 时不需要拼接（CPU 上同设备时全程零拷贝）
+        lora_A = all_A[0] if len(all_A) == 1 else torch.cat(all_A, dim=0)
+        lora_B = all_B[0] if len(all_B) == 1 else torch.cat(all_B, dim=1)
+        return lora_A, lora_B
+
+    def compose(self, dynamic_loras):
+        """
+        按层组合 LoRA，返回 {模块名: (补丁签名, lora_A, lora_B)}；签名未变的层复用当前张量。
+        签名保存适配器对象本身（强引用）并按 is 比较，适配器被释放后 id 被复用也不会误用旧张量。
+        """
+        layer_patches = self.group_patches(dynamic_loras)
+        composed = {}
+        pending = {}  # 目标设备 -> [(模块名, 签名, lora_A, lora_B)]
+        for name, patches in layer_patches.items():
+            signature = tuple(patches)
+            current = self.applied.get(name)
+            if current is not None and _same_patch_refs(current[0], signature):
+                composed[name] = current
                 continue
+            module = self.modules[name]
 
             # 组合
-            all_A = []
-            all_B = []
-            for adapter, strength in patches:
-                v = adapter.weights
-                up, down, alpha, mid = v[0], v[1], v[2], v[3]
-                rank = down.shape[0] if down.ndim >= 2 else 1
-                scale = (alpha / rank) * strength if alpha is not None else strength
-                
-                curr_A = down
-                if mid is not None:
-                    curr_A = torch.mm(mid.flatten(1), down.flatten(1)).reshape(down.shape)
-                
-                all_A.append(curr_A * scale)
-                all_B.append(up)
-            
-            if all_A:
+            lora_A, lora_B = self.compose_layer(patches)
+            device = getattr(module, "weight", torch.tensor(0)).device
+            pending.setdefault(device, []).append((name, signature, lora_A, lora_B))
+
+        # 按目标设备批量传输：所有层的 A/B 拼进一块锁页内存后一次异步拷贝
+        for device, layers in pending.items():
+            tensors = []
+            for _, _, lora_A, lora_B in layers:
+                tensors.append(lora_A)
+                tensors.append(lora_B)
+            staged = stage_tensors_to_device(tensors, device)
+            for i, (name, signature, _, _) in enumerate(layers):
+                composed[name] = (signature, staged[2 * i], staged[2 * i + 1])
+        return composed
+
+    def prepare_batch(self, diffusion_model, lora_sets, set_index):
+        """
+        为批内多 LoRA 模式准备逐层的适配器库：A 库 (S, R_max, in)、B 库 (S, out, R_max)，
+        秩不足或该组合在此层没有补丁的部分补零。同一批 LoRA 组合只构建一次。
+        """
+        if not self.modules:
+            self.build_index(diffusion_model)
+        if not self._batch_hooks_registered:
+            self._batch_hook_handles = [module.register_forward_hook(self._batch_forward_hook)
+                                        for module in self.modules.values()]
+            self._batch_hooks_registered = True
+
+        refs = tuple(tuple((d["patches"], d["strength"]) for d in lora_set) for lora_set in lora_sets)
+        batch_key = hash(tuple(tuple((id(p), st) for p, st in set_refs) for set_refs in refs))
+        same_sets = batch_key == self.batch_key and len(refs) == len(self.batch_refs) and all(
+            _same_patch_refs(a, b) for a, b in zip(refs, self.batch_refs))
+        if not same_sets:
+            per_set = [self.group_patches(lora_set) for lora_set in lora_sets]
+            banks = {}
+            for name in set().union(*per_set):
+                module = self.modules[name]
                 device = getattr(module, "weight", torch.tensor(0)).device
-                module.lora_A = torch.cat(all_A, dim=0).to(device)
-                module.lora_B = torch.cat(all_B, dim=1).to(device)
-                module.lora_alpha = None
-            else:
-                module.lora_A = None
-                module.lora_B = None
+                factors = [self.compose_layer(layers[name]) if name in layers else None for layers in per_set]
+                present = [f for f in factors if f is not None]
+                rank = max(f[0].shape[0] for f in present)
+                in_features = present[0][0].shape[1]
+                out_features = present[0][1].shape[0]
+                dtype = present[0][0].dtype
+                bank_A = torch.zeros((len(factors), rank, in_features), dtype=dtype)
+                bank_B = torch.zeros((len(factors), out_features, rank), dtype=dtype)
+                for i, f in enumerate(factors):
+                    if f is None:
+                        continue
+                    r = f[0].shape[0]
+                    bank_A[i, :r] = f[0].reshape(r, -1).to("cpu", dtype)
+                    bank_B[i, :, :r] = f[1].reshape(out_features, -1).to("cpu", dtype)
+                banks[self.modules[name]] = tuple(stage_tensors_to_device([bank_A, bank_B], device))
+            self.batch_banks = banks
+            self.batch_key = batch_key
+            self.batch_refs = refs
+
+        if not isinstance(set_index, torch.Tensor):
+            set_index = torch.tensor(list(set_index), dtype=torch.long)
+        self.batch_index = set_index.to(torch.long)
+
+    def clear_batch(self):
+        """退出批内多 LoRA 模式：移除所有线性层上的 forward hook，并释放适配器库"""
+        for handle in self._batch_hook_handles:
+            handle.remove()
+        self._batch_hook_handles = []
+        self._batch_hooks_registered = False
+        self.batch_banks = {}
+        self.batch_key = None
+        self.batch_refs = ()
+        self.batch_index = None
+
+    def _batch_forward_hook(self, module, args, output):
+        if self.batch_index is None or not args:
+            return None
+        bank = self.batch_banks.get(module)
+        if bank is None:
+            return None
+        x = args[0]
+        index = self.batch_index
+        if x.shape[0] != index.numel():
+            # CFG 等情况下批次会被拼接成原来的整数倍，按块重复下标；其他情况无法确定每行对应的 LoRA 组合
+            if index.numel() == 0 or x.shape[0] % index.numel() != 0:
+                raise ValueError(f"dynamic_lora_set_index 长度 {index.numel()} 与批大小 {x.shape[0]} 不匹配"
+                                 f"（批大小必须是其整数倍）")
+            index = index.repeat(x.shape[0] // index.numel())
+        bank_A, bank_B = bank
+        if bank_A.dtype != x.dtype or bank_A.device != x.device:
+            bank = (bank_A.to(x.device, x.dtype), bank_B.to(x.device, x.dtype))
+            self.batch_banks[module] = bank
+            bank_A, bank_B = bank
+        return output + segmented_lora_delta(x, bank_A, bank_B, index.to(x.device)).to(output.dtype)
 
     @classmethod
     def register(cls, diffusion_model):
         if not hasattr(diffusion_model, "_dynamic_lora_hook"):
             hook = cls()
+            hook.build_index(diffusion_model)
             diffusion_model._dynamic_lora_hook = hook
             diffusion_model.register_forward_pre_hook(hook.pre_forward, with_kwargs=True)
         return diffusion_model._dynamic_lora_hook
 
+    @classmethod
+    def get_stats(cls):
+        return [hook.cache.get_stats() for hook in list(cls.instances)]
+
 # INT8 支持可用性标志
 INT8_AVAILABLE = _LORA_ADAPTER_AVAILABLE and INT8LoRAPatchAdapter is not None
 
-class MagicPowerLoraLoader:
-    @classmethod
-    def INPUT_TYPES(s):
-        return {
-            "required": {
-                "model": ("MODEL",),
-                "clip": ("CLIP",),
-                "lora_stack": ("STRING", {"default": "[]", "multiline": False}),
-            },
-            "hidden": {
-                "int8_mode": ("STRING", {"default": "none"}),
-            }
-        }
+# =============================================================================
+# LoRA 文件缓存 - 避免每次执行都从磁盘重新读取同一个 LoRA
+# =============================================================================
 
-    RETURN_TYPES = ("MODEL", "CLIP", "IMAGE", "STRING")
-    RETURN_NAMES = ("model", "clip", "lora_preview", "tags_output")
-    OUTPUT_IS_LIST = (False, False, True, False)  # IMAGE是列表输出（图片组）
-    FUNCTION = "apply_loras"
-    CATEGORY = "✨ Magic Assistant"
+def _tensor_dict_nbytes(tensors):
+    """统计字典中所有张量占用的字节数"""
+    total = 0
+    for t in tensors.values():
+        if isinstance(t, torch.Tensor):
+            total += t.numel() * t.element_size()
+    return total
 
-    # 检测模型是否为 INT8 量化模型
-    @staticmethod
-    def is_int8_model(model):
-        """检测模型是否使用 INT8 量化"""
-        try:
-            if not hasattr(model, 'model') or not hasattr(model.model, 'diffusion_model'):
-                return False
-            
-            # 检查是否有量化层
-            for name, module in model.model.diffusion_model.named_modules():
-                if hasattr(module, '_is_quantized') and module._is_quantized:
-                    return True
-                # 检查权重是否为 INT8
-                if hasattr(module, 'weight') and hasattr(module.weight, 'dtype'):
-                    if module.weight.dtype == torch.int8:
-                        return True
-            return False
-        except Exception:
-            return False
+class LoraStateDictCache:
+    """
+    进程级 LoRA state dict 缓存。
+    以 (路径, 文件大小, mtime) 为键，文件被覆盖或修改后自动失效；
+    超出内存预算时按 LRU 顺序淘汰。标准/静态/动态三种模式共享同一个实例。
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max(0, int(max_bytes))
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (state_dict, nbytes)
+        self._lock = threading.Lock()
 
-    # 🌟 核心修复：更强大的图片查找逻辑（优先查找magicloradate子目录）
     @staticmethod
-    def get_preview_path(lora_name):
-        try:
-            lora_path = folder_paths.get_full_path("loras", lora_name)
-            if lora_path is None: return None
-            
-            dirname = os.path.dirname(lora_path)
-            filename_no_ext = os.path.splitext(os.path.basename(lora_path))[0]
-            base_name = os.path.splitext(lora_path)[0]
-            
-            # 图片扩展名候选列表
-            candidates = [".png", ".jpg", ".jpeg", ".webp"]
-            candidates += [".preview.png", ".preview.jpg", ".cover.png", ".cover.jpg"]
-            
-            # 1. 优先检查 magicloradate 子目录（参考zml代码的zml子目录优先逻辑）
-            magicloradate_dir = os.path.join(dirname, "magicloradate")
-            if os.path.isdir(magicloradate_dir):
-                for ext in candidates:
-                    sub_path = os.path.join(magicloradate_dir, filename_no_ext + ext)
-                    if os.path.exists(sub_path):
-                        return sub_path
-            
-            # 2. 如果magicloradate子目录没有，检查同层级
-            for ext in candidates:
-                if os.path.exists(base_name + ext):
-                    return base_name + ext
-                
-            return None
-        except Exception:
-            return None
+    def fingerprint(lora_path):
+        st = os.stat(lora_path)
+        return (os.path.abspath(lora_path), st.st_size, st.st_mtime_ns)
 
-    def apply_loras(self, model, clip, lora_stack, int8_mode="none"):
-        """
-        应用 LoRA
-        int8_mode: "none" (默认), "stochastic" (静态), "dynamic" (动态)
-        """
-        out_model = model
-        out_clip = clip
-        active_tags = []
-        preview_images = []  # 改为列表，收集所有预览图
+    def load(self, lora_path):
+        """读取 LoRA 文件（命中缓存时不访问磁盘）。返回浅拷贝，调用方不要就地修改张量。"""
+        key = self.fingerprint(lora_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+            self.misses += 1
 
-        try:
-            if not isinstance(lora_stack, str) or not lora_stack.strip():
-                stack_data = []
-            else:
-                stack_data = json.loads(lora_stack)
-        except:
-            stack_data = []
+        lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
+        self.put(key, lora)
+        return dict(lora)
 
-        items_to_process = []
-        if isinstance(stack_data, dict):
-            if "folders" in stack_data:
-                for f in stack_data["folders"]:
-                    if f.get("loras"):
-                        items_to_process.extend([l for l in f["loras"] if l.get("enabled", True)])
-            if "loras" in stack_data:
-                items_to_process.extend([l for l in stack_data["loras"] if l.get("enabled", True)])
-        elif isinstance(stack_data, list):
-            items_to_process = [l for l in stack_data if l.get("enabled", True)]
+    def contains(self, lora_path):
+        key = self.fingerprint(lora_path)
+        with self._lock:
+            return key in self._entries
 
-        # 检测是否为 INT8 模型
-        is_int8 = self.is_int8_model(out_model)
-        
-        # 如果启用 INT8 模式但模型不是 INT8，给出警告
-        if int8_mode != "none" and not is_int8:
-            print(f"⚠️ [MagicPowerLora] INT8 模式已启用，但模型似乎不是 INT8 量化模型，将尝试使用 INT8 加载器")
-        
-        # 如果未启用 INT8 模式但模型是 INT8，给出提示
-        if int8_mode == "none" and is_int8:
-            print(f"💡 [MagicPowerLora] 检测到 INT8 模型，建议在设置中启用 INT8 模式以获得更好的兼容性")
+    def put(self, key, lora):
+        nbytes = _tensor_dict_nbytes(lora)
+        with self._lock:
+            # 单个文件就超过预算则不缓存
+            if nbytes > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            # 同一路径的旧版本（文件已被修改）直接丢弃
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self.current_bytes -= self._entries.pop(stale)[1]
+            self._entries[key] = (lora, nbytes)
+            self.current_bytes += nbytes
+            self._evict_locked()
 
-        print(f"🚀 [MagicPowerLora] Processing {len(items_to_process)} Loras... (Mode: {int8_mode})")
+    def _evict_locked(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
 
-        # 根据模式选择加载方式
-        if int8_mode == "stochastic" and INT8_AVAILABLE:
-            # 静态模式（Stochastic）- 整合的 INT8 LoRA 加载逻辑
-            for item in items_to_process:
-                lora_name = item.get("name")
-                weight = float(item.get("weight", 1.0))
-                if not lora_name: continue
+    def set_budget(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max(0, int(max_bytes))
+            self._evict_locked()
 
-                lora_path = folder_paths.get_full_path("loras", lora_name)
-                if lora_path is None:
-                    print(f"⚠️ [MagicPowerLora] Lora not found: {lora_name}")
-                    continue
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
 
-                try:
-                    # 加载 LoRA 文件
-                    lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
-                    
-                    # 克隆 model patcher
-                    model_patcher = out_model.clone()
-                    
-                    # 获取键映射
-                    key_map = {}
-                    if model_patcher.model.model_type.name != "ModelType.CLIP":
-                        key_map = comfy.lora.model_lora_keys_unet(model_patcher.model, key_map)
-                    
-                    # 使用 ComfyUI 的 load_lora 处理各种 LoRA 格式
-                    patch_dict = comfy.lora.load_lora(lora, key_map, log_missing=True)
-                    
-                    # 升级补丁以支持高精度 INT8 空间补丁
-                    final_patch_dict = {}
-                    applied_count = 0
-                    seed = 318008  # 默认 seed
-                    
-                    for key, adapter in patch_dict.items():
-                        # key 可以是 "layer.name.weight" 或 ("layer.name", (dim, start, size))
-                        layer_name = key[0] if isinstance(key, tuple) else key
-                        if layer_name.endswith(".weight"):
-                            layer_name = layer_name[:-7]
-                        
-                        # 解析模块以检查量化状态并获取 scale
-                        try:
-                            parts = layer_name.split(".")
-                            target_module = model_patcher.model.diffusion_model
-                            for part in parts[1:] if parts[0] == "diffusion_model" else parts:
-                                if part.isdigit():
-                                    target_module = target_module[int(part)]
-                                else:
-                                    target_module = getattr(target_module, part)
-                            
-                            # 如果模块已量化，升级适配器到我们的高精度版本
-                            if hasattr(target_module, '_is_quantized') and target_module._is_quantized:
-                                w_scale = target_module.weight_scale
-                                if isinstance(w_scale, torch.Tensor):
-                                    w_scale = w_scale.item() if w_scale.numel() == 1 else w_scale
-                                
-                                # 创建专门的 INT8 适配器
-                                if INT8LoRAPatchAdapter:
-                                    new_adapter = INT8LoRAPatchAdapter(
-                                        adapter.loaded_keys, 
-                                        adapter.weights, 
-                                        w_scale,
-                                        seed=seed
-                                    )
-                                    final_patch_dict[key] = new_adapter
-                                    applied_count += 1
-                                else:
-                                    final_patch_dict[key] = adapter
-                            else:
-                                final_patch_dict[key] = adapter
-                                
-                        except (AttributeError, KeyError, IndexError, TypeError):
-                            final_patch_dict[key] = adapter
-                    
-                    # 添加补丁到 patcher
-                    model_patcher.add_patches(final_patch_dict, weight)
-                    out_model = model_patcher
-                    
-                    print(f"   ✅ Applied (INT8 Stochastic): {lora_name} ({applied_count} quantized layers)")
-                except Exception as e:
-                    print(f"   ❌ Failed (INT8 Stochastic): {lora_name} -> {e}")
-                    # 回退到标准模式
-                    try:
-                        lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
-                        out_model, out_clip = comfy.sd.load_lora_for_models(out_model, out_clip, lora, weight, weight)
-                        print(f"   ✅ Applied (Fallback): {lora_name}")
-                    except Exception as e2:
-                        print(f"   ❌ Failed (Fallback): {lora_name} -> {e2}")
-
-                if "tags" in item and item["tags"]:
-                    active_tags.append(str(item["tags"]))
-
-                # 为每个lora尝试加载预览图
-                img_path = self.get_preview_path(lora_name)
-                if img_path:
-                    try:
-                        i = Image.open(img_path).convert("RGB")
-                        i = np.array(i).astype(np.float32) / 255.0
-                        preview_tensor = torch.from_numpy(i)[None,]
-                        preview_images.append(preview_tensor)
-                    except Exception as e:
-                        print(f"   ⚠️ Failed to load preview for {lora_name}: {e}")
+    def get_stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
 
-        elif int8_mode == "dynamic" and INT8_AVAILABLE:
-            # 动态模式（Dynamic）- 整合的 INT8 动态 LoRA 加载逻辑
-            for item in items_to_process:
-                lora_name = item.get("name")
-                weight = float(item.get("weight", 1.0))
-                if not lora_name: continue
+class LazySafetensorsDict(Mapping):
+    """
+    基于内存映射的只读 safetensors 字典：keys() 只读取文件头，
+    张量在第一次被访问时才真正加载。配合 comfy.lora.load_lora 使用时，
+    只有能与模型键映射匹配上的张量会被读取。
+    """
+    def __init__(self, lora_path):
+        self.lora_path = lora_path
+        self._handle = safe_open(lora_path, framework="pt", device="cpu")
+        self._keys = list(self._handle.keys())
+        self._key_set = set(self._keys)
+        self._loaded = {}
+        self.bytes_touched = 0
 
-                lora_path = folder_paths.get_full_path("loras", lora_name)
-                if lora_path is None:
-                    print(f"⚠️ [MagicPowerLora] Lora not found: {lora_name}")
-                    continue
+    def __getitem__(self, key):
+        tensor = self._loaded.get(key)
+        if tensor is None:
+            if key not in self._key_set:
+                raise KeyError(key)
+            tensor = self._handle.get_tensor(key)
+            self._loaded[key] = tensor
+            self.bytes_touched += tensor.numel() * tensor.element_size()
+        return tensor
 
-                try:
-                    # 加载 LoRA 文件
-                    lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
-                    
-                    # 克隆 model patcher
-                    model_patcher = out_model.clone()
-                    
-                    # 1. 获取补丁映射
-                    key_map = {}
-                    if model_patcher.model.model_type.name != "ModelType.CLIP":
-                        key_map = comfy.lora.model_lora_keys_unet(model_patcher.model, key_map)
-                    
-                    patch_dict = comfy.lora.load_lora(lora, key_map, log_missing=True)
-                    
-                    # 2. 注册全局 Hook（如果不存在）
-                    DynamicLoRAHook.register(model_patcher.model.diffusion_model)
-                    
-                    # 3. 添加到 transformer_options 中的动态 LoRA 列表
-                    # 这确保 ComfyUI 的克隆处理所有内容，并且是非粘性的
-                    if "transformer_options" not in model_patcher.model_options:
-                        model_patcher.model_options["transformer_options"] = {}
-                    
-                    opts = model_patcher.model_options["transformer_options"]
-                    if "dynamic_loras" not in opts:
-                        opts["dynamic_loras"] = []
-                    else:
-                        # 浅拷贝列表以避免修改父 patcher 的列表
-                        opts["dynamic_loras"] = opts["dynamic_loras"].copy()
+    def __contains__(self, key):
+        return key in self._key_set
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def close(self):
+        self._handle = None
+
+def _patch_dict_nbytes(patch_dict):
+    """
+    统计补丁字典引用的张量字节数。补丁值可能是适配器对象（.weights）或嵌套元组，
+    同一块存储只计一次；与 LORA_CACHE 共享的张量也计入，宁可高估也不低估。
+    """
+    tensors = []
+    stack = list(patch_dict.values())
+    while stack:
+        item = stack.pop()
+        if isinstance(item, torch.Tensor):
+            tensors.append(item)
+        elif isinstance(item, (tuple, list)):
+            stack.extend(item)
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif hasattr(item, "weights"):
+            stack.append(item.weights)
+    return _unique_storage_nbytes(tensors)
+
+class LoraPatchCache:
+    """
+    缓存 INT8 模式下的 UNet 键映射与 comfy.lora.load_lora 的补丁字典。
+    - 键映射按底层模型对象（弱引用）缓存，克隆出的 ModelPatcher 共享同一个模型，因此可复用；
+    - 补丁字典按 (LoRA 文件指纹, 键映射 id) 缓存，条目数与总字节数都有上限，LRU 淘汰。
+    """
+    def __init__(self, max_entries, lazy_safetensors=True, max_bytes=2048 * 1024 * 1024):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.current_bytes = 0
+        self.evictions = 0
+        self.lazy_safetensors = bool(lazy_safetensors) and SAFETENSORS_AVAILABLE
+        self.hits = 0
+        self.misses = 0
+        self.load_reports = {}  # lora_path -> {"bytes_touched", "file_bytes"}（按需加载时记录）
+        self._key_maps = weakref.WeakKeyDictionary()  # model -> (key_map_id, key_map)
+        self._patch_dicts = OrderedDict()  # (fingerprint, key_map_id) -> (patch_dict, nbytes)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get_key_map(self, model_patcher):
+        """返回 (key_map_id, key_map)，同一个模型只计算一次"""
+        model = model_patcher.model
+        with self._lock:
+            cached = self._key_maps.get(model)
+            if cached is not None:
+                return cached
+
+        key_map = {}
+        if model.model_type.name != "ModelType.CLIP":
+            key_map = comfy.lora.model_lora_keys_unet(model, key_map)
+
+        with self._lock:
+            cached = self._key_maps.get(model)
+            if cached is None:
+                cached = (next(self._ids), key_map)
+                self._key_maps[model] = cached
+            return cached
+
+    def get_patch_dict(self, lora_path, model_patcher):
+        """返回 LoRA 在该模型上的补丁字典（只读，请勿修改）"""
+        key_map_id, key_map = self.get_key_map(model_patcher)
+        key = (LoraStateDictCache.fingerprint(lora_path), key_map_id)
+        with self._lock:
+            entry = self._patch_dicts.get(key)
+            if entry is not None:
+                self._patch_dicts.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        lazy = (self.lazy_safetensors and lora_path.lower().endswith(".safetensors")
+                and not LORA_CACHE.contains(lora_path))
+        if lazy:
+            # 只读取能与键映射匹配的张量，其余（如文本编码器键）不会被加载
+            lora = LazySafetensorsDict(lora_path)
+            try:
+                patch_dict = comfy.lora.load_lora(lora, key_map, log_missing=True)
+            finally:
+                lora.close()
+            report = {"bytes_touched": lora.bytes_touched, "file_bytes": key[0][1]}
+            with self._lock:
+                self.load_reports[lora_path] = report
+            print(f"   📦 Lazy load: {os.path.basename(lora_path)} "
+                  f"({report['bytes_touched'] / 1024 / 1024:.1f}MB / {report['file_bytes'] / 1024 / 1024:.1f}MB touched)")
+        else:
+            lora = LORA_CACHE.load(lora_path)
+            patch_dict = comfy.lora.load_lora(lora, key_map, log_missing=True)
+
+        nbytes = _patch_dict_nbytes(patch_dict)
+        with self._lock:
+            # 单个补丁字典就超过预算则不缓存
+            if self.max_entries > 0 and nbytes <= self.max_bytes:
+                old = self._patch_dicts.pop(key, None)
+                if old is not None:
+                    self.current_bytes -= old[1]
+                self._patch_dicts[key] = (patch_dict, nbytes)
+                self.current_bytes += nbytes
+                self._evict_locked()
+        return patch_dict
+
+    def _evict_locked(self):
+        while self._patch_dicts and (len(self._patch_dicts) > self.max_entries
+                                     or self.current_bytes > self.max_bytes):
+            _, (_, nbytes) = self._patch_dicts.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    def set_budget(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max(0, int(max_bytes))
+            self._evict_locked()
+
+    def clear(self):
+        with self._lock:
+            self._key_maps.clear()
+            self._patch_dicts.clear()
+            self.current_bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "key_maps": len(self._key_maps),
+                "patch_dicts": len(self._patch_dicts),
+                "max_entries": self.max_entries,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "lazy_safetensors": self.lazy_safetensors,
+                "load_reports": dict(self.load_reports),
+            }
+
+class LoraPrefixCache:
+    """
+    LoRA 堆栈前缀缓存：保存 (model, clip) 在应用了前 N 个 LoRA 之后的中间状态。
+    只修改第 N 个 LoRA 时，前 N-1 个的结果直接复用，只需重新应用尾部。
+    条目数有上限（LRU）。只弱引用原始输入模型，输入被释放时立即丢掉该条目持有的输出克隆，
+    避免切换检查点后旧模型仍被缓存拖住。
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max(0, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        # (id(model), id(clip), int8_mode, prefix) -> [weakref(model), weakref(clip), out_model, out_clip]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _alive(entry, model, clip):
+        return entry[0]() is model and entry[1]() is clip
+
+    def _purge_dead_locked(self):
+        for key in [k for k, v in self._entries.items() if v[0]() is None or v[1]() is None]:
+            del self._entries[key]
+
+    def lookup(self, model, clip, int8_mode, stack_keys):
+        """返回 (已复用的 LoRA 数量, out_model, out_clip)，未命中时数量为 0"""
+        with self._lock:
+            self._purge_dead_locked()
+            for n in range(len(stack_keys), 0, -1):
+                key = (id(model), id(clip), int8_mode, tuple(stack_keys[:n]))
+                entry = self._entries.get(key)
+                if entry is not None and self._alive(entry, model, clip):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return n, entry[2], entry[3]
+            if stack_keys:
+                self.misses += 1
+        return 0, model, clip
+
+    def store(self, model, clip, int8_mode, stack_prefix, out_model, out_clip):
+        if self.max_entries <= 0 or not stack_prefix:
+            return
+        key = (id(model), id(clip), int8_mode, tuple(stack_prefix))
+        entry = [None, None, out_model, out_clip]
+
+        def release(_ref, entry=entry):
+            # 只清空列表元素、不改动字典，GC 回调随时触发也不会打断遍历；失效的键在下次查询时清除
+            entry[2] = entry[3] = None
+
+        try:
+            entry[0] = weakref.ref(model, release)
+            entry[1] = weakref.ref(clip, release)
+        except TypeError:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, lora_name=None):
+        """清除缓存；指定 lora_name 时只清除包含该 LoRA 的前缀。返回清除的条目数"""
+        with self._lock:
+            if lora_name is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            stale = [k for k in self._entries if any(part[0] == lora_name for part in k[3])]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+class LoraPrefetcher:
+    """
+    LoRA 文件预取器：在第 i 个 LoRA 打补丁时，用线程池提前加载第 i+1..i+k 个，
+    让磁盘 I/O / 补丁字典构建与补丁过程重叠。在途（已提交未消费）字节数有上限。
+    预取结果由 wait() 直接交给应用函数，缓存预算为 0 或单项超出预算（缓存留不住）时也不会重复加载。
+    """
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, jobs, load_fn, lookahead=2, max_inflight_bytes=2 * 1024 ** 3, max_workers=2):
+        self.jobs = jobs  # [(lora_path, nbytes)]
+        self.load_fn = load_fn
+        self.lookahead = max(0, int(lookahead))
+        self.max_inflight_bytes = max(0, int(max_inflight_bytes))
+        self.max_workers = max(0, int(max_workers))
+        self._futures = {}  # idx -> (future, nbytes)
+        self._next = 0
+        self._inflight = 0
+
+    @classmethod
+    def _get_executor(cls, max_workers):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="MagicLoraPrefetch")
+            return cls._executor
+
+    def _fill(self, start):
+        if self.max_workers <= 0 or self.lookahead <= 0:
+            return
+        self._next = max(self._next, start)
+        while self._next < len(self.jobs) and self._next < start + self.lookahead:
+            lora_path, nbytes = self.jobs[self._next]
+            # 已有在途任务时，超出字节上限就暂停预取
+            if self._futures and self._inflight + nbytes > self.max_inflight_bytes:
+                break
+            future = self._get_executor(self.max_workers).submit(self.load_fn, lora_path)
+            self._futures[self._next] = (future, nbytes)
+            self._inflight += nbytes
+            self._next += 1
+
+    def wait(self, idx):
+        """等待第 idx 项预取完成（若已提交），然后开始预取后续项；返回预取结果，未预取或失败时返回 None"""
+        result = None
+        pending = self._futures.pop(idx, None)
+        if pending is not None:
+            future, nbytes = pending
+            try:
+                result = future.result()
+            except Exception:
+                pass  # 错误由随后的正式加载重新抛出并报告
+            self._inflight -= nbytes
+        self._fill(idx + 1)
+        return result
+
+    def close(self):
+        for future, _ in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._inflight = 0
+
+class QuantizedLayerInfo:
+    """量化索引中的单层信息：模块、是否量化、weight_scale（读取时取模块上的当前值）"""
+    __slots__ = ("module", "quantized")
+
+    def __init__(self, module, quantized):
+        self.module = module
+        self.quantized = quantized
+
+    @property
+    def weight_scale(self):
+        return getattr(self.module, "weight_scale", None)
+
+class QuantizationIndex:
+    """
+    每个 diffusion_model 只扫描一次的量化索引（弱引用键控），记录 层名 -> QuantizedLayerInfo，
+    以及模型是否含有 INT8 层。is_int8_model 和静态模式的目标模块解析都通过它完成。
+    """
+    _indexes = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+    WEIGHT_SAMPLES = 4096
+
+    def __init__(self, diffusion_model):
+        self.layers = {}
+        self.has_int8 = False
+        self._model_hash = None
+        for name, module in diffusion_model.named_modules():
+            quantized = bool(getattr(module, "_is_quantized", False))
+            weight = getattr(module, "weight", None)
+            if quantized or getattr(weight, "dtype", None) == torch.int8:
+                self.has_int8 = True
+            if weight is not None:
+                self.layers[name] = QuantizedLayerInfo(module, quantized)
+
+    @classmethod
+    def get(cls, diffusion_model):
+        with cls._lock:
+            index = cls._indexes.get(diffusion_model)
+        if index is None:
+            index = cls(diffusion_model)
+            with cls._lock:
+                cls._indexes[diffusion_model] = index
+        return index
+
+    def model_hash(self):
+        """
+        基础模型指纹：量化层的名称、形状、dtype、weight_scale 内容，以及每层权重均匀抽取的
+        WEIGHT_SAMPLES 个元素的 SHA-256。同架构、scale 相近的不同微调模型权重几乎处处不同，
+        抽样足以区分，又不必哈希数 GB 的完整权重。
+        """
+        if self._model_hash is None:
+            sha256 = hashlib.sha256()
+            for name in sorted(self.layers):
+                info = self.layers[name]
+                if not info.quantized:
+                    continue
+                weight = info.module.weight
+                sha256.update(f"{name}|{tuple(weight.shape)}|{weight.dtype}".encode("utf-8"))
+                w_scale = info.weight_scale
+                if isinstance(w_scale, torch.Tensor):
+                    sha256.update(w_scale.detach().to("cpu", torch.float32).contiguous().numpy().tobytes())
+                elif w_scale is not None:
+                    sha256.update(repr(float(w_scale)).encode("utf-8"))
+                flat = weight.detach().reshape(-1)
+                step = max(1, flat.numel() // self.WEIGHT_SAMPLES)
+                sample = flat[::step][:self.WEIGHT_SAMPLES].to("cpu")
+                if sample.dtype not in (torch.int8, torch.uint8):
+                    sample = sample.to(torch.float32)
+                sha256.update(sample.contiguous().numpy().tobytes())
+            self._model_hash = sha256.hexdigest()
+        return self._model_hash
+
+    def lookup(self, layer_name):
+        """按补丁层名（可带 diffusion_model. 前缀）查找，找不到返回 None"""
+        if layer_name.startswith("diffusion_model."):
+            layer_name = layer_name[len("diffusion_model."):]
+        return self.layers.get(layer_name)
+
+def bake_tensor_name(patch_key):
+    """补丁键 -> 烘焙文件中的张量名；带 offset 的键（如拆分的 qkv）附加 offset 信息"""
+    if isinstance(patch_key, tuple):
+        key, offset = patch_key[0], patch_key[1] if len(patch_key) > 1 else None
+        if offset is not None:
+            return f"{key}@{','.join(str(o) for o in offset)}"
+        return key
+    return patch_key
+
+class BakedINT8Store:
+    """
+    一个 (基础模型, LoRA 堆栈, seed) 组合对应的 INT8 烘焙结果。
+    - 命中：从 safetensors 文件按需（内存映射）读取各层结果，文件中没有的层照常计算；
+    - 未命中：记录每层最后一个 INT8 适配器的输出，全部层算完后写入磁盘。
+      记录的字节数超过缓存上限时放弃记录；lowvram 等情况下部分层不会被补丁，
+      某层第二次被计算或开始新的烘焙时，已记录的部分层直接写入。
+    """
+    def __init__(self, cache, path, handle=None):
+        self.cache = cache
+        self.path = path
+        self._handle = handle
+        self.baked_names = set(handle.keys()) if handle is not None else set()
+        self.adapters = {}  # 张量名 -> [(INT8 适配器, strength)]（按应用顺序）
+        self._recorded = {}
+        self._recorded_bytes = 0
+        self._flushed = False
+        self._lock = threading.Lock()
+
+    @property
+    def hit(self):
+        return self._handle is not None
+
+    def track(self, name, adapter, strength):
+        self.adapters.setdefault(name, []).append((adapter, strength))
+
+    def load(self, name):
+        if self._handle is None or name not in self.baked_names:
+            return None
+        try:
+            with self._lock:
+                return self._handle.get_tensor(name)
+        except Exception as e:
+            print(f"⚠️ [MagicPowerLora] Failed to read baked INT8 layer {name}: {e}")
+            return None
+
+    def record(self, name, adapter, result):
+        """只记录该层最后一个适配器的输出（即所有 LoRA 叠加后的结果）"""
+        chain = self.adapters.get(name)
+        if not chain or chain[-1][0] is not adapter:
+            return
+        nbytes = result.numel() * result.element_size()
+        with self._lock:
+            if self._flushed:
+                return
+            if name in self._recorded:
+                # 同一层再次被计算：上一轮补丁没有覆盖所有层，按已记录的部分写入
+                tensors = self._take_locked()
+            elif self._recorded_bytes + nbytes > self.cache.max_bytes:
+                # 超过缓存上限的结果写了也会被丢弃，不再继续往内存里拷贝
+                self._flushed = True
+                self._recorded = {}
+                self._recorded_bytes = 0
+                print(f"⚠️ [MagicPowerLora] INT8 bake exceeds cache limit, recording abandoned: {os.path.basename(self.path)}")
+                return
+            else:
+                self._recorded[name] = result.detach().to("cpu", copy=True).contiguous()
+                self._recorded_bytes += nbytes
+                if len(self._recorded) < len(self.adapters):
+                    return
+                tensors = self._take_locked()
+        self._spawn_write(tensors)
+
+    def flush(self):
+        """把尚未完成的记录（部分层）写入磁盘；已写入或已放弃时不做任何事"""
+        with self._lock:
+            if self._flushed or not self._recorded:
+                return
+            tensors = self._take_locked()
+        self._spawn_write(tensors)
+
+    def _take_locked(self):
+        self._flushed = True
+        tensors = self._recorded
+        self._recorded = {}
+        self._recorded_bytes = 0
+        if len(tensors) < len(self.adapters):
+            print(f"💾 [MagicPowerLora] INT8 bake covers {len(tensors)}/{len(self.adapters)} layers, saving partial result")
+        return tensors
+
+    def _spawn_write(self, tensors):
+        threading.Thread(target=self.cache.write, args=(self.path, tensors), daemon=True).start()
+
+class BakedINT8Cache:
+    """
+    静态模式 INT8 合并结果的磁盘缓存（userdata/int8_bake_cache，可选功能）。
+    键为 (基础模型指纹, 有序 LoRA 指纹+权重, seed)，总大小超过上限时按最近使用时间淘汰。
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max(0, int(max_bytes))
+        self.cache_dir = os.path.join(MagicUtils.USER_DIR, "int8_bake_cache")
+        self.hits = 0
+        self.misses = 0
+        self._recording = None  # 最近一个正在记录的 BakedINT8Store（弱引用）
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 and SAFETENSORS_AVAILABLE and INT8_AVAILABLE
+
+    def open(self, model_hash, stack_keys, seed):
+        # 上一次烘焙如果还没覆盖全部层（例如 lowvram 只补丁了一部分），先把已记录的部分写入
+        previous = self._recording() if self._recording is not None else None
+        if previous is not None:
+            previous.flush()
+            self._recording = None
+
+        payload = json.dumps([model_hash, stack_keys, seed], ensure_ascii=False)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+        path = os.path.join(self.cache_dir, f"{digest}.safetensors")
+        if os.path.isfile(path):
+            try:
+                handle = safe_open(path, framework="pt", device="cpu")
+                os.utime(path)  # 更新最近使用时间，供 LRU 淘汰参考
+                self.hits += 1
+                return BakedINT8Store(self, path, handle)
+            except Exception as e:
+                print(f"⚠️ [MagicPowerLora] Ignoring unreadable INT8 bake cache {os.path.basename(path)}: {e}")
+        self.misses += 1
+        store = BakedINT8Store(self, path)
+        self._recording = weakref.ref(store)
+        return store
+
+    def write(self, path, tensors):
+        try:
+            nbytes = _tensor_dict_nbytes(tensors)
+            if nbytes > self.max_bytes:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp"
+            comfy.utils.save_torch_file(tensors, tmp_path)
+            os.replace(tmp_path, path)
+            print(f"💾 [MagicPowerLora] Saved INT8 bake cache: {os.path.basename(path)} ({nbytes / 1024 / 1024:.1f}MB)")
+            self.evict()
+        except Exception as e:
+            print(f"⚠️ [MagicPowerLora] Failed to save INT8 bake cache: {e}")
+
+    def evict(self):
+        with self._lock:
+            try:
+                files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith(".safetensors")]
+            except OSError:
+                return
+            entries = []
+            for f in files:
+                try:
+                    st = os.stat(f)
+                    entries.append((st.st_mtime, st.st_size, f))
+                except OSError:
+                    pass
+            total = sum(e[1] for e in entries)
+            for _, size, f in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(f)
+                    total -= size
+                except OSError:
+                    pass  # Windows 上仍被映射的文件无法删除，下次再试
+
+    def get_stats(self):
+        return {"enabled": self.enabled, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+_LORA_PERF = MagicUtils.get_lora_perf_config()
+LORA_CACHE = LoraStateDictCache(float(_LORA_PERF.get("state_dict_cache_mb", 4096)) * 1024 * 1024)
+LORA_PATCH_CACHE = LoraPatchCache(_LORA_PERF.get("patch_dict_cache_entries", 32), _LORA_PERF.get("lazy_safetensors", True),
+                                  float(_LORA_PERF.get("patch_dict_cache_mb", 2048)) * 1024 * 1024)
+LORA_PREFIX_CACHE = LoraPrefixCache(_LORA_PERF.get("prefix_cache_entries", 16))
+INT8_BAKE_CACHE = BakedINT8Cache(float(_LORA_PERF.get("int8_bake_cache_mb", 0)) * 1024 * 1024)
+
+# =============================================================================
+# LoRA 堆栈融合 - 将多个 LoRA 合并为一个低秩补丁（SVD 降秩）
+# =============================================================================
+
+def parse_fuse_spec(fuse_stack):
+    """解析融合设置："none" / "rank:64" / "energy:0.99"，返回 (mode, value) 或 None"""
+    if not isinstance(fuse_stack, str) or ":" not in fuse_stack:
+        return None
+    mode, _, value = fuse_stack.partition(":")
+    mode = mode.strip().lower()
+    try:
+        if mode == "rank":
+            rank = int(value)
+            return ("rank", rank) if rank > 0 else None
+        if mode == "energy":
+            energy = float(value)
+            return ("energy", energy) if 0.0 < energy <= 1.0 else None
+    except ValueError:
+        pass
+    return None
+
+def _plain_lora_factors(adapter):
+    """取出普通 LoRA 补丁的 (up, down, alpha)；LoCon mid / DoRA / LoHa 等无法融合的类型返回 None"""
+    if _LORA_ADAPTER_AVAILABLE and isinstance(adapter, LoRAAdapter):
+        v = adapter.weights
+    elif isinstance(adapter, tuple) and len(adapter) == 2 and adapter[0] == "lora":
+        v = adapter[1]
+    else:
+        return None
+    if len(v) > 3 and v[3] is not None:
+        return None
+    if len(v) > 4 and v[4] is not None:
+        return None
+    if len(v) > 5 and v[5] is not None:
+        return None
+    return v[0], v[1], v[2]
+
+def fuse_low_rank(factors, spec, device=None):
+    """
+    将同一层的多个加权低秩增量 sum(s_i * up_i @ down_i) 合并为一个低秩分解。
+    先对拼接后的 B/A 做 QR，只在 R x R 的核心矩阵上做 SVD，不会构造完整的增量矩阵。
+    factors: [(up, down, alpha, strength)]；返回 (new_up, new_down)，增量为零时返回 None。
+    """
+    device = device or (torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu"))
+    up0, down0 = factors[0][0], factors[0][1]
+    all_B = []
+    all_A = []
+    for up, down, alpha, strength in factors:
+        if up.shape[2:] != up0.shape[2:] or down.shape[1:] != down0.shape[1:] or up.shape[0] != up0.shape[0]:
+            raise ValueError("LoRA 形状不一致，无法融合")
+        rank = down.shape[0]
+        scale = (float(alpha) / rank) * strength if alpha is not None else strength
+        all_B.append(up.flatten(1).to(device, torch.float32) * scale)
+        all_A.append(down.flatten(1).to(device, torch.float32))
+
+    B = torch.cat(all_B, dim=1)  # out x R
+    A = torch.cat(all_A, dim=0)  # R x in
+    Qb, Rb = torch.linalg.qr(B)
+    Qa, Ra = torch.linalg.qr(A.T)
+    U, S, Vh = torch.linalg.svd(Rb @ Ra.T, full_matrices=False)
+
+    energy = S.pow(2)
+    total = float(energy.sum())
+    if total <= 0.0:
+        return None
+    mode, value = spec
+    if mode == "rank":
+        k = min(value, S.shape[0])
+    else:
+        cumulative = torch.cumsum(energy, dim=0) / total
+        k = int(torch.searchsorted(cumulative, torch.tensor([value], device=cumulative.device)).item()) + 1
+        k = min(k, S.shape[0])
+
+    new_up = (Qb @ U[:, :k]) * S[:k]
+    new_down = Vh[:k] @ Qa.T
+    new_up = new_up.reshape(up0.shape[0], k, *up0.shape[2:])
+    new_down = new_down.reshape(k, *down0.shape[1:])
+    return new_up, new_down
+
+def fuse_lora_stack(model, clip, to_apply, spec):
+    """
+    将 to_apply 中的 LoRA 融合为单个 safetensors 文件并返回路径（已存在时直接复用）。
+    任一 LoRA 含有无法融合的补丁类型时返回 None，调用方按原方式逐个应用。
+    """
+    fuse_dir = os.path.join(MagicUtils.USER_DIR, "fused_loras")
+    _, unet_key_map = LORA_PATCH_CACHE.get_key_map(model)
+    key_map = dict(unet_key_map)
+    if clip is not None:
+        key_map = comfy.lora.model_lora_keys_clip(clip.cond_stage_model, key_map)
+
+    # 融合结果只取决于 LoRA 本身和基础模型的键映射（哪些 LoRA 键落在哪些层上），
+    # 因此用架构名 + 完整键映射（含 CLIP）标识基础模型，同类不同结构的模型不会误用彼此的文件
+    arch = type(getattr(model, "model", model)).__name__
+    base_id = hashlib.sha256(json.dumps(sorted((k, str(v)) for k, v in key_map.items()),
+                                        ensure_ascii=False).encode("utf-8")).hexdigest()
+    payload = json.dumps([arch, base_id, list(spec), [entry[3] for entry in to_apply]], ensure_ascii=False)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    fused_path = os.path.join(fuse_dir, f"{digest}.safetensors")
+    if os.path.isfile(fused_path):
+        try:
+            os.utime(fused_path)  # 刷新 mtime，作为 LRU 淘汰的最近使用时间
+        except OSError:
+            pass
+        print(f"   🔗 Reusing fused LoRA: {os.path.basename(fused_path)}")
+        return fused_path
+    # 补丁键 -> LoRA 格式的键名（保存融合结果时使用，重新加载时能被同一键映射解析）
+    reverse_key_map = {}
+    for lora_key, patch_key in key_map.items():
+        reverse_key_map.setdefault(patch_key, lora_key)
+
+    layer_factors = {}
+    for lora_name, lora_path, weight, _ in to_apply:
+        lora = LORA_CACHE.load(lora_path)
+        if _LORA_CONVERT_AVAILABLE:
+            lora = comfy.lora_convert.convert_lora(lora)
+        patch_dict = comfy.lora.load_lora(lora, key_map, log_missing=False)
+        for patch_key, adapter in patch_dict.items():
+            factors = _plain_lora_factors(adapter)
+            if factors is None or patch_key not in reverse_key_map:
+                print(f"   ⚠️ [MagicPowerLora] {lora_name} 含有无法融合的补丁类型，跳过融合")
+                return None
+            layer_factors.setdefault(patch_key, []).append((*factors, weight))
+
+    fused_sd = {}
+    for patch_key, factors in layer_factors.items():
+        fused = fuse_low_rank(factors, spec)
+        if fused is None:
+            continue
+        new_up, new_down = fused
+        save_dtype = factors[0][0].dtype if factors[0][0].is_floating_point() else torch.float16
+        lora_key = reverse_key_map[patch_key]
+        fused_sd[f"{lora_key}.lora_up.weight"] = new_up.to("cpu", save_dtype).contiguous()
+        fused_sd[f"{lora_key}.lora_down.weight"] = new_down.to("cpu", save_dtype).contiguous()
+
+    os.makedirs(fuse_dir, exist_ok=True)
+    tmp_path = fused_path + ".tmp"
+    comfy.utils.save_torch_file(fused_sd, tmp_path, metadata={
+        "magic_fused_from": json.dumps([entry[0] for entry in to_apply], ensure_ascii=False),
+        "magic_fuse_spec": f"{spec[0]}:{spec[1]}",
+    })
+    os.replace(tmp_path, fused_path)
+    print(f"   🔗 Fused {len(to_apply)} Loras -> {os.path.basename(fused_path)} ({len(layer_factors)} layers)")
+    prune_fused_loras(fuse_dir, float(_LORA_PERF.get("fused_cache_mb", 4096)) * 1024 * 1024, keep=fused_path)
+    return fused_path
+
+def prune_fused_loras(fuse_dir, max_bytes, keep=None):
+    """按 mtime（最近使用时间）LRU 淘汰融合文件，直到总大小不超过 max_bytes。返回删除的文件数"""
+    entries = []
+    total = 0
+    try:
+        with os.scandir(fuse_dir) as it:
+            for entry in it:
+                # 其他线程正在写入的 .tmp 文件不计入也不删除
+                if not entry.is_file() or not entry.name.endswith(".safetensors"):
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, entry.path, st.st_size))
+                total += st.st_size
+    except OSError:
+        return 0
+
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        print(f"   🧹 Pruned {removed} fused LoRA file(s) from cache")
+    return removed
+
+class MagicPowerLoraLoader:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "model": ("MODEL",),
+                "clip": ("CLIP",),
+                "lora_stack": ("STRING", {"default": "[]", "multiline": False}),
+            },
+            "hidden": {
+                "int8_mode": ("STRING", {"default": "none"}),
+                "fuse_stack": ("STRING", {"default": "none"}),
+            }
+        }
+
+    RETURN_TYPES = ("MODEL", "CLIP", "IMAGE", "STRING")
+    RETURN_NAMES = ("model", "clip", "lora_preview", "tags_output")
+    OUTPUT_IS_LIST = (False, False, True, False)  # IMAGE是列表输出（图片组）
+    FUNCTION = "apply_loras"
+    CATEGORY = "✨ Magic Assistant"
+
+    # 检测模型是否为 INT8 量化模型
+    @staticmethod
+    def is_int8_model(model):
+        """检测模型是否使用 INT8 量化（结果按模型缓存）"""
+        try:
+            if not hasattr(model, 'model') or not hasattr(model.model, 'diffusion_model'):
+                return False
+            
+            # 检查是否有量化层或 INT8 权重
+            return QuantizationIndex.get(model.model.diffusion_model).has_int8
+        except Exception:
+            return False
+
+    # 🌟 核心修复：更强大的图片查找逻辑（优先查找magicloradate子目录）
+    @staticmethod
+    def get_preview_path(lora_name):
+        """magicloradate 子目录优先，其次同层级；目录列表由 LORA_PREVIEW_INDEX 按 mtime 缓存"""
+        try:
+            return LORA_PREVIEW_INDEX.resolve_preview(lora_name)
+        except Exception:
+            return None
+
+    @staticmethod
+    def parse_lora_stack(lora_stack):
+        """解析 lora_stack JSON，返回已启用的 LoRA 条目列表（按处理顺序）"""
+        try:
+            if not isinstance(lora_stack, str) or not lora_stack.strip():
+                stack_data = []
+            else:
+                stack_data = json.loads(lora_stack)
+        except:
+            stack_data = []
+
+        items_to_process = []
+        if isinstance(stack_data, dict):
+            if "folders" in stack_data:
+                for f in stack_data["folders"]:
+                    if f.get("loras"):
+                        items_to_process.extend([l for l in f["loras"] if l.get("enabled", True)])
+            if "loras" in stack_data:
+                items_to_process.extend([l for l in stack_data["loras"] if l.get("enabled", True)])
+        elif isinstance(stack_data, list):
+            items_to_process = [l for l in stack_data if l.get("enabled", True)]
+        return items_to_process
+
+    @staticmethod
+    def effective_stack(items_to_process):
+        """提取真正影响模型的 (名称, 权重, 文件大小/mtime) 列表，文件不存在时 stat 为 None"""
+        effective = []
+        for item in items_to_process:
+            lora_name = item.get("name")
+            if not lora_name: continue
+            try:
+                weight = round(float(item.get("weight", 1.0)), 6)
+            except (TypeError, ValueError):
+                weight = item.get("weight")
+            lora_path = folder_paths.get_full_path("loras", lora_name)
+            stat = None
+            if lora_path is not None:
+                try:
+                    st = os.stat(lora_path)
+                    stat = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    pass
+            effective.append((lora_name, weight, stat))
+        return effective
+
+    @classmethod
+    def stack_fingerprint(cls, items_to_process, int8_mode="none", fuse_stack="none"):
+        """
+        生成 LoRA 堆栈的规范指纹：只包含真正影响模型的 (名称, 权重, 文件 mtime/大小) 与 int8_mode，
+        文件夹、标签、禁用条目等纯 UI 数据不参与计算。
+        """
+        payload = json.dumps([int8_mode, fuse_stack, cls.effective_stack(items_to_process)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def IS_CHANGED(s, lora_stack="[]", int8_mode="none", fuse_stack="none", **kwargs):
+        # 文件被替换（mtime 变化）时也会触发重新执行
+        return s.stack_fingerprint(s.parse_lora_stack(lora_stack), int8_mode, fuse_stack)
+
+    @staticmethod
+    def _apply_lora_stochastic(out_model, out_clip, lora_name, lora_path, weight, bake=None, preloaded=None):
+        """
+        静态模式（Stochastic）- 整合的 INT8 LoRA 加载逻辑
+        bake: 可选的 BakedINT8Store；命中时量化层直接使用磁盘上的烘焙结果，未命中时记录计算结果
+        preloaded: 预取器已构建好的补丁字典（为 None 时从 LORA_PATCH_CACHE 获取）
+        """
+        try:
+            # 克隆 model patcher
+            model_patcher = out_model.clone()
+            
+            # 使用 ComfyUI 的 load_lora 处理各种 LoRA 格式（键映射与补丁字典均已缓存）
+            patch_dict = preloaded if preloaded is not None else LORA_PATCH_CACHE.get_patch_dict(lora_path, model_patcher)
+            
+            # 升级补丁以支持高精度 INT8 空间补丁
+            final_patch_dict = {}
+            applied_count = 0
+            seed = INT8_STOCHASTIC_SEED
+            quant_index = QuantizationIndex.get(model_patcher.model.diffusion_model)
+            
+            for key, adapter in patch_dict.items():
+                # key 可以是 "layer.name.weight" 或 ("layer.name", (dim, start, size))
+                layer_name = key[0] if isinstance(key, tuple) else key
+                if layer_name.endswith(".weight"):
+                    layer_name = layer_name[:-7]
+                
+                # 通过量化索引检查量化状态并获取 scale
+                layer_info = quant_index.lookup(layer_name)
+                
+                # 如果模块已量化，升级适配器到我们的高精度版本
+                w_scale = layer_info.weight_scale if layer_info is not None and layer_info.quantized else None
+                if w_scale is not None and INT8LoRAPatchAdapter:
+                    # 标量、逐通道、逐组 scale 都交给适配器按权重形状广播处理
+                    if isinstance(w_scale, torch.Tensor) and w_scale.numel() == 1:
+                        w_scale = w_scale.item()
                     
-                    opts["dynamic_loras"].append({
-                        "name": lora_name,
-                        "strength": weight,
-                        "patches": patch_dict
-                    })
+                    # 创建专门的 INT8 适配器
+                    bake_name = bake_tensor_name(key) if bake is not None else None
+                    new_adapter = INT8LoRAPatchAdapter(
+                        adapter.loaded_keys, 
+                        adapter.weights, 
+                        w_scale,
+                        seed=seed,
+                        recorder=bake if bake is not None and not bake.hit else None,
+                        bake_name=bake_name
+                    )
+                    applied_count += 1
+                    if bake is None:
+                        final_patch_dict[key] = new_adapter
+                        continue
                     
-                    out_model = model_patcher
-                    print(f"   ✅ Applied (INT8 Dynamic): {lora_name}")
+                    first_for_layer = bake_name not in bake.adapters
+                    bake.track(bake_name, new_adapter, weight)
+                    if bake.hit and bake_name in bake.baked_names:
+                        # 该层所有 LoRA 的合并结果已在磁盘上，只需添加一次烘焙适配器
+                        if first_for_layer:
+                            final_patch_dict[key] = BakedINT8Adapter(adapter.loaded_keys, adapter.weights, bake, bake_name)
+                    else:
+                        final_patch_dict[key] = new_adapter
+                else:
+                    final_patch_dict[key] = adapter
+            
+            # 添加补丁到 patcher
+            model_patcher.add_patches(final_patch_dict, weight)
+            out_model = model_patcher
+            
+            print(f"   ✅ Applied (INT8 Stochastic): {lora_name} ({applied_count} quantized layers)")
+        except Exception as e:
+            print(f"   ❌ Failed (INT8 Stochastic): {lora_name} -> {e}")
+            # 回退到标准模式
+            try:
+                lora = LORA_CACHE.load(lora_path)
+                out_model, out_clip = comfy.sd.load_lora_for_models(out_model, out_clip, lora, weight, weight)
+                print(f"   ✅ Applied (Fallback): {lora_name}")
+            except Exception as e2:
+                print(f"   ❌ Failed (Fallback): {lora_name} -> {e2}")
+        return out_model, out_clip
+
+    @staticmethod
+    def _apply_lora_dynamic(out_model, out_clip, lora_name, lora_path, weight, preloaded=None):
+        """动态模式（Dynamic）- 整合的 INT8 动态 LoRA 加载逻辑；preloaded 为预取的补丁字典"""
+        try:
+            # 克隆 model patcher
+            model_patcher = out_model.clone()
+            
+            # 1. 获取补丁映射（键映射与补丁字典均已缓存）
+            patch_dict = preloaded if preloaded is not None else LORA_PATCH_CACHE.get_patch_dict(lora_path, model_patcher)
+            
+            # 2. 注册全局 Hook（如果不存在）
+            DynamicLoRAHook.register(model_patcher.model.diffusion_model)
+            
+            # 3. 添加到 transformer_options 中的动态 LoRA 列表
+            # 这确保 ComfyUI 的克隆处理所有内容，并且是非粘性的
+            if "transformer_options" not in model_patcher.model_options:
+                model_patcher.model_options["transformer_options"] = {}
+            
+            opts = model_patcher.model_options["transformer_options"]
+            if "dynamic_loras" not in opts:
+                opts["dynamic_loras"] = []
+            else:
+                # 浅拷贝列表以避免修改父 patcher 的列表
+                opts["dynamic_loras"] = opts["dynamic_loras"].copy()
+            
+            opts["dynamic_loras"].append({
+                "name": lora_name,
+                "strength": weight,
+                "patches": patch_dict
+            })
+            
+            out_model = model_patcher
+            print(f"   ✅ Applied (INT8 Dynamic): {lora_name}")
+        except Exception as e:
+            print(f"   ❌ Failed (INT8 Dynamic): {lora_name} -> {e}")
+            # 回退到标准模式
+            try:
+                lora = LORA_CACHE.load(lora_path)
+                out_model, out_clip = comfy.sd.load_lora_for_models(out_model, out_clip, lora, weight, weight)
+                print(f"   ✅ Applied (Fallback): {lora_name}")
+            except Exception as e2:
+                print(f"   ❌ Failed (Fallback): {lora_name} -> {e2}")
+        return out_model, out_clip
+
+    @staticmethod
+    def _apply_lora_standard(out_model, out_clip, lora_name, lora_path, weight, preloaded=None):
+        """标准模式（默认）；preloaded 为预取的 state dict"""
+        try:
+            lora = preloaded if preloaded is not None else LORA_CACHE.load(lora_path)
+            out_model, out_clip = comfy.sd.load_lora_for_models(out_model, out_clip, lora, weight, weight)
+            print(f"   ✅ Applied: {lora_name}")
+        except Exception as e:
+            print(f"   ❌ Failed: {lora_name} -> {e}")
+        return out_model, out_clip
+
+    @staticmethod
+    def _remember_output(fingerprint, model, clip, out_model, out_clip):
+        """记录上一次的输出：输入只保留弱引用，输入被释放时输出一并丢弃"""
+        holder = [fingerprint, None, None, out_model, out_clip]
+
+        def release(_ref, holder=holder):
+            holder[3] = holder[4] = None
+
+        try:
+            holder[1] = weakref.ref(model, release)
+            holder[2] = weakref.ref(clip, release) if clip is not None else (lambda: None)
+        except TypeError:
+            return None
+        return holder
+
+    def apply_loras(self, model, clip, lora_stack, int8_mode="none", fuse_stack="none"):
+        """
+        应用 LoRA
+        int8_mode: "none" (默认), "stochastic" (静态), "dynamic" (动态)
+        fuse_stack: "none" (默认), "rank:N" 或 "energy:0.99"（将整个堆栈融合为一个低秩 LoRA）
+        """
+        out_model = model
+        out_clip = clip
+        active_tags = []
+        preview_images = []  # 改为列表，收集所有预览图
+
+        items_to_process = self.parse_lora_stack(lora_stack)
+
+        # 根据模式选择加载方式
+        if int8_mode == "stochastic" and INT8_AVAILABLE:
+            apply_fn = self._apply_lora_stochastic
+        elif int8_mode == "dynamic" and INT8_AVAILABLE:
+            apply_fn = self._apply_lora_dynamic
+        else:
+            apply_fn = self._apply_lora_standard
+
+        # 有效堆栈与输入模型都没变时，直接复用上一次打好补丁的模型
+        fingerprint = self.stack_fingerprint(items_to_process, int8_mode, fuse_stack)
+        last = getattr(self, "_last_output", None)
+        if last is not None and last[0] == fingerprint and last[1]() is model and last[2]() is clip:
+            out_model, out_clip = last[3], last[4]
+            print(f"🚀 [MagicPowerLora] LoRA stack unchanged, reusing patched model ({len(items_to_process)} Loras, Mode: {int8_mode})")
+        else:
+            # 检测是否为 INT8 模型
+            is_int8 = self.is_int8_model(out_model)
+            
+            # 如果启用 INT8 模式但模型不是 INT8，给出警告
+            if int8_mode != "none" and not is_int8:
+                print(f"⚠️ [MagicPowerLora] INT8 模式已启用，但模型似乎不是 INT8 量化模型，将尝试使用 INT8 加载器")
+            
+            # 如果未启用 INT8 模式但模型是 INT8，给出提示
+            if int8_mode == "none" and is_int8:
+                print(f"💡 [MagicPowerLora] 检测到 INT8 模型，建议在设置中启用 INT8 模式以获得更好的兼容性")
+
+            print(f"🚀 [MagicPowerLora] Processing {len(items_to_process)} Loras... (Mode: {int8_mode})")
+
+            to_apply = []  # (lora_name, lora_path, weight, 前缀缓存键)
+            for item in items_to_process:
+                lora_name = item.get("name")
+                weight = float(item.get("weight", 1.0))
+                if not lora_name: continue
+
+                lora_path = folder_paths.get_full_path("loras", lora_name)
+                if lora_path is None:
+                    print(f"⚠️ [MagicPowerLora] Lora not found: {lora_name}")
+                    continue
+
+                try:
+                    st = os.stat(lora_path)
+                    stat = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    stat = None
+                to_apply.append((lora_name, lora_path, weight, (lora_name, weight, stat)))
+
+            # 融合模式：多个 LoRA 合并为一个低秩补丁，之后按单个 LoRA 应用
+            fuse_spec = parse_fuse_spec(fuse_stack)
+            if fuse_spec and len(to_apply) > 1:
+                try:
+                    fused_path = fuse_lora_stack(model, clip, to_apply, fuse_spec)
                 except Exception as e:
-                    print(f"   ❌ Failed (INT8 Dynamic): {lora_name} -> {e}")
-                    # 回退到标准模式
-                    try:
-                        lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
-                        out_model, out_clip = comfy.sd.load_lora_for_models(out_model, out_clip, lora, weight, weight)
-                        print(f"   ✅ Applied (Fallback): {lora_name}")
-                    except Exception as e2:
-                        print(f"   ❌ Failed (Fallback): {lora_name} -> {e2}")
-
-                if "tags" in item and item["tags"]:
-                    active_tags.append(str(item["tags"]))
-
-                # 为每个lora尝试加载预览图
-                img_path = self.get_preview_path(lora_name)
-                if img_path:
+                    fused_path = None
+                    print(f"   ❌ Failed (Fuse): {e}")
+                if fused_path:
+                    fused_name = f"fused:{os.path.basename(fused_path)}"
+                    st = os.stat(fused_path)
+                    to_apply = [(fused_name, fused_path, 1.0, (fused_name, 1.0, (st.st_size, st.st_mtime_ns)))]
+
+            # 静态模式的 INT8 烘焙磁盘缓存（可选）：整个堆栈作为一个整体缓存，不使用前缀复用
+            stack_keys = [entry[3] for entry in to_apply]
+            bake = None
+            upstream_patches = bool(getattr(model, "patches", None))
+            if upstream_patches and apply_fn is self._apply_lora_stochastic and INT8_BAKE_CACHE.enabled:
+                # 烘焙结果会整层替换权重，输入模型上游已有补丁（如其他 LoRA 加载器）时无法保证一致，不使用缓存
+                print(f"   💾 INT8 bake cache skipped: input model already carries {len(model.patches)} patched layers")
+            elif apply_fn is self._apply_lora_stochastic and INT8_BAKE_CACHE.enabled and to_apply and is_int8:
+                try:
+                    model_hash = QuantizationIndex.get(model.model.diffusion_model).model_hash()
+                    bake = INT8_BAKE_CACHE.open(model_hash, stack_keys, INT8_STOCHASTIC_SEED)
+                    apply_fn = functools.partial(self._apply_lora_stochastic, bake=bake)
+                    print(f"   💾 INT8 bake cache: {'hit' if bake.hit else 'miss (will record)'}")
+                except Exception as e:
+                    bake = None
+                    print(f"   ⚠️ INT8 bake cache unavailable: {e}")
+
+            # 复用最长的已缓存前缀，只应用变化的尾部
+            reused = 0
+            if bake is None:
+                reused, out_model, out_clip = LORA_PREFIX_CACHE.lookup(model, clip, int8_mode, stack_keys)
+            if reused:
+                print(f"   ♻️ Reused cached prefix: {reused}/{len(to_apply)} Loras")
+
+            # 后台预取尚未应用的 LoRA（INT8 模式连同补丁字典一起构建）
+            if apply_fn is self._apply_lora_standard:
+                prefetch_fn = LORA_CACHE.load
+            else:
+                base_patcher = out_model
+                prefetch_fn = lambda path: LORA_PATCH_CACHE.get_patch_dict(path, base_patcher)
+            tail = to_apply[reused:]
+            prefetcher = LoraPrefetcher(
+                [(lora_path, stat[0] if stat else 0) for _, lora_path, _, (_, _, stat) in tail],
+                prefetch_fn,
+                lookahead=_LORA_PERF.get("prefetch_lookahead", 2) if len(tail) > 1 else 0,
+                max_inflight_bytes=float(_LORA_PERF.get("prefetch_max_inflight_mb", 2048)) * 1024 * 1024,
+                max_workers=_LORA_PERF.get("prefetch_workers", 2),
+            )
+            try:
+                for idx in range(reused, len(to_apply)):
+                    lora_name, lora_path, weight, _ = to_apply[idx]
+                    preloaded = prefetcher.wait(idx - reused)
+                    out_model, out_clip = apply_fn(out_model, out_clip, lora_name, lora_path, weight,
+                                                   preloaded=preloaded)
+                    if bake is None:
+                        LORA_PREFIX_CACHE.store(model, clip, int8_mode, stack_keys[:idx + 1], out_model, out_clip)
+            finally:
+                prefetcher.close()
+
+            self._last_output = self._remember_output(fingerprint, model, clip, out_model, out_clip)
+
+        for item in items_to_process:
+            lora_name = item.get("name")
+            if not lora_name: continue
+            if folder_paths.get_full_path("loras", lora_name) is None: continue
+
+            if "tags" in item and item["tags"]:
+                active_tags.append(str(item["tags"]))
+
+            # 为每个lora尝试加载预览图
+            img_path = self.get_preview_path(lora_name)
+            if img_path:
+                try:
+                    i = Image.open(img_path).convert("RGB")
+                    i = np.array(i).astype(np.float32) / 255.0
+                    preview_tensor = torch.from_numpy(i)[None,]
+                    preview_images.append(preview_tensor)
+                except Exception as e:
+                    print(f"   ⚠️ Failed to load preview for {lora_name}: {e}")
+
+        # 如果没有找到任何预览图，返回一个占位图
+        if not preview_images:
+            preview_images = [torch.zeros((1, 64, 64, 3), dtype=torch.float32, device="cpu")]
+
+        final_text = ", ".join(active_tags)
+        return (out_model, out_clip, preview_images, final_text)
+
+# --- API 接口 ---
+
+# 路由中的阻塞 I/O（目录扫描、文件读写）统一放到独立线程池，避免卡住 aiohttp 事件循环
+LORA_IO_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ma_lora_io")
+# 访问 Civitai 的慢请求（含重试退避的 sleep、图片下载）单独一个线程池，不占用本地 I/O 的线程
+LORA_NET_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, int(_LORA_PERF.get("network_workers", 4))),
+                                       thread_name_prefix="ma_lora_net")
+
+async def run_lora_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(LORA_IO_EXECUTOR, func, *args)
+
+async def run_lora_net(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(LORA_NET_EXECUTOR, func, *args)
+
+def etag_json_response(request, data, etag):
+    """带 ETag 的 JSON 响应；If-None-Match 命中时返回 304"""
+    if etag and request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers={"ETag": etag})
+    return web.json_response(data, headers={"ETag": etag, "Cache-Control": "no-cache"} if etag else None)
+
+@PromptServer.instance.routes.get("/ma/lora/cache_stats")
+async def get_lora_cache_stats(request):
+    """查看 LoRA 文件缓存的命中/未命中统计"""
+    return web.json_response({
+        "state_dict_cache": LORA_CACHE.get_stats(),
+        "patch_cache": LORA_PATCH_CACHE.get_stats(),
+        "prefix_cache": LORA_PREFIX_CACHE.get_stats(),
+        "dynamic_compose_cache": DynamicLoRAHook.get_stats(),
+        "int8_bake_cache": INT8_BAKE_CACHE.get_stats(),
+        "civitai_response_cache": CIVITAI_CACHE.get_stats(),
+        "preview_index": LORA_PREVIEW_INDEX.get_stats(),
+        "thumbnails": LORA_THUMBNAILS.get_stats(),
+        "search_index": LORA_SEARCH_INDEX.get_stats(),
+    })
+
+@PromptServer.instance.routes.post("/ma/lora/invalidate_cache")
+async def invalidate_lora_cache(request):
+    """清除 LoRA 前缀缓存（可只清除包含指定 LoRA 的条目）；all=true 时同时清空文件与补丁缓存，civitai=true 时清空 Civitai 响应缓存"""
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    removed = LORA_PREFIX_CACHE.invalidate(data.get("lora_name"))
+    if data.get("all"):
+        LORA_CACHE.clear()
+        LORA_PATCH_CACHE.clear()
+    if data.get("civitai"):
+        await run_lora_io(CIVITAI_CACHE.clear)
+    return web.json_response({"status": "success", "removed": removed})
+
+@PromptServer.instance.routes.get("/ma/lora/list")
+async def get_lora_list(request):
+    try:
+        lora_names = await run_lora_io(folder_paths.get_filename_list, "loras")
+        return web.json_response({"files": lora_names})
+    except Exception as e:
+        return web.json_response({"files": [], "error": str(e)})
+
+PREVIEW_EXTS = [".png", ".jpg", ".jpeg", ".webp"]
+PREVIEW_CANDIDATES = PREVIEW_EXTS + [".preview.png", ".preview.jpg", ".cover.png", ".cover.jpg"]
+
+class LoraPreviewIndex:
+    """
+    /ma/lora/images 背后的预览图索引。
+    每个目录只做一次 os.scandir 并记住目录 mtime；之后每次请求只 stat 目录本身，
+    mtime 未变的目录直接复用上次的文件名列表（新增/删除文件都会改变目录 mtime）。
+    LoRA 所在目录也由同一份列表判定，不再对每个 LoRA 调用 get_full_path。
+    """
+    # 刚修改过的目录可能在同一 mtime 精度内还有新文件写入，这段时间内不信任缓存
+    SETTLE_NS = 2 * 10**9
+
+    def __init__(self):
+        self._dirs = {}  # 目录 -> (mtime_ns 或 None, {normcase(文件名): 文件名})
+        self._lock = threading.Lock()
+        self._images = {}
+        self._signature = None
+        self.etag = None
+        self.scans = 0
+
+    def _listing(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return {}
+        cached = self._dirs.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        names = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
                     try:
-                        i = Image.open(img_path).convert("RGB")
-                        i = np.array(i).astype(np.float32) / 255.0
-                        preview_tensor = torch.from_numpy(i)[None,]
-                        preview_images.append(preview_tensor)
-                    except Exception as e:
-                        print(f"   ⚠️ Failed to load preview for {lora_name}: {e}")
+                        if entry.is_file():
+                            names[os.path.normcase(entry.name)] = entry.name
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        self.scans += 1
+        settled = time.time_ns() - mtime > self.SETTLE_NS
+        self._dirs[directory] = (mtime if settled else None, names)
+        return names
 
-        else:
-            # 标准模式（默认）
-            for item in items_to_process:
-                lora_name = item.get("name")
-                weight = float(item.get("weight", 1.0))
-                if not lora_name: continue
+    @staticmethod
+    def _lora_dir(listing, roots, lora_filename):
+        """按 LoRA 根目录顺序找到文件所在目录（与 get_full_path 的优先级一致）"""
+        rel_dir, basename = os.path.split(lora_filename)
+        for root in roots:
+            candidate_dir = os.path.join(root, rel_dir)
+            if os.path.normcase(basename) in listing(candidate_dir):
+                return candidate_dir
+        return None
 
-                lora_path = folder_paths.get_full_path("loras", lora_name)
-                if lora_path is None:
-                    print(f"⚠️ [MagicPowerLora] Lora not found: {lora_name}")
+    @classmethod
+    def _find_preview(cls, listing, roots, lora_filename, extensions):
+        """返回 (预览图所在目录, 预览图文件名)；优先 magicloradate 子目录，其次同层级"""
+        lora_dir = cls._lora_dir(listing, roots, lora_filename)
+        if lora_dir is None:
+            return None, None
+
+        stem = os.path.splitext(os.path.basename(lora_filename))[0]
+        for search_dir in (os.path.join(lora_dir, "magicloradate"), lora_dir):
+            names = listing(search_dir)
+            for ext in extensions:
+                preview = names.get(os.path.normcase(stem + ext))
+                if preview:
+                    return search_dir, preview
+        return None, None
+
+    def resolve_preview(self, lora_name):
+        """查找单个 LoRA 的预览图完整路径（含 .preview/.cover 变体），复用目录列表缓存"""
+        with self._lock:
+            search_dir, preview = self._find_preview(self._listing, folder_paths.get_folder_paths("loras"),
+                                                     lora_name, PREVIEW_CANDIDATES)
+        return os.path.join(search_dir, preview) if preview else None
+
+    def sidecar_locations(self, lora_filenames, extensions):
+        """批量列出附属文件在两个位置的情况：{LoRA: {扩展名: {"magicloradate": 路径, "same": 路径}}}（只含存在的文件）"""
+        with self._lock:
+            roots = folder_paths.get_folder_paths("loras")
+            listings = {}
+
+            def listing(directory):
+                names = listings.get(directory)
+                if names is None:
+                    names = listings[directory] = self._listing(directory)
+                return names
+
+            result = {}
+            for lora_filename in lora_filenames:
+                lora_dir = self._lora_dir(listing, roots, lora_filename)
+                if lora_dir is None:
                     continue
+                stem = os.path.splitext(os.path.basename(lora_filename))[0]
+                found = {}
+                for ext in extensions:
+                    locations = {}
+                    for location, search_dir in (("magicloradate", os.path.join(lora_dir, "magicloradate")), ("same", lora_dir)):
+                        name = listing(search_dir).get(os.path.normcase(stem + ext))
+                        if name:
+                            locations[location] = os.path.join(search_dir, name)
+                    found[ext] = locations
+                result[lora_filename] = found
+            return result
 
-                try:
-                    lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
-                    out_model, out_clip = comfy.sd.load_lora_for_models(out_model, out_clip, lora, weight, weight)
-                    print(f"   ✅ Applied: {lora_name}")
-                except Exception as e:
-                    print(f"   ❌ Failed: {lora_name} -> {e}")
+    def find_sidecars(self, lora_filenames, extensions):
+        """批量查找附属文件，返回 {LoRA: {扩展名: 完整路径}}；每种扩展名都是 magicloradate 优先，其次同层级"""
+        return {
+            lora_filename: {ext: locations.get("magicloradate") or locations["same"]
+                            for ext, locations in found.items() if locations}
+            for lora_filename, found in self.sidecar_locations(lora_filenames, extensions).items()
+        }
 
-                if "tags" in item and item["tags"]:
-                    active_tags.append(str(item["tags"]))
+    def refresh(self):
+        """增量刷新索引，返回 (预览图映射, ETag)"""
+        with self._lock:
+            roots = folder_paths.get_folder_paths("loras")
+            lora_files = folder_paths.get_filename_list("loras")
+            listings = {}
 
-                # 为每个lora尝试加载预览图
-                img_path = self.get_preview_path(lora_name)
-                if img_path:
-                    try:
-                        i = Image.open(img_path).convert("RGB")
-                        i = np.array(i).astype(np.float32) / 255.0
-                        preview_tensor = torch.from_numpy(i)[None,]
-                        preview_images.append(preview_tensor)
-                    except Exception as e:
-                        print(f"   ⚠️ Failed to load preview for {lora_name}: {e}")
+            def listing(directory):
+                names = listings.get(directory)
+                if names is None:
+                    names = listings[directory] = self._listing(directory)
+                return names
 
-        # 如果没有找到任何预览图，返回一个占位图
-        if not preview_images:
-            preview_images = [torch.zeros((1, 64, 64, 3), dtype=torch.float32, device="cpu")]
+            images = {}
+            for lora_filename in lora_files:  # lora_filename is like "subdir/mylora.safetensors"
+                _, preview = self._find_preview(listing, roots, lora_filename, PREVIEW_EXTS)
+                if preview:
+                    rel_dir = os.path.dirname(lora_filename)
+                    images[lora_filename] = os.path.join(rel_dir, preview).replace("\\", "/")
 
-        final_text = ", ".join(active_tags)
-        return (out_model, out_clip, preview_images, final_text)
+            # 丢弃已不再属于 LoRA 库的目录
+            self._dirs = {d: v for d, v in self._dirs.items() if d in listings}
 
-# --- API 接口 ---
+            signature = json.dumps(images, sort_keys=True)
+            if signature != self._signature:
+                self._signature = signature
+                self._images = images
+                self.etag = '"%s"' % hashlib.sha1(signature.encode('utf-8')).hexdigest()[:20]
+            return self._images, self.etag
 
-@PromptServer.instance.routes.get("/ma/lora/list")
-async def get_lora_list(request):
-    try:
-        lora_names = folder_paths.get_filename_list("loras")
-        return web.json_response({"files": lora_names})
-    except Exception as e:
-        return web.json_response({"files": [], "error": str(e)})
+    def get_stats(self):
+        return {"directories": len(self._dirs), "scans": self.scans, "entries": len(self._images)}
+
+LORA_PREVIEW_INDEX = LoraPreviewIndex()
 
 @PromptServer.instance.routes.get("/ma/lora/images")
 async def get_lora_images(request):
-    """获取所有LoRA文件及其对应的预览图的映射（优先查找magicloradate子目录）"""
+    """获取所有LoRA文件及其对应的预览图的映射（优先查找magicloradate子目录），未变化时返回 304"""
     try:
-        lora_files = folder_paths.get_filename_list("loras")
-        images = {}
-        
-        for lora_filename in lora_files:  # lora_filename is like "subdir/mylora.safetensors"
-            lora_full_path = folder_paths.get_full_path("loras", lora_filename)
-            if not lora_full_path:
-                continue
-
-            lora_dir = os.path.dirname(lora_full_path)
-            lora_basename_no_ext = os.path.splitext(os.path.basename(lora_filename))[0]
-            
-            # 优先在 magicloradate 子目录查找预览图，若无则查找同层级（magicloradate > 同层级）
-            magicloradate_dir = os.path.join(lora_dir, "magicloradate")
-            found = False
-            
-            # 先检查magicloradate子目录
-            for ext in [".png", ".jpg", ".jpeg", ".webp"]:
-                preview_path_magic = os.path.join(magicloradate_dir, f"{lora_basename_no_ext}{ext}")
-                if os.path.isfile(preview_path_magic):
-                    lora_dir_relative = os.path.dirname(lora_filename)  # e.g. "subdir"
-                    preview_basename = os.path.basename(preview_path_magic)  # e.g. "mylora.png"
-                    relative_path_for_frontend = os.path.join(lora_dir_relative, preview_basename).replace("\\", "/")
-                    images[lora_filename] = relative_path_for_frontend
-                    found = True
-                    break
-            
-            # 如果magicloradate子目录没有找到，检查同层级
-            if not found:
-                for ext in [".png", ".jpg", ".jpeg", ".webp"]:
-                    preview_path_same = os.path.join(lora_dir, f"{lora_basename_no_ext}{ext}")
-                    if os.path.isfile(preview_path_same):
-                        lora_dir_relative = os.path.dirname(lora_filename)  # e.g. "subdir"
-                        preview_basename = os.path.basename(preview_path_same)  # e.g. "mylora.png"
-                        relative_path_for_frontend = os.path.join(lora_dir_relative, preview_basename).replace("\\", "/")
-                        images[lora_filename] = relative_path_for_frontend
-                        break
-            
-        return web.json_response(images)
+        images, etag = await run_lora_io(LORA_PREVIEW_INDEX.refresh)
+        return etag_json_response(request, images, etag)
     except Exception as e:
         print(f"获取LoRA图片列表时出错: {e}")
         return web.json_response({})
 
+class LoraThumbnailService:
+    """
+    /ma/lora/image?size=N 的缩略图服务。
+    缩略图在独立线程池中由 PIL 生成（WebP，不支持时退回 JPEG），缓存在 userdata/lora_thumbs/<源图路径哈希>/ 下，
+    文件名包含尺寸与源图 mtime，源图更新后自动失效，旧文件在生成新缩略图时顺带清理。
+    缓存总大小超过 max_bytes 时按 mtime（命中时每天最多刷新一次）LRU 淘汰到上限的 90%。
+    """
+    SIZES = (64, 128, 192, 256, 384, 512, 768, 1024)
+    TOUCH_INTERVAL = 24 * 3600
+
+    def __init__(self, cache_dir, max_workers, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="ma_lora_thumb")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._cache_bytes = None  # 第一次写入时扫描得到，之后增量累加
+        self._webp = None
+        self.hits = 0
+        self.generated = 0
+        self.evictions = 0
+
+    @classmethod
+    def normalize_size(cls, size):
+        """把请求尺寸归到固定档位，避免任意尺寸把磁盘缓存撑爆"""
+        size = int(size)
+        return next((s for s in cls.SIZES if s >= size), cls.SIZES[-1])
+
+    def normalize_format(self, fmt):
+        if self._webp is None:
+            try:
+                from PIL import features
+                self._webp = bool(features.check("webp"))
+            except Exception:
+                self._webp = False
+        if str(fmt or "").lower() in ("jpg", "jpeg") or not self._webp:
+            return "jpeg"
+        return "webp"
+
+    def _thumb_path(self, src_path, st, size, fmt):
+        source_dir = hashlib.sha1(os.path.abspath(src_path).encode('utf-8')).hexdigest()[:16]
+        ext = "webp" if fmt == "webp" else "jpg"
+        return os.path.join(self.cache_dir, source_dir, f"{size}_{st.st_mtime_ns:x}.{ext}")
+
+    def _load(self, src_path, thumb_path, size, fmt):
+        """读取或生成缩略图，返回编码后的字节（在缩略图线程池中执行）"""
+        try:
+            with open(thumb_path, 'rb') as f:
+                data = f.read()
+                if time.time() - os.fstat(f.fileno()).st_mtime > self.TOUCH_INTERVAL:
+                    os.utime(thumb_path)  # 刷新最近使用时间，供 LRU 淘汰参考
+            self.hits += 1
+            return data
+        except OSError:
+            pass
+
+        with Image.open(src_path) as img:
+            img.draft("RGB", (size, size))  # JPEG 源图直接按比例缩小解码
+            img.thumbnail((size, size), Image.LANCZOS)
+            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+            if fmt == "webp" and has_alpha:
+                img = img.convert("RGBA")
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            buffer = io.BytesIO()
+            if fmt == "webp":
+                img.save(buffer, format="WEBP", quality=80, method=4)
+            else:
+                img.save(buffer, format="JPEG", quality=85, optimize=True)
+        data = buffer.getvalue()
+
+        # 写入磁盘缓存，并清理同一源图、同尺寸、同格式的旧版本（其他格式与其他线程的 .tmp 不动）
+        thumb_dir = os.path.dirname(thumb_path)
+        stale = self._stale_pattern(os.path.basename(thumb_path))
+        removed = 0
+        try:
+            os.makedirs(thumb_dir, exist_ok=True)
+            for entry in os.scandir(thumb_dir):
+                if stale.fullmatch(entry.name) and entry.name != os.path.basename(thumb_path):
+                    size_on_disk = entry.stat().st_size
+                    os.remove(entry.path)
+                    removed += size_on_disk
+            tmp_path = f"{thumb_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, thumb_path)
+            self._account(len(data) - removed)
+        except OSError as e:
+            print(f"⚠️ [MagicPowerLora] 缩略图缓存写入失败: {e}")
+        self.generated += 1
+        return data
+
+    @staticmethod
+    def _stale_pattern(thumb_name):
+        """<尺寸>_<任意 mtime>.<同一扩展名>，与 _thumb_path 的命名完全对应"""
+        size, _, rest = thumb_name.partition("_")
+        ext = rest.rsplit(".", 1)[-1]
+        return re.compile(rf"{re.escape(size)}_[0-9a-f]+\.{re.escape(ext)}")
+
+    def _scan(self):
+        """返回缓存中所有缩略图 [(mtime, 大小, 路径)]，写入中的 .tmp 文件不计入"""
+        files = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _account(self, delta):
+        with self._lock:
+            if self._cache_bytes is not None:
+                self._cache_bytes += delta
+                over = self._cache_bytes > self.max_bytes
+            else:
+                over = True  # 还没扫描过，交给 _prune 统计
+        if over and self._prune_lock.acquire(blocking=False):
+            try:
+                self._prune()
+            finally:
+                self._prune_lock.release()
+
+    def _prune(self):
+        files = self._scan()
+        total = sum(f[1] for f in files)
+        if total > self.max_bytes:
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+                try:
+                    os.rmdir(os.path.dirname(path))  # 目录已空时顺带删除
+                except OSError:
+                    pass
+        with self._lock:
+            self._cache_bytes = total
+
+    def _submit(self, src_path, thumb_path, size, fmt):
+        """同一缩略图的并发请求只生成一次"""
+        with self._lock:
+            future = self._inflight.get(thumb_path)
+            created = future is None
+            if created:
+                future = self._inflight[thumb_path] = self._executor.submit(self._load, src_path, thumb_path, size, fmt)
+        if created:
+            future.add_done_callback(lambda _: self._discard(thumb_path))
+        return future
+
+    def _discard(self, thumb_path):
+        with self._lock:
+            self._inflight.pop(thumb_path, None)
+
+    async def respond(self, request, src_path, size, fmt=None):
+        size = self.normalize_size(size)
+        fmt = self.normalize_format(fmt)
+        st = await run_lora_io(os.stat, src_path)
+        thumb_path = self._thumb_path(src_path, st, size, fmt)
+        headers = {
+            "ETag": '"%s"' % "-".join(thumb_path.replace("\\", "/").rsplit("/", 2)[-2:]),
+            "Last-Modified": email.utils.formatdate(st.st_mtime, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            if if_none_match == headers["ETag"]:
+                return web.Response(status=304, headers=headers)
+        elif request.if_modified_since is not None and int(st.st_mtime) <= request.if_modified_since.timestamp():
+            return web.Response(status=304, headers=headers)
+        try:
+            data = await asyncio.wrap_future(self._submit(src_path, thumb_path, size, fmt))
+        except Exception as e:
+            print(f"⚠️ [MagicPowerLora] 缩略图生成失败，返回原图: {e}")
+            return web.FileResponse(src_path)
+        return web.Response(body=data, content_type=f"image/{fmt}", headers=headers)
+
+    def get_stats(self):
+        return {"hits": self.hits, "generated": self.generated, "inflight": len(self._inflight),
+                "bytes": self._cache_bytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+LORA_THUMBNAILS = LoraThumbnailService(os.path.join(MagicUtils.USER_DIR, "lora_thumbs"),
+                                       _LORA_PERF.get("thumbnail_workers", 2),
+                                       float(_LORA_PERF.get("thumbnail_cache_mb", 512)) * 1024 * 1024)
+
 @PromptServer.instance.routes.get("/ma/lora/image")
 async def get_lora_image(request):
     try:
         name = request.query.get("name")
         if not name: return web.Response(status=404)
         
-        img_path = MagicPowerLoraLoader.get_preview_path(name)
+        img_path = await run_lora_io(MagicPowerLoraLoader.get_preview_path, name)
         if img_path and os.path.exists(img_path):
+            size = request.query.get("size")
+            if size and size.isdigit():
+                return await LORA_THUMBNAILS.respond(request, img_path, size, request.query.get("format"))
+            # 原图：aiohttp 的 FileResponse 自带 ETag / Last-Modified / 304 处理
             return web.FileResponse(img_path)
         
         return web.Response(status=404)
@@ -625,11 +2432,380 @@ async def get_lora_image(request):
         print(f"❌ Image API Error: {e}")
         return web.Response(status=500)
 
+class LoraSearchIndex:
+    """
+    LoRA 库的内存倒排索引，供 /ma/lora/search 做服务端搜索、分页与分面统计。
+    索引字段：文件名、所在文件夹、触发词（.txt）、基础模型（.json）、推荐权重（.log）。
+    刷新是增量的：附属文件按 (路径, mtime, 大小) 比对，只重新解析变化过的 LoRA；
+    两次刷新之间至少间隔 refresh_interval 秒，写入附属文件的接口会调用 invalidate() 让下一次查询立即刷新。
+    """
+    SIDECAR_EXTS = (".txt", ".json", ".log")
+    FIELD_WEIGHTS = {"name": 3.0, "folder": 2.0, "base_model": 1.5, "trigger": 1.0}
+    TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, refresh_interval=5.0):
+        self.refresh_interval = refresh_interval
+        self._docs = {}      # LoRA -> 文档
+        self._postings = {}  # token -> {LoRA: 字段权重}
+        self._vocab = []     # 排序后的 token 列表（用于前缀查找）
+        self._vocab_dirty = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self.reparsed = 0
+
+    @classmethod
+    def tokenize(cls, text):
+        return [t.lower() for t in cls.TOKEN_RE.findall(text or "")]
+
+    @staticmethod
+    def _read_text(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception:
+            return ""
+
+    @classmethod
+    def _parse_doc(cls, lora_name, sidecars):
+        rel_dir, basename = os.path.split(lora_name)
+        doc = {
+            "name": lora_name,
+            "folder": rel_dir.replace("\\", "/"),
+            "trigger_words": "",
+            "base_model": "",
+            "preferred_weight": None,
+        }
+        if ".txt" in sidecars:
+            doc["trigger_words"] = cls._read_text(sidecars[".txt"]).strip()
+        if ".json" in sidecars:
+            content = cls._read_text(sidecars[".json"])
+            match = re.search(r"基础模型:\s*(.+)", content)
+            if match:
+                doc["base_model"] = match.group(1).strip()
+            else:
+                try:
+                    doc["base_model"] = str(json.loads(content).get("baseModel") or "")
+                except Exception:
+                    pass
+        if ".log" in sidecars:
+            content = cls._read_text(sidecars[".log"])
+            match = re.search(r'"preferred weight"\s*:\s*(-?[\d.]+)', content)
+            if match:
+                try:
+                    doc["preferred_weight"] = float(match.group(1))
+                except ValueError:
+                    pass
+
+        fields = {
+            "name": cls.tokenize(os.path.splitext(basename)[0]),
+            "folder": cls.tokenize(doc["folder"]),
+            "base_model": cls.tokenize(doc["base_model"]),
+            "trigger": cls.tokenize(doc["trigger_words"]),
+        }
+        tokens = {}
+        for field, field_tokens in fields.items():
+            weight = cls.FIELD_WEIGHTS[field]
+            for token in field_tokens:
+                if tokens.get(token, 0) < weight:
+                    tokens[token] = weight
+        doc["tokens"] = tokens
+        return doc
+
+    def _remove_locked(self, lora_name):
+        doc = self._docs.pop(lora_name, None)
+        if doc is None:
+            return
+        for token in doc["tokens"]:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(lora_name, None)
+                if not postings:
+                    del self._postings[token]
+                    self._vocab_dirty = True
+
+    def _add_locked(self, doc):
+        self._docs[doc["name"]] = doc
+        for token, weight in doc["tokens"].items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._vocab_dirty = True
+            postings[doc["name"]] = weight
+
+    def invalidate(self):
+        self._last_refresh = 0.0
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.time() - self._last_refresh < self.refresh_interval:
+                return
+            lora_files = folder_paths.get_filename_list("loras")
+            sidecars = LORA_PREVIEW_INDEX.find_sidecars(lora_files, self.SIDECAR_EXTS)
+            for lora_name in lora_files:
+                paths = sidecars.get(lora_name, {})
+                signature = []
+                for ext, path in sorted(paths.items()):
+                    try:
+                        st = os.stat(path)
+                        signature.append((path, st.st_mtime_ns, st.st_size))
+                    except OSError:
+                        pass
+                signature = tuple(signature)
+                doc = self._docs.get(lora_name)
+                if doc is not None and doc["signature"] == signature:
+                    continue
+                new_doc = self._parse_doc(lora_name, paths)
+                new_doc["signature"] = signature
+                self._remove_locked(lora_name)
+                self._add_locked(new_doc)
+                self.reparsed += 1
+            for lora_name in set(self._docs) - set(lora_files):
+                self._remove_locked(lora_name)
+            if self._vocab_dirty:
+                self._vocab = sorted(self._postings)
+                self._vocab_dirty = False
+            self._last_refresh = time.time()
+
+    def _expand_locked(self, term, fuzzy):
+        """把查询词展开为 {token: 匹配系数}：完全匹配 1.0，前缀 0.8，子串 0.5，模糊 0.4"""
+        matches = {}
+        if term in self._postings:
+            matches[term] = 1.0
+        start = bisect.bisect_left(self._vocab, term)
+        for token in itertools.islice(self._vocab, start, None):
+            if not token.startswith(term):
+                break
+            matches.setdefault(token, 0.8)
+        if not matches:
+            for token in self._vocab:
+                if term in token:
+                    matches[token] = 0.5
+        if fuzzy or not matches:
+            for token in difflib.get_close_matches(term, self._vocab, n=8, cutoff=0.75):
+                matches.setdefault(token, 0.4)
+        return matches
+
+    def search(self, query="", folder=None, base_model=None, page=1, page_size=50, fuzzy=False, sort="score"):
+        self.refresh()
+        with self._lock:
+            terms = self.tokenize(query)
+            if terms:
+                scores = None
+                for term in terms:
+                    term_scores = {}
+                    for token, factor in self._expand_locked(term, fuzzy).items():
+                        for lora_name, weight in self._postings[token].items():
+                            score = weight * factor
+                            if term_scores.get(lora_name, 0) < score:
+                                term_scores[lora_name] = score
+                    # 多个查询词之间为 AND
+                    if scores is None:
+                        scores = term_scores
+                    else:
+                        scores = {n: s + term_scores[n] for n, s in scores.items() if n in term_scores}
+                    if not scores:
+                        break
+                scores = scores or {}
+            else:
+                scores = dict.fromkeys(self._docs, 0.0)
+
+            # 分面统计在文件夹 / 基础模型过滤之前计算，方便前端显示每个选项的数量
+            facets = {"folder": {}, "base_model": {}}
+            for lora_name in scores:
+                doc = self._docs[lora_name]
+                facets["folder"][doc["folder"]] = facets["folder"].get(doc["folder"], 0) + 1
+                facets["base_model"][doc["base_model"]] = facets["base_model"].get(doc["base_model"], 0) + 1
+
+            hits = [n for n in scores
+                    if (folder is None or self._docs[n]["folder"] == folder)
+                    and (base_model is None or self._docs[n]["base_model"] == base_model)]
+            if sort == "name" or not terms:
+                hits.sort(key=str.lower)
+            else:
+                hits.sort(key=lambda n: (-scores[n], n.lower()))
+
+            page_size = max(1, min(int(page_size), SEARCH_MAX_PAGE_SIZE))
+            page = max(1, int(page))
+            items = []
+            for lora_name in hits[(page - 1) * page_size: page * page_size]:
+                doc = self._docs[lora_name]
+                items.append({k: doc[k] for k in ("name", "folder", "trigger_words", "base_model", "preferred_weight")})
+                items[-1]["score"] = round(scores[lora_name], 3)
+            return {"total": len(hits), "page": page, "page_size": page_size, "items": items, "facets": facets}
+
+    def get_stats(self):
+        return {"documents": len(self._docs), "tokens": len(self._postings), "reparsed": self.reparsed}
+
+LORA_SEARCH_INDEX = LoraSearchIndex(float(_LORA_PERF.get("search_refresh_seconds", 5)))
+
+SEARCH_MAX_PAGE_SIZE = 500
+
+def parse_page_params(query, default_page_size=50):
+    """解析分页参数：非数字或负数抛出 ValueError；page 至少为 1，page_size 截到 [1, SEARCH_MAX_PAGE_SIZE]"""
+    values = {}
+    for name, default in (("page", 1), ("page_size", default_page_size)):
+        raw = query.get(name)
+        if raw is None or raw == "":
+            values[name] = default
+            continue
+        try:
+            value = int(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} 必须是整数: {raw!r}")
+        if value < 0:
+            raise ValueError(f"{name} 不能为负数: {value}")
+        values[name] = value
+    return max(1, values["page"]), max(1, min(values["page_size"], SEARCH_MAX_PAGE_SIZE))
+
+@PromptServer.instance.routes.get("/ma/lora/search")
+async def search_loras(request):
+    """服务端搜索 LoRA：q 为关键词（前缀/子串/模糊匹配），支持 folder、base_model 过滤与分页，返回分面统计"""
+    query = request.query
+    try:
+        page, page_size = parse_page_params(query)
+    except ValueError as e:
+        return web.json_response({"status": "error", "message": str(e)}, status=400)
+    try:
+        if query.get("refresh") in ("1", "true"):
+            LORA_SEARCH_INDEX.invalidate()
+        result = await run_lora_io(functools.partial(
+            LORA_SEARCH_INDEX.search,
+            query.get("q", ""),
+            folder=query.get("folder"),
+            base_model=query.get("base_model"),
+            page=page,
+            page_size=page_size,
+            fuzzy=query.get("fuzzy") in ("1", "true"),
+            sort=query.get("sort", "score"),
+        ))
+        return web.json_response(result)
+    except Exception as e:
+        print(f"搜索LoRA时出错: {e}")
+        return web.json_response({"total": 0, "items": [], "facets": {}, "error": str(e)}, status=500)
+
 def get_preset_dir():
     target_dir = os.path.join(MagicUtils.USER_DIR, "lora_presets")
     if not os.path.exists(target_dir): os.makedirs(target_dir, exist_ok=True)
     return target_dir
 
+class LoraPresetStore:
+    """
+    userdata/lora_presets 的内存索引：按文件 (mtime, 大小) 增量刷新，只重新解析变化过的预设。
+    提供仅含名称与摘要的列表、按需读取单个预设，保存时写临时文件再 os.replace，多个标签页同时保存也不会写坏文件。
+    """
+    def __init__(self):
+        self._entries = {}  # 预设名 -> {"mtime_ns", "size", "content", "lora_count"}
+        self._lock = threading.Lock()
+        self.etag = None
+
+    @staticmethod
+    def _lora_count(content):
+        try:
+            return sum(len(folder.get("loras") or []) for folder in content.get("folders") or [])
+        except Exception:
+            return 0
+
+    def _load_entry_locked(self, name, path, st):
+        old = self._entries.get(name)
+        if old is not None and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as pf:
+                content = json.load(pf)
+        except Exception:
+            content = None  # 损坏的预设不出现在列表中，文件变化后会重新解析
+        self._entries[name] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size,
+                               "content": content, "lora_count": self._lora_count(content)}
+
+    def refresh(self):
+        with self._lock:
+            preset_dir = get_preset_dir()
+            seen = set()
+            with os.scandir(preset_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    name = entry.name[:-len(".json")]
+                    seen.add(name)
+                    self._load_entry_locked(name, entry.path, st)
+            for name in set(self._entries) - seen:
+                del self._entries[name]
+            signature = sorted((n, e["mtime_ns"], e["size"]) for n, e in self._entries.items())
+            self.etag = '"%s"' % hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:20]
+            return self.etag
+
+    def list_names(self):
+        etag = self.refresh()
+        with self._lock:
+            names = [{"name": name, "lora_count": e["lora_count"], "mtime": e["mtime_ns"] / 1e9}
+                     for name, e in sorted(self._entries.items()) if e["content"] is not None]
+        return names, etag
+
+    def get_all(self):
+        etag = self.refresh()
+        with self._lock:
+            presets = {name: e["content"] for name, e in self._entries.items() if e["content"] is not None}
+        return presets, etag
+
+    @staticmethod
+    def preset_path(name):
+        """
+        预设名 -> 文件路径。名称不能含路径分隔符或 ..，解析后的路径必须仍在预设目录内，否则抛出 ValueError。
+        ":" 只在 Windows 上禁止（盘符 / NTFS 备用数据流），其他平台上已有的 "SDXL: portrait" 之类预设照常可用。
+        """
+        forbidden = ("/", "\\", "\0", ":") if os.name == "nt" else ("/", "\\", "\0")
+        if (not isinstance(name, str) or not name or name in (".", "..")
+                or any(c in name for c in forbidden)):
+            raise ValueError(f"非法的预设名称: {name!r}")
+        preset_dir = os.path.realpath(get_preset_dir())
+        path = os.path.realpath(os.path.join(preset_dir, f"{name}.json"))
+        if os.path.dirname(path) != preset_dir:
+            raise ValueError(f"非法的预设名称: {name!r}")
+        return path
+
+    def get(self, name):
+        """返回 (预设内容, ETag)，不存在时返回 (None, None)"""
+        path = self.preset_path(name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None, None
+        with self._lock:
+            self._load_entry_locked(name, path, st)
+            entry = self._entries[name]
+        return entry["content"], '"%x-%x"' % (entry["mtime_ns"], entry["size"])
+
+    def save(self, name, content):
+        file_path = self.preset_path(name)
+        preset_dir = os.path.dirname(file_path)
+        tmp_path = os.path.join(preset_dir, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(content, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self._load_entry_locked(name, file_path, os.stat(file_path))
+
+    def delete(self, name):
+        file_path = self.preset_path(name)
+        if not os.path.exists(file_path):
+            return False
+        os.remove(file_path)
+        with self._lock:
+            self._entries.pop(name, None)
+        return True
+
+LORA_PRESET_STORE = LoraPresetStore()
+
 @PromptServer.instance.routes.post("/ma/lora/save_preset")
 async def save_preset(request):
     try:
@@ -638,26 +2814,38 @@ async def save_preset(request):
         content = data.get("content")
         if not preset_name or not content: return web.json_response({"status": "error"})
         
-        file_path = os.path.join(get_preset_dir(), f"{preset_name}.json")
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(content, f, indent=4, ensure_ascii=False)
+        await run_lora_io(LORA_PRESET_STORE.save, preset_name, content)
         return web.json_response({"status": "success"})
+    except ValueError as e: return web.json_response({"status": "error", "message": str(e)}, status=400)
     except Exception as e: return web.json_response({"status": "error", "message": str(e)})
 
 @PromptServer.instance.routes.get("/ma/lora/get_presets")
 async def get_presets(request):
     try:
-        preset_dir = get_preset_dir()
-        files = [f for f in os.listdir(preset_dir) if f.endswith(".json")]
-        presets = {}
-        for f in files:
-            try:
-                with open(os.path.join(preset_dir, f), 'r', encoding='utf-8') as pf:
-                    presets[f.replace(".json", "")] = json.load(pf)
-            except: pass
-        return web.json_response({"presets": presets})
+        presets, etag = await run_lora_io(LORA_PRESET_STORE.get_all)
+        return etag_json_response(request, {"presets": presets}, etag)
     except Exception as e: return web.json_response({"presets": {}, "error": str(e)})
 
+@PromptServer.instance.routes.get("/ma/lora/preset_names")
+async def get_preset_names(request):
+    """只返回预设名称与 LoRA 数量，预设内容通过 /ma/lora/get_preset 按需读取"""
+    try:
+        names, etag = await run_lora_io(LORA_PRESET_STORE.list_names)
+        return etag_json_response(request, {"presets": names}, etag)
+    except Exception as e: return web.json_response({"presets": [], "error": str(e)})
+
+@PromptServer.instance.routes.get("/ma/lora/get_preset")
+async def get_preset(request):
+    try:
+        preset_name = request.query.get("name")
+        if not preset_name: return web.json_response({"status": "error", "message": "缺少预设名称"}, status=400)
+        content, etag = await run_lora_io(LORA_PRESET_STORE.get, preset_name)
+        if content is None:
+            return web.json_response({"status": "error", "message": "预设文件不存在"}, status=404)
+        return etag_json_response(request, {"status": "success", "preset": content}, etag)
+    except ValueError as e: return web.json_response({"status": "error", "message": str(e)}, status=400)
+    except Exception as e: return web.json_response({"status": "error", "message": str(e)})
+
 @PromptServer.instance.routes.post("/ma/lora/delete_preset")
 async def delete_preset(request):
     try:
@@ -665,14 +2853,11 @@ async def delete_preset(request):
         preset_name = data.get("name")
         if not preset_name: return web.json_response({"status": "error", "message": "缺少预设名称"})
         
-        preset_dir = get_preset_dir()
-        file_path = os.path.join(preset_dir, f"{preset_name}.json")
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if await run_lora_io(LORA_PRESET_STORE.delete, preset_name):
             return web.json_response({"status": "success", "message": f"预设 '{preset_name}' 已删除"})
         else:
             return web.json_response({"status": "error", "message": "预设文件不存在"})
+    except ValueError as e: return web.json_response({"status": "error", "message": str(e)}, status=400)
     except Exception as e: return web.json_response({"status": "error", "message": str(e)})
 
 # --- 爬取功能辅助函数 ---
@@ -686,94 +2871,566 @@ def clean_html(raw_html):
     text = re.sub(r'\n\s*\n', '\n', text).strip()
     return text
 
-def calculate_sha256(filepath):
-    """计算文件SHA256哈希值"""
+def calculate_sha256(filepath, chunk_size=8 * 1024 * 1024):
+    """计算文件SHA256哈希值（大块缓冲读取，复用同一块缓冲区）"""
     sha256 = hashlib.sha256()
-    chunk_size = 65536
-    with open(filepath, 'rb') as f:
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(filepath, 'rb', buffering=0) as f:
         while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
+            n = f.readinto(buffer)
+            if not n:
                 break
-            sha256.update(chunk)
+            sha256.update(view[:n])
     return sha256.hexdigest()
 
+class LoraHashIndex:
+    """
+    持久化的 LoRA 哈希索引（userdata/lora_hash_index.json）。
+    以 (路径, 大小, mtime_ns, inode) 判断文件是否变化，未变化的文件不会被重复哈希；
+    同时保存 AutoV2 短哈希（SHA256 前 10 位），供其他查询复用。
+    新哈希只标记为脏，由防抖定时器在 save_delay 秒后合并写入一次；批量同步结束和进程退出时也会 flush()。
+    """
+    def __init__(self, index_path, save_delay=2.0):
+        self.index_path = index_path
+        self.save_delay = save_delay
+        self._entries = None
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def _load_locked(self):
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path, 'r', encoding='utf-8') as f:
+                        self._entries = json.load(f)
+                except Exception as e:
+                    print(f"⚠️ [MagicPowerLora] 哈希索引读取失败，将重新建立: {e}")
+        return self._entries
+
+    def _mark_dirty_locked(self):
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """把未保存的改动写入磁盘；快照在锁内复制，JSON 序列化与写文件不占用索引锁"""
+        with self._save_lock:
+            with self._lock:
+                timer, self._timer = self._timer, None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                snapshot = dict(self._entries)
+            if timer is not None:
+                timer.cancel()
+            try:
+                MagicUtils.ensure_user_dir()
+                tmp_path = self.index_path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+            except Exception as e:
+                with self._lock:
+                    self._dirty = True
+                print(f"⚠️ [MagicPowerLora] 哈希索引保存失败: {e}")
+
+    @staticmethod
+    def _stat_key(st):
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+    def lookup(self, filepath):
+        """返回未过期的索引条目（含 sha256 / autov2），没有则返回 None"""
+        path = os.path.abspath(filepath)
+        stat_key = self._stat_key(os.stat(path))
+        with self._lock:
+            entry = self._load_locked().get(path)
+        if entry and all(entry.get(k) == v for k, v in stat_key.items()):
+            return entry
+        return None
+
+    def get_sha256(self, filepath):
+        entry = self.lookup(filepath)
+        if entry is not None:
+            return entry["sha256"]
+
+        path = os.path.abspath(filepath)
+        stat_key = self._stat_key(os.stat(path))
+        sha256 = calculate_sha256(path)
+        entry = dict(stat_key, sha256=sha256, autov2=sha256[:10].upper())
+        with self._lock:
+            self._load_locked()[path] = entry
+            self._mark_dirty_locked()
+        return sha256
+
+    def get_autov2(self, filepath):
+        self.get_sha256(filepath)
+        return self.lookup(filepath)["autov2"]
+
+    def forget(self, filepath):
+        with self._lock:
+            if self._load_locked().pop(os.path.abspath(filepath), None) is not None:
+                self._mark_dirty_locked()
+
+LORA_HASH_INDEX = LoraHashIndex(os.path.join(MagicUtils.USER_DIR, "lora_hash_index.json"))
+atexit.register(LORA_HASH_INDEX.flush)
+
+CIVITAI_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def get_civitai_api_base():
+    """Civitai API 根地址（可在 lora_perf_settings.json 中指向本地替身服务器做测试）"""
+    return str(_LORA_PERF.get("civitai_api_base") or "https://civitai.com/api/v1").rstrip("/")
+
+class CivitaiResponseCache:
+    """
+    Civitai API 响应的磁盘缓存（userdata/civitai_cache，每个 URL 一个 JSON 文件）。
+    - 未过期（TTL 内）直接返回，不发请求；过期后带 ETag / Last-Modified 做条件请求，304 时续期。
+    - 404 也会被缓存（负缓存，使用较短的 TTL），避免未收录的 LoRA 每次都去查。
+    - 以 URL 为键，因此同一模型的多个版本共享同一份 /models/{id} 文档。
+    - 内存层按条目数与字节数（序列化后的 JSON 大小）LRU 淘汰；磁盘层按总字节数淘汰最久未用的文件。
+    """
+    def __init__(self, cache_dir, ttl_seconds, negative_ttl_seconds, memory_entries=512,
+                 memory_bytes=64 * 1024 * 1024, disk_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl_seconds
+        self.negative_ttl = negative_ttl_seconds
+        self.memory_entries = memory_entries
+        self.memory_bytes = max(0, int(memory_bytes))
+        self.disk_bytes = max(0, int(disk_bytes))
+        self.memory_current = 0
+        self.disk_current = 0
+        self._memory = OrderedDict()  # url -> (entry, nbytes)
+        self._disk = None  # 文件名 -> 字节数（按最近使用排序），第一次需要时扫描目录建立
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _name(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json"
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, self._name(url))
+
+    def _remember_locked(self, url, entry, nbytes):
+        old = self._memory.pop(url, None)
+        if old is not None:
+            self.memory_current -= old[1]
+        # 单个响应就超过内存预算则只留在磁盘上
+        if nbytes > self.memory_bytes:
+            return
+        self._memory[url] = (entry, nbytes)
+        self.memory_current += nbytes
+        while self._memory and (len(self._memory) > self.memory_entries or self.memory_current > self.memory_bytes):
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self.memory_current -= evicted
+
+    def _disk_index_locked(self):
+        if self._disk is None:
+            files = []
+            if os.path.isdir(self.cache_dir):
+                for entry in os.scandir(self.cache_dir):
+                    if entry.name.endswith(".json") and entry.is_file():
+                        st = entry.stat()
+                        files.append((st.st_mtime_ns, entry.name, st.st_size))
+            self._disk = OrderedDict((name, size) for _, name, size in sorted(files))
+            self.disk_current = sum(self._disk.values())
+        return self._disk
+
+    def _account_disk_locked(self, name, nbytes):
+        """记录刚写入的文件大小，超出磁盘预算时删除最久未用的文件（包括单个就超预算的新文件）"""
+        disk = self._disk_index_locked()
+        self.disk_current += nbytes - disk.pop(name, 0)
+        disk[name] = nbytes
+        while disk and self.disk_current > self.disk_bytes:
+            old_name, old_bytes = disk.popitem(last=False)
+            self.disk_current -= old_bytes
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, old_name))
+            except OSError:
+                pass
+
+    def get(self, url):
+        """返回缓存条目（可能已过期，用于条件请求），没有则返回 None"""
+        with self._lock:
+            cached = self._memory.get(url)
+            if cached is not None:
+                self._memory.move_to_end(url)
+                return cached[0]
+        try:
+            with open(self._path(url), 'rb') as f:
+                raw = f.read()
+            entry = json.loads(raw.decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        with self._lock:
+            self._remember_locked(url, entry, len(raw))
+            if self._disk is not None and self._name(url) in self._disk:
+                self._disk.move_to_end(self._name(url))
+        return entry
+
+    def is_fresh(self, entry):
+        ttl = self.negative_ttl if entry.get("status") == 404 else self.ttl
+        return time.time() - entry.get("fetched_at", 0) < ttl
+
+    def lookup_fresh(self, url):
+        """命中未过期的缓存时返回 (True, body)，否则返回 (False, 过期条目或 None)"""
+        entry = self.get(url)
+        if entry is not None and self.is_fresh(entry):
+            self.hits += 1
+            return True, entry.get("body")
+        return False, entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry is not None and entry.get("status") == 200:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _write(self, url, entry):
+        data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            self._remember_locked(url, entry, len(data))
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(url)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ [MagicPowerLora] Civitai 缓存写入失败: {e}")
+            return
+        with self._lock:
+            self._account_disk_locked(self._name(url), len(data))
+
+    def store(self, url, status, body, etag=None, last_modified=None):
+        self.misses += 1
+        self._write(url, {"url": url, "status": status, "body": body, "fetched_at": time.time(),
+                          "etag": etag, "last_modified": last_modified})
+
+    def mark_revalidated(self, url, entry, etag=None, last_modified=None):
+        """条件请求返回 304：沿用旧内容并重置 TTL"""
+        self.revalidated += 1
+        entry = dict(entry, fetched_at=time.time(),
+                     etag=etag or entry.get("etag"), last_modified=last_modified or entry.get("last_modified"))
+        self._write(url, entry)
+        return entry.get("body")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.memory_current = 0
+            self._disk = None
+            self.disk_current = 0
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def get_stats(self):
+        with self._lock:
+            return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses,
+                    "evictions": self.evictions, "memory_entries": len(self._memory),
+                    "memory_bytes": self.memory_current, "max_memory_bytes": self.memory_bytes,
+                    "disk_bytes": self.disk_current if self._disk is not None else None,
+                    "max_disk_bytes": self.disk_bytes, "ttl_hours": self.ttl / 3600,
+                    "negative_ttl_hours": self.negative_ttl / 3600}
+
+CIVITAI_CACHE = CivitaiResponseCache(
+    os.path.join(MagicUtils.USER_DIR, "civitai_cache"),
+    float(_LORA_PERF.get("civitai_cache_ttl_hours", 168)) * 3600,
+    float(_LORA_PERF.get("civitai_negative_ttl_hours", 24)) * 3600,
+    memory_bytes=float(_LORA_PERF.get("civitai_cache_memory_mb", 64)) * 1024 * 1024,
+    disk_bytes=float(_LORA_PERF.get("civitai_cache_disk_mb", 512)) * 1024 * 1024,
+)
+
+def civitai_get_json(url, delay=0.0, timeout=30):
+    """
+    经过 CIVITAI_CACHE 的 GET 请求：返回解析后的 JSON，404 返回 None，其他 HTTP 错误照常抛出。
+    delay 仅在真正需要发请求时生效（命中缓存不等待）。
+    """
+    fresh, cached = CIVITAI_CACHE.lookup_fresh(url)
+    if fresh:
+        return cached
+    if delay > 0:
+        time.sleep(delay)
+    headers = dict(CIVITAI_HEADERS, **CIVITAI_CACHE.conditional_headers(cached))
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            body = json.loads(response.read().decode('utf-8'))
+            CIVITAI_CACHE.store(url, 200, body, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            return body
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached is not None:
+            return CIVITAI_CACHE.mark_revalidated(url, cached, e.headers.get("ETag"), e.headers.get("Last-Modified"))
+        if e.code == 404:
+            CIVITAI_CACHE.store(url, 404, None)
+            return None
+        raise
+
 def fetch_civitai_data_by_hash(hash_string, max_retries=3, api_delay=0.5):
-    """从Civitai API获取数据（带重试机制）"""
+    """从Civitai API获取数据（带重试机制与响应缓存）"""
+    api_base = get_civitai_api_base()
+    url = f"{api_base}/model-versions/by-hash/{hash_string}"
     for attempt in range(max_retries):
         try:
-            url = f"https://civitai.com/api/v1/model-versions/by-hash/{hash_string}"
-            if attempt > 0:
-                time.sleep(api_delay * (2 ** attempt))
-            else:
-                time.sleep(api_delay)
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req, timeout=30) as response:
-                if response.status == 200:
-                    data = json.loads(response.read().decode('utf-8'))
-                    model_url = f"https://civitai.com/api/v1/models/{data['modelId']}"
-                    model_req = urllib.request.Request(model_url, headers=headers)
-                    with urllib.request.urlopen(model_req, timeout=30) as model_response:
-                        if model_response.status == 200:
-                            data['model'] = json.loads(model_response.read().decode('utf-8'))
-                        else:
-                            data['model'] = {}
-                    return data
+            delay = api_delay * (2 ** attempt) if attempt > 0 else api_delay
+            version = civitai_get_json(url, delay=delay)
+            if version is None:
+                return None
+            # 浅拷贝，避免把 model 文档写进缓存中的版本数据
+            data = dict(version)
+            data['model'] = civitai_get_json(f"{api_base}/models/{data['modelId']}", delay=api_delay) or {}
+            return data
         except urllib.error.HTTPError as e:
             if e.code == 429:
                 time.sleep(api_delay * (2 ** attempt))
                 continue
-            elif e.code == 404:
-                return None
         except Exception as e:
             if attempt < max_retries - 1:
                 time.sleep(api_delay * (2 ** attempt))
     return None
 
+# 视频预览：先读取一小段前缀尝试解码第一帧，失败再按倍数继续读取，解码成功即停止下载
+VIDEO_PROBE_START_BYTES = 256 * 1024
+VIDEO_PROBE_MAX_BYTES = 32 * 1024 * 1024
+# moov 在尾部且服务器不支持 Range 时，剩余数据落盘到临时文件（不进内存），超过此上限直接放弃
+VIDEO_SPOOL_MAX_BYTES = 512 * 1024 * 1024
+VIDEO_EXTS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+def sniff_video(head):
+    """根据文件头判断是否为视频（MP4/MOV 的 ftyp box，或 WebM/MKV 的 EBML 头）"""
+    return head[4:8] == b"ftyp" or head[:4] == b"\x1a\x45\xdf\xa3"
+
+def mp4_tail_moov_offset(prefix):
+    """
+    解析 MP4 顶层 box：若 mdat 出现在 moov 之前（非 faststart 文件），返回 mdat 之后（即 moov 所在尾部）的偏移，
+    否则返回 None。这类文件必须拿到尾部的 moov 才能解码任何一帧。
+    """
+    offset = 0
+    while offset + 8 <= len(prefix):
+        size, box_type = struct.unpack(">I4s", bytes(prefix[offset:offset + 8]))
+        if size == 1:
+            if offset + 16 > len(prefix):
+                return None
+            size = struct.unpack(">Q", bytes(prefix[offset + 8:offset + 16]))[0]
+        elif size < 8:
+            return None
+        if box_type == b"moov":
+            return None
+        if box_type == b"mdat":
+            return offset + size
+        offset += size
+    return None
+
+class SparseVideoFile(io.RawIOBase):
+    """把 "已下载的前缀 + 尾部片段" 拼成一个可 seek 的只读文件，中间未下载的部分读作 0（供 PyAV 直接在内存中解码）"""
+    def __init__(self, prefix, tail_offset=None, tail=b""):
+        self.prefix = prefix
+        self.tail_offset = tail_offset if tail else len(prefix)
+        self.tail = tail or b""
+        self.size = self.tail_offset + len(self.tail)
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def readinto(self, b):
+        n = min(len(b), max(0, self.size - self.pos))
+        view = memoryview(b)
+        written = 0
+        while written < n:
+            pos = self.pos + written
+            if pos < len(self.prefix):
+                part = self.prefix[pos:pos + n - written]
+            elif pos >= self.tail_offset:
+                part = self.tail[pos - self.tail_offset:pos - self.tail_offset + n - written]
+            else:
+                part = bytes(min(n - written, self.tail_offset - pos))
+            view[written:written + len(part)] = part
+            written += len(part)
+        self.pos += n
+        return n
+
+def decode_video_file_first_frame(source):
+    """从文件路径或可 seek 的文件对象解码第一帧，返回 RGB ndarray；失败时返回 None"""
+    if AV_AVAILABLE:
+        try:
+            with av.open(source, mode="r") as container:
+                for frame in container.decode(video=0):
+                    return frame.to_ndarray(format="rgb24")
+        except Exception:
+            return None
+        return None
+    if CV2_AVAILABLE and isinstance(source, str):
+        try:
+            cap = cv2.VideoCapture(source)
+            try:
+                ret, frame = cap.read() if cap.isOpened() else (False, None)
+            finally:
+                cap.release()
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if ret else None
+        except Exception:
+            return None
+    return None
+
+def decode_first_video_frame(prefix, tail_offset=None, tail=b"", scratch_path=None):
+    """尝试从部分下载的数据中解码第一帧，返回 RGB ndarray；数据不足时返回 None"""
+    if AV_AVAILABLE:
+        return decode_video_file_first_frame(SparseVideoFile(prefix, tail_offset, tail))
+    if CV2_AVAILABLE and scratch_path:
+        # 无 PyAV 时退回 cv2：只把已下载的片段写进稀疏临时文件（中间空洞不占磁盘写入）
+        try:
+            with open(scratch_path, 'wb') as f:
+                f.write(prefix)
+                if tail:
+                    f.seek(tail_offset)
+                    f.write(tail)
+            return decode_video_file_first_frame(scratch_path)
+        except Exception:
+            return None
+        finally:
+            try:
+                os.remove(scratch_path)
+            except OSError:
+                pass
+    return None
+
+def spool_video_first_frame(response, prefix, total, scratch_path):
+    """
+    moov 在尾部且无法分段请求时，把前缀和剩余数据按块写入临时文件再解码，内存只保留一个块。
+    Content-Length 已超过 VIDEO_SPOOL_MAX_BYTES，或读取中超过上限，都直接放弃并返回 None。
+    """
+    if total and total > VIDEO_SPOOL_MAX_BYTES:
+        return None
+    try:
+        written = len(prefix)
+        with open(scratch_path, 'wb') as f:
+            f.write(prefix)
+            while True:
+                chunk = response.read(1024 * 1024)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > VIDEO_SPOOL_MAX_BYTES:
+                    return None
+                f.write(chunk)
+        return decode_video_file_first_frame(scratch_path)
+    except OSError as e:
+        print(f"⚠️ [MagicPowerLora] 视频临时文件写入失败 {scratch_path}: {e}")
+        return None
+    finally:
+        try:
+            os.remove(scratch_path)
+        except OSError:
+            pass
+
+def fetch_byte_range(url, headers, start, timeout=60):
+    """请求 [start, 文件末尾) 的字节；服务器不支持 Range（未返回 206）时返回 None"""
+    req = urllib.request.Request(url, headers=dict(headers, Range=f"bytes={start}-"))
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            if response.status == 206:
+                return response.read()
+    except Exception as e:
+        print(f"⚠️ [MagicPowerLora] 视频尾部分段请求失败 {url}: {e}")
+    return None
+
+def save_video_frame(frame, destination_path):
+    """把解码出的第一帧保存为图片（目标扩展名不是图片格式时改存为 .jpg）；frame 为 None 时返回 False"""
+    if frame is None:
+        return False
+    img_ext = os.path.splitext(destination_path)[1].lower()
+    if img_ext not in ['.png', '.jpg', '.jpeg', '.webp']:
+        destination_path = os.path.splitext(destination_path)[0] + '.jpg'
+    Image.fromarray(frame).save(destination_path)
+    return True
+
+def stream_video_first_frame(url, response, head, destination_path, headers):
+    """边下载边尝试解码第一帧，成功后立即停止读取剩余数据并保存为图片"""
+    total = int(response.getheader('Content-Length') or 0)
+    supports_range = response.getheader('Accept-Ranges', '').lower() == 'bytes'
+    scratch_path = destination_path + ".temp.mp4"
+    prefix = bytearray(head)
+    target = VIDEO_PROBE_START_BYTES
+    tail_offset, tail, tail_checked = None, b"", False
+    eof = False
+    while True:
+        while len(prefix) < target and not eof:
+            chunk = response.read(min(1024 * 1024, target - len(prefix)))
+            if not chunk:
+                eof = True
+            prefix += chunk
+        if total and len(prefix) >= total:
+            eof = True
+
+        if not tail_checked:
+            moov_offset = mp4_tail_moov_offset(prefix)
+            if moov_offset is not None and moov_offset > len(prefix):
+                tail_checked = True
+                if supports_range and total and moov_offset < total:
+                    tail = fetch_byte_range(url, headers, moov_offset) or b""
+                    tail_offset = moov_offset if tail else None
+                if not tail and not eof:
+                    # moov 在尾部且无法分段请求：剩余数据落盘解码，不在内存中缓冲整个文件
+                    frame = spool_video_first_frame(response, prefix, total, scratch_path)
+                    return save_video_frame(frame, destination_path)
+
+        frame = decode_first_video_frame(bytes(prefix), tail_offset, tail, scratch_path)
+        if frame is not None:
+            return save_video_frame(frame, destination_path)
+        if eof or len(prefix) >= VIDEO_PROBE_MAX_BYTES:
+            return False
+        target = min(target * 2, VIDEO_PROBE_MAX_BYTES)
+
 def download_file(url, destination_path):
-    """下载文件，如果是视频则提取第一帧"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    """下载文件，如果是视频则流式读取并提取第一帧"""
+    headers = CIVITAI_HEADERS
     try:
         req = urllib.request.Request(url, headers=headers)
         with urllib.request.urlopen(req, timeout=60) as response:
             if response.status == 200:
+                # 写入任何内容之前，先根据 Content-Type / URL / 文件头判断是否为视频
                 content_type = response.getheader('Content-Type', '')
-                is_video = content_type.startswith('video/') or url.lower().endswith(('.mp4', '.avi', '.mov', '.mkv'))
+                head = response.read(64 * 1024)
+                is_video = (content_type.startswith('video/') or url.lower().endswith(VIDEO_EXTS)
+                            or sniff_video(head))
                 
-                if is_video and CV2_AVAILABLE:
-                    video_path = destination_path + ".temp.mp4"
-                    with open(video_path, 'wb') as out_file:
-                        shutil.copyfileobj(response, out_file)
-                    
-                    cap = cv2.VideoCapture(video_path)
-                    if cap.isOpened():
-                        ret, frame = cap.read()
-                        if ret:
-                            img_ext = os.path.splitext(destination_path)[1].lower()
-                            if img_ext not in ['.png', '.jpg', '.jpeg', '.webp']:
-                                destination_path = os.path.splitext(destination_path)[0] + '.jpg'
-                            cv2.imwrite(destination_path, frame)
-                            cap.release()
-                            try:
-                                os.remove(video_path)
-                            except:
-                                pass
-                            return True
-                        cap.release()
-                    try:
-                        os.remove(video_path)
-                    except:
-                        pass
-                    return False
+                if is_video and (AV_AVAILABLE or CV2_AVAILABLE):
+                    return stream_video_first_frame(url, response, head, destination_path, headers)
                 else:
                     with open(destination_path, 'wb') as out_file:
+                        out_file.write(head)
                         shutil.copyfileobj(response, out_file)
                     return True
     except Exception as e:
@@ -799,117 +3456,90 @@ def extract_lora_weight_from_civitai_data(civitai_data, lora_filename):
         print(f"提取权重信息时出错: {e}")
         return None
 
-@PromptServer.instance.routes.post("/ma/lora/fetch_metadata")
-async def fetch_metadata(request):
-    """爬取LoRA元数据"""
-    try:
-        data = await request.json()
-        lora_name = data.get("lora_name")
-        options = data.get("options", {})
-        save_path_mode = data.get("save_path_mode", "same_dir")  # "same_dir" or "subfolder"
-        
-        if not lora_name:
-            return web.json_response({"status": "error", "message": "缺少lora_name参数"}, status=400)
-        
-        download_txt = options.get("download_txt", True)
-        download_json = options.get("download_json", True)
-        download_image = options.get("download_image", True)
-        download_log = options.get("download_log", True)
-        
-        lora_path = folder_paths.get_full_path("loras", lora_name)
-        if not lora_path or not os.path.exists(lora_path):
-            return web.json_response({"status": "error", "message": f"LoRA文件未找到: {lora_name}"}, status=404)
-        
-        lora_dir = os.path.dirname(lora_path)
-        lora_basename = os.path.splitext(os.path.basename(lora_path))[0]
-        
-        # 确定保存目录
-        if save_path_mode == "subfolder":
-            save_dir = os.path.join(lora_dir, "magicloradate")
-            os.makedirs(save_dir, exist_ok=True)
-        else:
-            save_dir = lora_dir
-        
-        # 计算哈希并获取Civitai数据
-        file_hash = calculate_sha256(lora_path)
-        civitai_data = fetch_civitai_data_by_hash(file_hash)
-        
-        result = {
-            "status": "success",
-            "message": [],
-            "data": {
-                "triggerWords": "",
-                "jsonInfo": "",
-                "logInfo": ""
-            }
-        }
-        
-        if not civitai_data:
-            result["message"].append("无法从Civitai获取此LoRA的信息（可能未上传或哈希不匹配）")
-            return web.json_response(result)
-        
-        model_name = civitai_data.get('model', {}).get('name', 'Unknown')
-        result["message"].append(f"已从Civitai获取到 '{model_name}' 的信息")
-        
-        # 保存触发词文件
-        if download_txt and civitai_data.get('trainedWords'):
-            words_content = ", ".join(civitai_data['trainedWords'])
-            txt_path = os.path.join(save_dir, f"{lora_basename}.txt")
-            try:
-                with open(txt_path, 'w', encoding='utf-8') as f:
-                    f.write(words_content)
-                result["data"]["triggerWords"] = words_content
-                result["message"].append("触发词已保存")
-            except Exception as e:
-                result["message"].append(f"触发词保存失败: {e}")
-        
-        # 保存介绍信息（JSON格式）
-        if download_json:
-            raw_model_desc = civitai_data.get('model', {}).get('description', '')
-            raw_version_desc = civitai_data.get('description', '')
-            model_desc = clean_html(raw_model_desc)
-            version_desc = clean_html(raw_version_desc)
-            base_model = civitai_data.get('baseModel', 'N/A')
-            model_id = civitai_data.get('modelId')
-            version_id = civitai_data.get('id')
-            civitai_link = f"https://civitai.com/models/{model_id}?modelVersionId={version_id}" if model_id and version_id else "链接不可用"
-            
-            json_content = (
-                f"--- 基础信息 ---\n"
-                f"基础模型: {base_model}\n"
-                f"C站链接: {civitai_link}\n\n"
-                f"--- 模型介绍 ---\n\n{model_desc if model_desc else '无模型介绍。'}\n\n"
-                f"--- 版本信息 ---\n\n{version_desc if version_desc else '无版本信息。'}\n"
-            )
-            json_path = os.path.join(save_dir, f"{lora_basename}.json")
-            try:
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    f.write(json_content)
-                result["data"]["jsonInfo"] = json_content
-                result["message"].append("介绍信息已保存")
-            except Exception as e:
-                result["message"].append(f"介绍信息保存失败: {e}")
-        
-        # 保存预览图像
-        if download_image and civitai_data.get('images'):
-            first_image = civitai_data['images'][0]
-            img_url = first_image.get('url')
-            if img_url:
-                img_ext = os.path.splitext(urllib.parse.urlparse(img_url).path)[1]
-                if not img_ext or img_ext.lower() not in ['.png', '.jpg', '.jpeg', '.webp']:
-                    img_ext = '.jpg'
-                img_path = os.path.join(save_dir, f"{lora_basename}{img_ext}")
-                if download_file(img_url, img_path):
-                    result["message"].append("预览图像已保存")
-                else:
-                    result["message"].append("预览图像保存失败")
+def resolve_metadata_save_dir(lora_path, save_path_mode):
+    """确定元数据保存目录（subfolder 模式下为 magicloradate 子目录）"""
+    lora_dir = os.path.dirname(lora_path)
+    if save_path_mode == "subfolder":
+        save_dir = os.path.join(lora_dir, "magicloradate")
+        os.makedirs(save_dir, exist_ok=True)
+        return save_dir
+    return lora_dir
+
+def save_lora_preview(civitai_data, save_dir, lora_basename):
+    """下载 Civitai 的第一张示例图作为预览图；没有可用图片时返回 None"""
+    if not civitai_data.get('images'):
+        return None
+    img_url = civitai_data['images'][0].get('url')
+    if not img_url:
+        return None
+    img_ext = os.path.splitext(urllib.parse.urlparse(img_url).path)[1]
+    if not img_ext or img_ext.lower() not in ['.png', '.jpg', '.jpeg', '.webp']:
+        img_ext = '.jpg'
+    img_path = os.path.join(save_dir, f"{lora_basename}{img_ext}")
+    return download_file(img_url, img_path)
+
+def save_civitai_metadata(lora_path, civitai_data, options, save_dir, result):
+    """
+    把 Civitai 数据写成 txt / json / 预览图 / log 附属文件，消息和内容写入 result。
+    options 中的 download_image 为 False 时跳过预览图（批量同步会单独并发下载）。
+    """
+    lora_basename = os.path.splitext(os.path.basename(lora_path))[0]
+    download_txt = options.get("download_txt", True)
+    download_json = options.get("download_json", True)
+    download_image = options.get("download_image", True)
+    download_log = options.get("download_log", True)
+
+    # 保存触发词文件
+    if download_txt and civitai_data.get('trainedWords'):
+        words_content = ", ".join(civitai_data['trainedWords'])
+        txt_path = os.path.join(save_dir, f"{lora_basename}.txt")
+        try:
+            with open(txt_path, 'w', encoding='utf-8') as f:
+                f.write(words_content)
+            result["data"]["triggerWords"] = words_content
+            result["message"].append("触发词已保存")
+        except Exception as e:
+            result["message"].append(f"触发词保存失败: {e}")
+    
+    # 保存介绍信息（JSON格式）
+    if download_json:
+        raw_model_desc = civitai_data.get('model', {}).get('description', '')
+        raw_version_desc = civitai_data.get('description', '')
+        model_desc = clean_html(raw_model_desc)
+        version_desc = clean_html(raw_version_desc)
+        base_model = civitai_data.get('baseModel', 'N/A')
+        model_id = civitai_data.get('modelId')
+        version_id = civitai_data.get('id')
+        civitai_link = f"https://civitai.com/models/{model_id}?modelVersionId={version_id}" if model_id and version_id else "链接不可用"
         
-        # 保存默认权重到.log文件
-        if download_log:
-            preferred_weight = extract_lora_weight_from_civitai_data(civitai_data, os.path.basename(lora_path))
-            if preferred_weight is not None:
-                log_path = os.path.join(save_dir, f"{lora_basename}.log")
-                log_content = f'''{{
+        json_content = (
+            f"--- 基础信息 ---\n"
+            f"基础模型: {base_model}\n"
+            f"C站链接: {civitai_link}\n\n"
+            f"--- 模型介绍 ---\n\n{model_desc if model_desc else '无模型介绍。'}\n\n"
+            f"--- 版本信息 ---\n\n{version_desc if version_desc else '无版本信息。'}\n"
+        )
+        json_path = os.path.join(save_dir, f"{lora_basename}.json")
+        try:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                f.write(json_content)
+            result["data"]["jsonInfo"] = json_content
+            result["message"].append("介绍信息已保存")
+        except Exception as e:
+            result["message"].append(f"介绍信息保存失败: {e}")
+    
+    # 保存预览图像
+    if download_image:
+        saved = save_lora_preview(civitai_data, save_dir, lora_basename)
+        if saved is not None:
+            result["message"].append("预览图像已保存" if saved else "预览图像保存失败")
+    
+    # 保存默认权重到.log文件
+    if download_log:
+        preferred_weight = extract_lora_weight_from_civitai_data(civitai_data, os.path.basename(lora_path))
+        if preferred_weight is not None:
+            log_path = os.path.join(save_dir, f"{lora_basename}.log")
+            log_content = f'''{{
 "description": "",
 "sd version": "",
 "activation text": "",
@@ -917,23 +3547,353 @@ async def fetch_metadata(request):
 "negative text": "",
 "notes": ""
 }}'''
-                try:
-                    with open(log_path, 'w', encoding='utf-8') as f:
-                        f.write(log_content)
-                    result["data"]["logInfo"] = log_content
-                    result["message"].append(f"默认权重已保存: {preferred_weight}")
-                except Exception as e:
-                    result["message"].append(f"默认权重保存失败: {e}")
-            else:
-                result["message"].append("未找到匹配的权重信息")
-        
-        result["message"] = "\n".join(result["message"])
+            try:
+                with open(log_path, 'w', encoding='utf-8') as f:
+                    f.write(log_content)
+                result["data"]["logInfo"] = log_content
+                result["message"].append(f"默认权重已保存: {preferred_weight}")
+            except Exception as e:
+                result["message"].append(f"默认权重保存失败: {e}")
+        else:
+            result["message"].append("未找到匹配的权重信息")
+    return result
+
+def new_metadata_result():
+    return {
+        "status": "success",
+        "message": [],
+        "data": {
+            "triggerWords": "",
+            "jsonInfo": "",
+            "logInfo": ""
+        }
+    }
+
+def _fetch_metadata_sync(data):
+    """爬取LoRA元数据（在 LORA_NET_EXECUTOR 中执行）"""
+    lora_name = data.get("lora_name")
+    options = data.get("options", {})
+    save_path_mode = data.get("save_path_mode", "same_dir")  # "same_dir" or "subfolder"
+    
+    if not lora_name:
+        return web.json_response({"status": "error", "message": "缺少lora_name参数"}, status=400)
+    
+    lora_path = folder_paths.get_full_path("loras", lora_name)
+    if not lora_path or not os.path.exists(lora_path):
+        return web.json_response({"status": "error", "message": f"LoRA文件未找到: {lora_name}"}, status=404)
+    
+    # 确定保存目录
+    save_dir = resolve_metadata_save_dir(lora_path, save_path_mode)
+    
+    # 计算哈希并获取Civitai数据
+    file_hash = LORA_HASH_INDEX.get_sha256(lora_path)
+    civitai_data = fetch_civitai_data_by_hash(file_hash)
+    
+    result = new_metadata_result()
+    
+    if not civitai_data:
+        result["message"].append("无法从Civitai获取此LoRA的信息（可能未上传或哈希不匹配）")
         return web.json_response(result)
-        
+    
+    model_name = civitai_data.get('model', {}).get('name', 'Unknown')
+    result["message"].append(f"已从Civitai获取到 '{model_name}' 的信息")
+    
+    save_civitai_metadata(lora_path, civitai_data, options, save_dir, result)
+    LORA_SEARCH_INDEX.invalidate()
+    
+    result["message"] = "\n".join(result["message"])
+    return web.json_response(result)
+
+@PromptServer.instance.routes.post("/ma/lora/fetch_metadata")
+async def fetch_metadata(request):
+    """爬取LoRA元数据"""
+    try:
+        data = await request.json()
+        return await run_lora_net(_fetch_metadata_sync, data)
     except Exception as e:
         print(f"爬取元数据时出错: {e}")
         return web.json_response({"status": "error", "message": f"服务器内部错误: {e}"}, status=500)
 
+# --- 批量元数据同步 ---
+
+class CivitaiLookupError(Exception):
+    """Civitai 查询在重试后仍失败（区别于 404 未收录）"""
+
+class AsyncRateLimiter:
+    """所有并发请求共享的速率限制器：保证相邻两次请求的发出间隔不小于 1/rate 秒"""
+    def __init__(self, rate_per_sec):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec and rate_per_sec > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds):
+        """收到 429 时整体推迟后续请求"""
+        self._next_time = max(self._next_time, asyncio.get_running_loop().time() + seconds)
+
+async def fetch_civitai_data_async(session, hash_string, limiter, api_base, max_retries=3, backoff=0.5, inflight=None):
+    """
+    fetch_civitai_data_by_hash 的异步版本；404 返回 None，多次失败抛出 CivitaiLookupError。
+    同样经过 CIVITAI_CACHE；传入 inflight 字典时，并发查询同一模型的多个版本只会发出一次 /models/{id} 请求。
+    """
+    loop = asyncio.get_running_loop()
+
+    async def get_json(url):
+        fresh, cached = await loop.run_in_executor(LORA_IO_EXECUTOR, CIVITAI_CACHE.lookup_fresh, url)
+        if fresh:
+            return cached
+        headers = dict(CIVITAI_HEADERS, **CIVITAI_CACHE.conditional_headers(cached))
+        for attempt in range(max_retries):
+            await limiter.acquire()
+            try:
+                async with session.get(url, headers=headers) as response:
+                    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                    if response.status == 200:
+                        body = await response.json(content_type=None)
+                        await loop.run_in_executor(LORA_IO_EXECUTOR, CIVITAI_CACHE.store, url, 200, body, etag, last_modified)
+                        return body
+                    if response.status == 304 and cached is not None:
+                        return await loop.run_in_executor(LORA_IO_EXECUTOR, CIVITAI_CACHE.mark_revalidated,
+                                                          url, cached, etag, last_modified)
+                    if response.status == 404:
+                        await loop.run_in_executor(LORA_IO_EXECUTOR, CIVITAI_CACHE.store, url, 404, None)
+                        return None
+                    if response.status == 429:
+                        limiter.penalize(backoff * (2 ** attempt))
+                        continue
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                pass
+            await asyncio.sleep(backoff * (2 ** attempt))
+        raise CivitaiLookupError(url)
+
+    async def get_json_shared(url):
+        if inflight is None:
+            return await get_json(url)
+        future = inflight.get(url)
+        if future is None:
+            future = inflight[url] = loop.create_task(get_json(url))
+            future.add_done_callback(lambda _: inflight.pop(url, None))
+        return await asyncio.shield(future)
+
+    version = await get_json(f"{api_base}/model-versions/by-hash/{hash_string}")
+    if version is None:
+        return None
+    data = dict(version)
+    try:
+        data['model'] = await get_json_shared(f"{api_base}/models/{data['modelId']}") or {}
+    except (CivitaiLookupError, KeyError):
+        data['model'] = {}
+    return data
+
+class LoraMetadataSyncJob:
+    """
+    批量同步整个 LoRA 库的 Civitai 元数据：
+    哈希在线程池中计算，Civitai 查询以有限并发 + 共享限速执行，预览图并发下载，
+    进度通过 PromptServer.send_sync("ma_lora_sync_progress") 推送。
+    已完成的条目记录在 userdata/lora_sync_state.json 中，resume 时跳过；cancel 后可随时续跑。
+    结束时（含取消）让搜索索引失效，并把本次写入过附属文件的 LoRA 同步进 LORA_CATALOG。
+    """
+    STATE_PATH = os.path.join(MagicUtils.USER_DIR, "lora_sync_state.json")
+    EVENT = "ma_lora_sync_progress"
+    DONE_STATUSES = ("synced", "not_found")
+
+    def __init__(self, lora_names, options, save_path_mode, resume=True):
+        self.options = dict(options or {})
+        self.save_path_mode = save_path_mode
+        self.params = {"options": self.options, "save_path_mode": save_path_mode}
+        self.done = self._load_state() if resume else {}
+        self.pending = [n for n in lora_names if n not in self.done]
+        self.total = len(lora_names)
+        self.counts = {"synced": 0, "not_found": 0, "error": 0, "skipped": self.total - len(self.pending)}
+        self.state = "pending"
+        self.current = None
+        self._task = None
+        self._dirty = 0
+        self._touched = set()  # 本次写入过附属文件的 LoRA
+
+    def _load_state(self):
+        try:
+            with open(self.STATE_PATH, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("params") == self.params:
+                return {k: v for k, v in state.get("done", {}).items() if v in self.DONE_STATUSES}
+        except Exception:
+            pass
+        return {}
+
+    def _save_state(self):
+        MagicUtils.ensure_user_dir()
+        tmp_path = self.STATE_PATH + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"params": self.params, "done": dict(self.done)}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.STATE_PATH)
+
+    def status(self):
+        finished = sum(self.counts.values())
+        return {"state": self.state, "total": self.total, "finished": finished,
+                "current": self.current, "counts": dict(self.counts)}
+
+    def _emit(self, lora_name=None, item_status=None, message=None):
+        payload = self.status()
+        if lora_name is not None:
+            payload.update({"lora_name": lora_name, "item_status": item_status, "message": message})
+        try:
+            PromptServer.instance.send_sync(self.EVENT, payload)
+        except Exception:
+            pass
+
+    async def _finish_item(self, loop, lora_name, item_status, message=None):
+        self.counts[item_status] += 1
+        if item_status in self.DONE_STATUSES:
+            self.done[lora_name] = item_status
+            self._dirty += 1
+            if self._dirty >= 20:
+                self._dirty = 0
+                await loop.run_in_executor(self._io_pool, self._save_state)
+        self._emit(lora_name, item_status, message)
+
+    def start(self):
+        self.state = "running"
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        hash_workers = max(1, int(_LORA_PERF.get("sync_hash_workers", 2)))
+        civitai_concurrency = max(1, int(_LORA_PERF.get("sync_civitai_concurrency", 4)))
+        download_concurrency = max(1, int(_LORA_PERF.get("sync_download_concurrency", 4)))
+        limiter = AsyncRateLimiter(float(_LORA_PERF.get("sync_civitai_rate", 2.0)))
+        api_base = get_civitai_api_base()
+
+        self._hash_pool = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix="ma_lora_hash")
+        self._io_pool = ThreadPoolExecutor(max_workers=download_concurrency + 1, thread_name_prefix="ma_lora_sync_io")
+        civitai_sem = asyncio.Semaphore(civitai_concurrency)
+        download_sem = asyncio.Semaphore(download_concurrency)
+        queue = asyncio.Queue()
+        for name in self.pending:
+            queue.put_nowait(name)
+        downloads = set()
+        model_requests = {}
+        sidecar_options = dict(self.options, download_image=False)
+
+        async def download_preview(lora_name, civitai_data, save_dir, lora_basename):
+            async with download_sem:
+                try:
+                    saved = await loop.run_in_executor(self._io_pool, save_lora_preview, civitai_data, save_dir, lora_basename)
+                except Exception as e:
+                    saved, message = False, str(e)
+                else:
+                    message = None if saved is not False else "预览图像保存失败"
+            await self._finish_item(loop, lora_name, "synced" if saved is not False else "error", message)
+
+        async def worker(session):
+            while not queue.empty():
+                lora_name = queue.get_nowait()
+                self.current = lora_name
+                try:
+                    lora_path = folder_paths.get_full_path("loras", lora_name)
+                    if not lora_path or not os.path.exists(lora_path):
+                        await self._finish_item(loop, lora_name, "error", "LoRA文件未找到")
+                        continue
+                    file_hash = await loop.run_in_executor(self._hash_pool, LORA_HASH_INDEX.get_sha256, lora_path)
+                    async with civitai_sem:
+                        civitai_data = await fetch_civitai_data_async(session, file_hash, limiter, api_base,
+                                                                      inflight=model_requests)
+                    if not civitai_data:
+                        await self._finish_item(loop, lora_name, "not_found")
+                        continue
+                    save_dir = await loop.run_in_executor(self._io_pool, resolve_metadata_save_dir, lora_path, self.save_path_mode)
+                    await loop.run_in_executor(self._io_pool, save_civitai_metadata,
+                                               lora_path, civitai_data, sidecar_options, save_dir, new_metadata_result())
+                    self._touched.add(lora_name)
+                    if self.options.get("download_image", True) and civitai_data.get('images'):
+                        lora_basename = os.path.splitext(os.path.basename(lora_path))[0]
+                        task = loop.create_task(download_preview(lora_name, civitai_data, save_dir, lora_basename))
+                        downloads.add(task)
+                        task.add_done_callback(downloads.discard)
+                    else:
+                        await self._finish_item(loop, lora_name, "synced")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await self._finish_item(loop, lora_name, "error", str(e))
+
+        try:
+            self._emit()
+            timeout = aiohttp.ClientTimeout(total=30)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                await asyncio.gather(*(worker(session) for _ in range(civitai_concurrency + hash_workers)))
+                while downloads:
+                    await asyncio.gather(*list(downloads))
+            self.state = "completed"
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+        except Exception as e:
+            print(f"❌ [MagicPowerLora] 批量同步出错: {e}")
+            self.state = "error"
+        finally:
+            for task in list(downloads):
+                task.cancel()
+            self._hash_pool.shutdown(wait=False, cancel_futures=True)
+            self._io_pool.shutdown(wait=False, cancel_futures=True)
+            self.current = None
+            LORA_HASH_INDEX.flush()
+            try:
+                self._save_state()
+            except Exception as e:
+                print(f"⚠️ [MagicPowerLora] 同步进度保存失败: {e}")
+            if self._touched:
+                LORA_SEARCH_INDEX.invalidate()
+                try:
+                    await loop.run_in_executor(LORA_IO_EXECUTOR, LORA_CATALOG.get_bulk, sorted(self._touched))
+                except Exception as e:
+                    print(f"⚠️ [MagicPowerLora] 同步后刷新附属文件目录失败: {e}")
+            self._emit()
+
+LORA_SYNC_JOB = None
+
+@PromptServer.instance.routes.post("/ma/lora/sync_start")
+async def sync_start(request):
+    """启动批量元数据同步；lora_names 为空时同步整个库，resume=true 时跳过上次已完成的条目"""
+    global LORA_SYNC_JOB
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    if LORA_SYNC_JOB is not None and LORA_SYNC_JOB.state == "running":
+        return web.json_response({"status": "error", "message": "已有同步任务在运行", "job": LORA_SYNC_JOB.status()}, status=409)
+    lora_names = data.get("lora_names") or await run_lora_io(folder_paths.get_filename_list, "loras")
+    job = LoraMetadataSyncJob(lora_names, data.get("options", {}), data.get("save_path_mode", "same_dir"),
+                              resume=data.get("resume", True))
+    LORA_SYNC_JOB = job
+    job.start()
+    return web.json_response({"status": "success", "job": job.status()})
+
+@PromptServer.instance.routes.post("/ma/lora/sync_cancel")
+async def sync_cancel(request):
+    if LORA_SYNC_JOB is None or LORA_SYNC_JOB.state != "running":
+        return web.json_response({"status": "error", "message": "没有正在运行的同步任务"})
+    LORA_SYNC_JOB.cancel()
+    return web.json_response({"status": "success"})
+
+@PromptServer.instance.routes.get("/ma/lora/sync_status")
+async def sync_status(request):
+    if LORA_SYNC_JOB is None:
+        return web.json_response({"state": "idle"})
+    return web.json_response(LORA_SYNC_JOB.status())
+
 @PromptServer.instance.routes.post("/ma/lora/probe_save_targets")
 async def probe_save_targets(request):
     """探测指定LoRA的保存位置可用性（优先检查magicloradate子目录）"""
@@ -991,51 +3951,185 @@ async def probe_save_targets(request):
         print(f"探测保存位置时出错: {e}")
         return web.json_response({"status": "error", "message": f"服务器内部错误: {e}"}, status=500)
 
+def _save_lora_file_sync(data):
+    """保存指定LoRA文件的内容（在 LORA_IO_EXECUTOR 中执行）"""
+    lora_name = data.get("lora_name") or data.get("lora_filename")
+    file_type = data.get("file_type", "txt")
+    content = data.get("content", "")
+    target = str(data.get("target", "same")).lower()
+    target = "magicloradate" if target == "magicloradate" or target == "subfolder" else "same"
+    
+    if not lora_name:
+        return web.json_response({"status": "error", "message": "缺少lora_name参数"}, status=400)
+    
+    lora_path = folder_paths.get_full_path("loras", lora_name)
+    if not lora_path or not os.path.exists(lora_path):
+        return web.json_response({"status": "error", "message": f"LoRA文件未找到: {lora_name}"}, status=404)
+    
+    lora_dir = os.path.dirname(lora_path)
+    lora_basename = os.path.splitext(os.path.basename(lora_path))[0]
+    
+    if file_type == "txt":
+        file_ext = ".txt"
+    elif file_type == "log":
+        file_ext = ".log"
+    else:
+        file_ext = ".json"
+    
+    if target == "magicloradate":
+        file_path = os.path.join(lora_dir, "magicloradate", f"{lora_basename}{file_ext}")
+    else:
+        file_path = os.path.join(lora_dir, f"{lora_basename}{file_ext}")
+    
+    # 自动创建目录（如果不存在）
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    LORA_SEARCH_INDEX.invalidate()
+    
+    return web.json_response({"status": "success", "message": f"{file_type}文件保存成功"})
+
 @PromptServer.instance.routes.post("/ma/lora/save_lora_file")
 async def save_lora_file(request):
     """保存指定LoRA文件的内容（支持保存到magicloradate子目录或同层级）"""
     try:
         data = await request.json()
-        lora_name = data.get("lora_name") or data.get("lora_filename")
-        file_type = data.get("file_type", "txt")
-        content = data.get("content", "")
-        target = str(data.get("target", "same")).lower()
-        target = "magicloradate" if target == "magicloradate" or target == "subfolder" else "same"
-        
-        if not lora_name:
-            return web.json_response({"status": "error", "message": "缺少lora_name参数"}, status=400)
-        
-        lora_path = folder_paths.get_full_path("loras", lora_name)
-        if not lora_path or not os.path.exists(lora_path):
-            return web.json_response({"status": "error", "message": f"LoRA文件未找到: {lora_name}"}, status=404)
-        
-        lora_dir = os.path.dirname(lora_path)
-        lora_basename = os.path.splitext(os.path.basename(lora_path))[0]
-        
-        if file_type == "txt":
-            file_ext = ".txt"
-        elif file_type == "log":
-            file_ext = ".log"
-        else:
-            file_ext = ".json"
-        
-        if target == "magicloradate":
-            file_path = os.path.join(lora_dir, "magicloradate", f"{lora_basename}{file_ext}")
-        else:
-            file_path = os.path.join(lora_dir, f"{lora_basename}{file_ext}")
-        
-        # 自动创建目录（如果不存在）
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        return web.json_response({"status": "success", "message": f"{file_type}文件保存成功"})
-        
+        return await run_lora_io(_save_lora_file_sync, data)
     except Exception as e:
         print(f"保存LoRA文件时出错: {e}")
         return web.json_response({"status": "error", "message": f"服务器内部错误: {e}"}, status=500)
 
+class LoraCatalog:
+    """
+    userdata/lora_catalog.db：把每个 LoRA 的 txt / json / log 附属文件（magicloradate 与同层级两个位置）镜像进 SQLite。
+    查询时按 (路径, mtime, 大小) 增量同步，只重新读取变化过的文件；
+    一次查询即可返回多个 LoRA 的全部附属内容以及各位置的存在情况。
+    """
+    FILE_TYPES = {"txt": ".txt", "json": ".json", "log": ".log"}
+    LOCATIONS = ("magicloradate", "same")
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def _connect_locked(self):
+        if self._conn is None:
+            MagicUtils.ensure_user_dir()
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sidecars (
+                    lora_name TEXT NOT NULL,
+                    file_type TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    readable INTEGER NOT NULL,
+                    content TEXT,
+                    PRIMARY KEY (lora_name, file_type, location)
+                )""")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _chunks(items, size=500):
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def _select_locked(self, conn, lora_names):
+        rows = {}
+        for chunk in self._chunks(lora_names):
+            placeholders = ",".join("?" * len(chunk))
+            for row in conn.execute(
+                    f"SELECT lora_name, file_type, location, path, mtime_ns, size, readable, content "
+                    f"FROM sidecars WHERE lora_name IN ({placeholders})", chunk):
+                rows[row[:3]] = row[3:]
+        return rows
+
+    def _sync_locked(self, conn, lora_names):
+        """把磁盘上的附属文件同步进数据库，返回 (同步后的行, 磁盘上存在的 LoRA 集合)"""
+        found = LORA_PREVIEW_INDEX.sidecar_locations(lora_names, tuple(self.FILE_TYPES.values()))
+        rows = self._select_locked(conn, lora_names)
+        upserts, seen = [], set()
+        for lora_name in lora_names:
+            sidecars = found.get(lora_name, {})
+            for file_type, ext in self.FILE_TYPES.items():
+                for location, path in sidecars.get(ext, {}).items():
+                    key = (lora_name, file_type, location)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    seen.add(key)
+                    old = rows.get(key)
+                    if old is not None and old[:3] == (path, st.st_mtime_ns, st.st_size):
+                        continue
+                    readable = os.access(path, os.R_OK)
+                    content = None
+                    if readable:
+                        try:
+                            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                                content = f.read()
+                            self.reads += 1
+                        except OSError:
+                            readable = False
+                    row = (path, st.st_mtime_ns, st.st_size, int(readable), content)
+                    rows[key] = row
+                    upserts.append(key + row)
+        deletes = [key for key in rows if key not in seen]
+        if upserts or deletes:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO sidecars VALUES (?, ?, ?, ?, ?, ?, ?, ?)", upserts)
+                conn.executemany("DELETE FROM sidecars WHERE lora_name = ? AND file_type = ? AND location = ?", deletes)
+            for key in deletes:
+                rows.pop(key, None)
+        return rows, set(found)
+
+    def get_bulk(self, lora_names, file_types=None):
+        """
+        返回 {LoRA: {"exists", "files": {类型: 内容}, "magicloradate_files": {类型: 可读}, "same_files": {类型: 可读}}}。
+        files 中的内容与 get_lora_file 一致：magicloradate 优先，其次同层级，不存在时为空字符串。
+        """
+        lora_names = list(dict.fromkeys(lora_names))
+        file_types = [t for t in (file_types or self.FILE_TYPES) if t in self.FILE_TYPES]
+        with self._lock:
+            conn = self._connect_locked()
+            rows, existing = self._sync_locked(conn, lora_names)
+
+        result = {}
+        for lora_name in lora_names:
+            if lora_name not in existing:
+                result[lora_name] = {"exists": False}
+                continue
+            entry = {"exists": True, "files": {}, "magicloradate_files": {}, "same_files": {}}
+            for file_type in file_types:
+                chosen = None
+                for location in self.LOCATIONS:
+                    row = rows.get((lora_name, file_type, location))
+                    entry[f"{location}_files"][file_type] = bool(row and row[3])
+                    if row is not None and chosen is None:
+                        chosen = row
+                entry["files"][file_type] = (chosen[4] or "") if chosen else ""
+            result[lora_name] = entry
+        return result
+
+    def forget(self, lora_name):
+        with self._lock:
+            conn = self._connect_locked()
+            with conn:
+                conn.execute("DELETE FROM sidecars WHERE lora_name = ?", (lora_name,))
+
+    def get_stats(self):
+        return {"file_reads": self.reads, "db_path": self.db_path}
+
+LORA_CATALOG = LoraCatalog(os.path.join(MagicUtils.USER_DIR, "lora_catalog.db"))
+
 @PromptServer.instance.routes.post("/ma/lora/get_lora_file")
 async def get_lora_file(request):
     """获取指定LoRA文件的内容（优先从magicloradate子目录读取）"""
@@ -1084,67 +4178,88 @@ async def get_lora_file(request):
         print(f"读取LoRA文件时出错: {e}")
         return web.json_response({"status": "error", "message": f"服务器内部错误: {e}"}, status=500)
 
+@PromptServer.instance.routes.post("/ma/lora/get_lora_files_bulk")
+async def get_lora_files_bulk(request):
+    """一次返回多个LoRA的 txt/json/log 内容及保存位置情况（由 LORA_CATALOG 增量同步）"""
+    try:
+        data = await request.json()
+        lora_names = data.get("lora_names") or []
+        if not isinstance(lora_names, list):
+            return web.json_response({"status": "error", "message": "lora_names 必须是列表"}, status=400)
+        files = await run_lora_io(LORA_CATALOG.get_bulk, lora_names, data.get("file_types"))
+        return web.json_response({"status": "success", "files": files})
+    except Exception as e:
+        print(f"批量读取LoRA文件时出错: {e}")
+        return web.json_response({"status": "error", "message": f"服务器内部错误: {e}"}, status=500)
+
+def _delete_lora_complete_sync(data):
+    """一键删除LoRA文件及其所有相关文件（在 LORA_IO_EXECUTOR 中执行）"""
+    lora_name = data.get("lora_name")
+    
+    if not lora_name:
+        return web.json_response({"status": "error", "message": "缺少lora_name参数"}, status=400)
+    
+    lora_path = folder_paths.get_full_path("loras", lora_name)
+    if not lora_path or not os.path.exists(lora_path):
+        return web.json_response({"status": "error", "message": f"LoRA文件未找到: {lora_name}"}, status=404)
+    
+    lora_dir = os.path.dirname(lora_path)
+    lora_basename = os.path.splitext(os.path.basename(lora_path))[0]
+    
+    deleted_files = []
+    
+    # 删除主LoRA文件
+    try:
+        os.remove(lora_path)
+        deleted_files.append(os.path.basename(lora_path))
+    except Exception as e:
+        return web.json_response({"status": "error", "message": f"无法删除主LoRA文件: {e}"}, status=500)
+    LORA_PREFIX_CACHE.invalidate(lora_name)
+    LORA_HASH_INDEX.forget(lora_path)
+    LORA_SEARCH_INDEX.invalidate()
+    LORA_CATALOG.forget(lora_name)
+    
+    # 删除同目录下的相关文件
+    for ext in ['.txt', '.json', '.log', '.png', '.jpg', '.jpeg', '.webp']:
+        file_path = os.path.join(lora_dir, f"{lora_basename}{ext}")
+        if os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+                deleted_files.append(os.path.basename(file_path))
+            except Exception as e:
+                print(f"删除文件时出错 {file_path}: {e}")
+    
+    # 删除magicloradate子文件夹中的文件
+    magicloradate_dir = os.path.join(lora_dir, "magicloradate")
+    if os.path.exists(magicloradate_dir):
+        import glob
+        pattern = os.path.join(magicloradate_dir, f"{lora_basename}.*")
+        for file_path in glob.glob(pattern):
+            try:
+                os.remove(file_path)
+                deleted_files.append(os.path.basename(file_path))
+            except Exception as e:
+                print(f"删除文件时出错 {file_path}: {e}")
+        
+        # 如果magicloradate目录为空，删除它
+        if os.path.exists(magicloradate_dir) and not os.listdir(magicloradate_dir):
+            try:
+                os.rmdir(magicloradate_dir)
+            except Exception as e:
+                print(f"删除空目录时出错: {e}")
+    
+    return web.json_response({
+        "status": "success",
+        "message": f"成功删除 {len(deleted_files)} 个文件",
+        "deleted_files": deleted_files
+    })
+
 @PromptServer.instance.routes.post("/ma/lora/delete_lora_complete")
 async def delete_lora_complete(request):
     """一键删除LoRA文件及其所有相关文件"""
     try:
         data = await request.json()
-        lora_name = data.get("lora_name")
-        
-        if not lora_name:
-            return web.json_response({"status": "error", "message": "缺少lora_name参数"}, status=400)
-        
-        lora_path = folder_paths.get_full_path("loras", lora_name)
-        if not lora_path or not os.path.exists(lora_path):
-            return web.json_response({"status": "error", "message": f"LoRA文件未找到: {lora_name}"}, status=404)
-        
-        lora_dir = os.path.dirname(lora_path)
-        lora_basename = os.path.splitext(os.path.basename(lora_path))[0]
-        
-        deleted_files = []
-        
-        # 删除主LoRA文件
-        try:
-            os.remove(lora_path)
-            deleted_files.append(os.path.basename(lora_path))
-        except Exception as e:
-            return web.json_response({"status": "error", "message": f"无法删除主LoRA文件: {e}"}, status=500)
-        
-        # 删除同目录下的相关文件
-        for ext in ['.txt', '.json', '.log', '.png', '.jpg', '.jpeg', '.webp']:
-            file_path = os.path.join(lora_dir, f"{lora_basename}{ext}")
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    deleted_files.append(os.path.basename(file_path))
-                except Exception as e:
-                    print(f"删除文件时出错 {file_path}: {e}")
-        
-        # 删除magicloradate子文件夹中的文件
-        magicloradate_dir = os.path.join(lora_dir, "magicloradate")
-        if os.path.exists(magicloradate_dir):
-            import glob
-            pattern = os.path.join(magicloradate_dir, f"{lora_basename}.*")
-            for file_path in glob.glob(pattern):
-                try:
-                    os.remove(file_path)
-                    deleted_files.append(os.path.basename(file_path))
-                except Exception as e:
-                    print(f"删除文件时出错 {file_path}: {e}")
-            
-            # 如果magicloradate目录为空，删除它
-            if os.path.exists(magicloradate_dir) and not os.listdir(magicloradate_dir):
-                try:
-                    os.rmdir(magicloradate_dir)
-                except Exception as e:
-                    print(f"删除空目录时出错: {e}")
-        
-        return web.json_response({
-            "status": "success",
-            "message": f"成功删除 {len(deleted_files)} 个文件",
-            "deleted_files": deleted_files
-        })
-        
+        return await run_lora_io(_delete_lora_complete_sync, data)
     except Exception as e:
         print(f"删除LoRA文件时出错: {e}")
         return web.json_response({"status": "error", "message": f"服务器内部错误: {e}"}, status=500)
\ No newline at end of file
@@ -0,0 +1,16 @@
+"""
+pytest 插件（在 pyproject.toml 中通过 -p 加载）。
+仓库根目录的 __init__.py 是 ComfyUI 插件入口，pytest 默认把根目录当作包并在执行测试前导入它，
+而那需要完整的 ComfyUI 宿主环境；这里让根目录按普通目录收集，节点模块由 tests/conftest.py 单独加载。
+"""
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_collect_directory(path, parent):
+    if str(path) == ROOT:
+        return pytest.Dir.from_parent(parent, path=path)
+    return None
@@ -0,0 +1,125 @@
+"""
+magic_power_lora 的测试夹具。
+ComfyUI 宿主模块（folder_paths / comfy.* / server）在测试环境中不存在，这里用最小替身代替，
+只覆盖插件导入与测试实际用到的接口；torch / aiohttp / PIL 缺失时整组测试跳过。
+"""
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Routes:
+    def get(self, path):
+        return lambda fn: fn
+
+    post = get
+
+
+def _install_host_stubs(lora_dir):
+    import torch
+
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.lora_dirs = [str(lora_dir)]
+
+    def get_folder_paths(name):
+        return list(folder_paths.lora_dirs)
+
+    def get_filename_list(name):
+        names = []
+        for root_dir in folder_paths.lora_dirs:
+            for dirpath, _, files in os.walk(root_dir):
+                for f in files:
+                    if f.endswith((".safetensors", ".pt")):
+                        names.append(os.path.relpath(os.path.join(dirpath, f), root_dir).replace("\\", "/"))
+        return sorted(set(names))
+
+    def get_full_path(name, filename):
+        for root_dir in folder_paths.lora_dirs:
+            path = os.path.join(root_dir, filename)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    folder_paths.get_folder_paths = get_folder_paths
+    folder_paths.get_filename_list = get_filename_list
+    folder_paths.get_full_path = get_full_path
+
+    comfy = types.ModuleType("comfy")
+    comfy.__path__ = []
+    comfy_utils = types.ModuleType("comfy.utils")
+    comfy_utils.load_calls = []
+
+    def load_torch_file(path, safe_load=False):
+        comfy_utils.load_calls.append(path)
+        return torch.load(path, weights_only=True)
+
+    comfy_utils.load_torch_file = load_torch_file
+    comfy_utils.save_torch_file = lambda sd, path, metadata=None: torch.save(sd, path)
+
+    comfy_model_management = types.ModuleType("comfy.model_management")
+    comfy_model_management.free_memory_bytes = 1 << 40
+    comfy_model_management.get_free_memory = lambda dev=None, torch_free_too=False: comfy_model_management.free_memory_bytes
+
+    weight_adapter = types.ModuleType("comfy.weight_adapter")
+    weight_adapter.__path__ = []
+    weight_adapter_lora = types.ModuleType("comfy.weight_adapter.lora")
+
+    class LoRAAdapter:
+        def __init__(self, loaded_keys, weights):
+            self.loaded_keys = loaded_keys
+            self.weights = weights
+
+    weight_adapter_lora.LoRAAdapter = LoRAAdapter
+    weight_adapter.lora = weight_adapter_lora
+    sys.modules["comfy.weight_adapter"] = weight_adapter
+    sys.modules["comfy.weight_adapter.lora"] = weight_adapter_lora
+    comfy.weight_adapter = weight_adapter
+
+    modules = {
+        "folder_paths": folder_paths,
+        "comfy": comfy,
+        "comfy.utils": comfy_utils,
+        "comfy.sd": types.ModuleType("comfy.sd"),
+        "comfy.lora": types.ModuleType("comfy.lora"),
+        "comfy.model_management": comfy_model_management,
+    }
+    for name, module in modules.items():
+        if "." in name:
+            setattr(comfy, name.split(".", 1)[1], module)
+        sys.modules[name] = module
+
+    server = types.ModuleType("server")
+    server.PromptServer = types.SimpleNamespace(
+        instance=types.SimpleNamespace(routes=_Routes(), send_sync=lambda *args, **kwargs: None))
+    sys.modules["server"] = server
+
+
+@pytest.fixture(scope="session")
+def mpl(tmp_path_factory):
+    """导入 nodes/magic_power_lora.py（宿主模块为替身，userdata 指向临时目录）"""
+    pytest.importorskip("torch")
+    pytest.importorskip("aiohttp")
+    pytest.importorskip("PIL")
+
+    root = tmp_path_factory.mktemp("comfy")
+    lora_dir = root / "loras"
+    lora_dir.mkdir()
+    _install_host_stubs(lora_dir)
+
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import utils
+    utils.MagicUtils.USER_DIR = str(root / "userdata")
+
+    spec = importlib.util.spec_from_file_location(
+        "magic_power_lora", os.path.join(ROOT, "nodes", "magic_power_lora.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["magic_power_lora"] = module
+    spec.loader.exec_module(module)
+    module.TEST_LORA_DIR = str(lora_dir)
+    return module
@@ -0,0 +1,142 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        _Handler.requests.append((self.path, dict(self.headers)))
+        if self.path == "/missing":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path == "/etag" and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        if self.path == "/modified" and self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/etag":
+            self.send_header("ETag", ETAG)
+        if self.path == "/modified":
+            self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    _Handler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _cache(mpl, tmp_path, ttl=3600, negative_ttl=600, **kwargs):
+    return mpl.CivitaiResponseCache(str(tmp_path / "civitai_cache"), ttl, negative_ttl, **kwargs)
+
+
+def test_entries_expire_after_ttl(mpl, tmp_path, monkeypatch):
+    cache = _cache(mpl, tmp_path, ttl=100, negative_ttl=10)
+    cache.store("u/ok", 200, {"id": 1})
+    cache.store("u/missing", 404, None)
+    now = mpl.time.time()
+
+    assert cache.lookup_fresh("u/ok") == (True, {"id": 1})
+    assert cache.lookup_fresh("u/missing") == (True, None)
+
+    # 负缓存使用更短的 TTL
+    monkeypatch.setattr(mpl.time, "time", lambda: now + 50)
+    assert cache.lookup_fresh("u/ok")[0] is True
+    fresh, stale = cache.lookup_fresh("u/missing")
+    assert not fresh and stale["status"] == 404
+
+    monkeypatch.setattr(mpl.time, "time", lambda: now + 200)
+    fresh, stale = cache.lookup_fresh("u/ok")
+    assert not fresh and stale["body"] == {"id": 1}
+
+
+@pytest.mark.parametrize("path", ["/etag", "/modified"])
+def test_stale_entry_is_revalidated_with_304(mpl, tmp_path, monkeypatch, server, path):
+    monkeypatch.setattr(mpl, "CIVITAI_CACHE", _cache(mpl, tmp_path, ttl=0))
+    url = server + path
+
+    assert mpl.civitai_get_json(url) == {"path": path}
+    assert mpl.civitai_get_json(url) == {"path": path}
+
+    assert len(_Handler.requests) == 2
+    headers = _Handler.requests[1][1]
+    if path == "/etag":
+        assert headers.get("If-None-Match") == ETAG
+    else:
+        assert headers.get("If-Modified-Since") == LAST_MODIFIED
+    stats = mpl.CIVITAI_CACHE.get_stats()
+    assert (stats["misses"], stats["revalidated"]) == (1, 1)
+
+
+def test_404_is_negatively_cached(mpl, tmp_path, monkeypatch, server):
+    monkeypatch.setattr(mpl, "CIVITAI_CACHE", _cache(mpl, tmp_path))
+    url = server + "/missing"
+
+    assert mpl.civitai_get_json(url) is None
+    assert mpl.civitai_get_json(url) is None
+
+    assert len(_Handler.requests) == 1
+    # 新实例（进程重启）从磁盘读到负缓存，同样不再请求
+    monkeypatch.setattr(mpl, "CIVITAI_CACHE", _cache(mpl, tmp_path))
+    assert mpl.civitai_get_json(url) is None
+    assert len(_Handler.requests) == 1
+
+
+def test_memory_and_disk_tiers_respect_byte_budgets(mpl, tmp_path):
+    body = {"blob": "x" * 1000}
+    one = len(json.dumps({"url": "u/0", "status": 200, "body": body, "fetched_at": 0.0,
+                          "etag": None, "last_modified": None}).encode("utf-8"))
+    cache = _cache(mpl, tmp_path, memory_bytes=one * 2.5, disk_bytes=one * 3.5)
+    for i in range(6):
+        cache.store(f"u/{i}", 200, body)
+
+    stats = cache.get_stats()
+    assert stats["memory_entries"] == 2
+    assert stats["memory_bytes"] <= stats["max_memory_bytes"]
+    assert stats["disk_bytes"] <= stats["max_disk_bytes"]
+    assert len(list((tmp_path / "civitai_cache").iterdir())) == 3
+    assert stats["evictions"] == 3
+
+    # 最早的响应已从两层中淘汰，最新的仍可从磁盘读回
+    fresh = _cache(mpl, tmp_path)
+    assert fresh.get("u/0") is None
+    assert fresh.get("u/5")["body"] == body
+
+
+def test_disk_budget_counts_files_left_by_previous_runs(mpl, tmp_path):
+    body = {"blob": "y" * 1000}
+    first = _cache(mpl, tmp_path)
+    for i in range(4):
+        first.store(f"u/{i}", 200, body)
+    one = (tmp_path / "civitai_cache" / first._name("u/0")).stat().st_size
+
+    second = _cache(mpl, tmp_path, disk_bytes=one * 2.5)
+    second.store("u/new", 200, body)
+    assert len(list((tmp_path / "civitai_cache").iterdir())) == 2
+    assert second.get("u/new")["body"] == body
@@ -0,0 +1,151 @@
+import gc
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+class _Adapter:
+    def __init__(self, up, down, alpha=None):
+        self.weights = (up, down, alpha, None)
+
+
+def _hook(mpl, dim=8):
+    model = torch.nn.Sequential(torch.nn.Linear(dim, dim))
+    hook = mpl.DynamicLoRAHook()
+    hook.build_index(model)
+    return hook
+
+
+def _loras(adapter, strength=1.0):
+    return [{"patches": {"diffusion_model.0.weight": adapter}, "strength": strength}]
+
+
+def test_compose_does_not_reuse_tensors_of_a_freed_adapter(mpl):
+    hook = _hook(mpl)
+    for value in (1.0, 2.0, 3.0):
+        # 旧适配器释放后新适配器可能拿到相同的 id()，组合结果仍必须来自新适配器
+        adapter = _Adapter(torch.full((8, 2), value), torch.ones(2, 8))
+        hook.applied = hook.compose(_loras(adapter))
+        del adapter
+        gc.collect()
+        _, lora_A, lora_B = hook.applied["0"]
+        assert torch.all(lora_B == value)
+
+
+def test_compose_reuses_unchanged_layers(mpl):
+    hook = _hook(mpl)
+    adapter = _Adapter(torch.randn(8, 2), torch.randn(2, 8))
+    hook.applied = hook.compose(_loras(adapter))
+    again = hook.compose(_loras(adapter))
+    assert again["0"] is hook.applied["0"]
+    assert again["0"][0][0][0] is adapter
+
+
+def test_composed_cache_counts_shared_buffer_bytes(mpl):
+    buffer = torch.zeros(1024)
+    composed = {
+        "a": ((), buffer[0:8].view(2, 4), buffer[8:16].view(4, 2)),
+        "b": ((), buffer[16:24].view(2, 4), buffer[24:32].view(4, 2)),
+    }
+    cache = mpl.ComposedLoRACache(1 << 20)
+    cache.put(1, (), composed)
+    # 视图只占 32 个元素，但整块 1024 元素的缓冲区都被它们拖住
+    assert cache.get_stats()["bytes"] == buffer.numel() * buffer.element_size()
+
+
+def test_composed_cache_stops_caching_when_vram_is_tight(mpl, monkeypatch):
+    free = {"bytes": 1 << 40}
+    monkeypatch.setattr(mpl, "_device_free_bytes", lambda device: free["bytes"])
+    cache = mpl.ComposedLoRACache(1 << 20, min_free_bytes=1 << 30)
+    composed = {"a": ((), torch.zeros(2, 4), torch.zeros(4, 2))}
+
+    cache.put(1, (), composed)
+    assert cache.get_stats()["entries"] == 1
+
+    free["bytes"] = 1 << 20
+    cache.put(2, (), {"a": ((), torch.zeros(2, 4), torch.zeros(4, 2))})
+    stats = cache.get_stats()
+    assert stats["entries"] == 0 and stats["bytes"] == 0
+    assert stats["pressure_skips"] == 1
+    assert cache.get(1, ()) is None
+
+
+def _factors(rank, dim_in, dim_out, seed):
+    g = torch.Generator().manual_seed(seed)
+    return torch.randn(rank, dim_in, generator=g), torch.randn(dim_out, rank, generator=g)
+
+
+def test_segmented_delta_matches_per_item_reference(mpl):
+    set_factors = [_factors(2, 6, 5, 1), _factors(4, 6, 5, 2), None]
+    set_index = torch.tensor([2, 0, 1, 1, 0])
+    x = torch.randn(5, 3, 6)
+
+    rank = 4
+    bank_A = torch.zeros(3, rank, 6)
+    bank_B = torch.zeros(3, 5, rank)
+    for i, f in enumerate(set_factors):
+        if f is not None:
+            r = f[0].shape[0]
+            bank_A[i, :r] = f[0]
+            bank_B[i, :, :r] = f[1]
+
+    out = mpl.segmented_lora_delta(x, bank_A, bank_B, set_index)
+    expected = mpl.reference_lora_delta_per_item(x, set_factors, set_index)
+    torch.testing.assert_close(out, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_batch_hook_matches_per_item_reference(mpl):
+    dim = 8
+    model = torch.nn.Sequential(torch.nn.Linear(dim, dim))
+    hook = mpl.DynamicLoRAHook()
+    hook.build_index(model)
+    adapters = [_Adapter(torch.randn(dim, r), torch.randn(r, dim)) for r in (2, 3)]
+    lora_sets = [_loras(adapters[0], 0.5), _loras(adapters[1], 1.5), []]
+    set_index = [1, 2, 0, 1]
+    x = torch.randn(4, 5, dim)
+    base = model(x)
+
+    hook.prepare_batch(model, lora_sets, set_index)
+    patched = model(x)
+
+    set_factors = [hook.compose_layer(hook.group_patches(s)["0"]) if s else None for s in lora_sets]
+    expected = mpl.reference_lora_delta_per_item(x, set_factors, torch.tensor(set_index))
+    torch.testing.assert_close(patched - base, expected, rtol=1e-4, atol=1e-4)
+
+
+def test_batch_hooks_are_removed_when_batch_mode_ends(mpl):
+    dim = 8
+    model = torch.nn.Sequential(torch.nn.Linear(dim, dim))
+    hook = mpl.DynamicLoRAHook()
+    adapter = _Adapter(torch.randn(dim, 2), torch.randn(2, dim))
+    x = torch.randn(2, dim)
+    base = model(x)
+
+    batch_opts = {"dynamic_lora_sets": [_loras(adapter), []], "dynamic_lora_set_index": [0, 1]}
+    hook.pre_forward(model, (x,), {"transformer_options": batch_opts})
+    assert len(model[0]._forward_hooks) == 1
+    assert not torch.allclose(model(x), base)
+
+    hook.pre_forward(model, (x,), {"transformer_options": {}})
+    assert len(model[0]._forward_hooks) == 0
+    assert hook.batch_banks == {} and hook.batch_index is None
+    torch.testing.assert_close(model(x), base)
+
+    # 再次进入批内模式时重新注册，且不会重复注册
+    hook.pre_forward(model, (x,), {"transformer_options": batch_opts})
+    hook.pre_forward(model, (x,), {"transformer_options": batch_opts})
+    assert len(model[0]._forward_hooks) == 1
+
+
+def test_batch_hook_rejects_batch_not_multiple_of_set_index(mpl):
+    dim = 8
+    model = torch.nn.Sequential(torch.nn.Linear(dim, dim))
+    hook = mpl.DynamicLoRAHook()
+    hook.build_index(model)
+    adapter = _Adapter(torch.randn(dim, 2), torch.randn(2, dim))
+    hook.prepare_batch(model, [_loras(adapter), []], [0, 1, 1])
+
+    assert model(torch.randn(6, dim)).shape == (6, dim)
+    with pytest.raises(ValueError, match="dynamic_lora_set_index"):
+        model(torch.randn(4, dim))
@@ -0,0 +1,67 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+def _factors(rows, cols, rank=2, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    up = torch.randint(-3, 4, (rows, rank), generator=g).to(torch.float32)
+    down = torch.randint(-3, 4, (rank, cols), generator=g).to(torch.float32) * 0.125
+    return up, down
+
+
+def _expected(mpl, weight, up, down, w_scale):
+    scale = mpl.normalize_weight_scale(w_scale, weight.shape[0], weight.shape[1])
+    return mpl.tiled_int8_lora_patch(weight, up, down, 1.0, scale, mpl.INT8_STOCHASTIC_SEED,
+                                     torch.device("cpu"), 1 << 20)
+
+
+def _adapter(mpl, up, down, weight_scale):
+    return mpl.INT8LoRAPatchAdapter(("k",), (up, down, None, None, None, None), weight_scale,
+                                    seed=mpl.INT8_STOCHASTIC_SEED)
+
+
+@pytest.mark.parametrize("scale_shape", [(24,), (24, 1), (24, 4)], ids=["channel", "channel_2d", "group"])
+def test_int8_adapter_full_layer_scales(mpl, scale_shape):
+    weight = torch.randint(-100, 100, (24, 16), dtype=torch.int8)
+    weight_scale = torch.rand(scale_shape) * 0.02 + 0.005
+    up, down = _factors(24, 16)
+
+    result = _adapter(mpl, up, down, weight_scale).calculate_weight(weight, "k", 1.0, 1.0, None, None)
+
+    assert torch.equal(result, _expected(mpl, weight, up, down, weight_scale))
+
+
+@pytest.mark.parametrize("scale_shape", [(24,), (24, 4)], ids=["channel", "group"])
+def test_int8_adapter_split_qkv_offset_narrows_scale(mpl, scale_shape):
+    full = torch.randint(-100, 100, (24, 16), dtype=torch.int8)
+    original = full.clone()
+    weight_scale = torch.rand(scale_shape) * 0.02 + 0.005
+    up, down = _factors(8, 16)
+    offset = (0, 8, 8)
+
+    # ComfyUI 先 narrow 权重，再调用适配器，之后继续使用整层权重
+    view = full.narrow(*offset)
+    _adapter(mpl, up, down, weight_scale).calculate_weight(view, "k", 1.0, 1.0, offset, None)
+
+    expected = _expected(mpl, original[8:16], up, down, weight_scale.narrow(*offset))
+    assert torch.equal(full[8:16], expected)
+    assert torch.equal(full[:8], original[:8]) and torch.equal(full[16:], original[16:])
+
+
+def test_int8_adapter_rejects_mismatched_scale(mpl):
+    weight = torch.zeros(8, 16, dtype=torch.int8)
+    up, down = _factors(8, 16)
+    with pytest.raises(ValueError, match="weight_scale"):
+        _adapter(mpl, up, down, torch.ones(10)).calculate_weight(weight, "k", 1.0, 1.0, None, None)
+    with pytest.raises(ValueError, match="offset"):
+        _adapter(mpl, up, down, torch.ones(12)).calculate_weight(weight, "k", 1.0, 1.0, (0, 8, 8), None)
+
+
+def test_narrow_weight_scale_keeps_broadcastable_scales(mpl):
+    assert mpl.narrow_weight_scale(0.5, (0, 8, 8), 16) == 0.5
+    per_input = torch.ones(16)
+    assert mpl.narrow_weight_scale(per_input, (0, 8, 8), 16) is per_input
+    row = torch.ones(1, 16)
+    assert mpl.narrow_weight_scale(row, (0, 8, 8), 16) is row
+    assert mpl.narrow_weight_scale(torch.arange(24.0), (0, 8, 8), 16).tolist() == list(range(8, 16))
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+class _Cache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.writes = []
+        self.written = threading.Event()
+
+    def write(self, path, tensors):
+        self.writes.append(dict(tensors))
+        self.written.set()
+
+
+def _store(mpl, max_bytes, layers):
+    cache = _Cache(max_bytes)
+    store = mpl.BakedINT8Store(cache, "bake.safetensors")
+    adapters = {}
+    for name in layers:
+        adapters[name] = object()
+        store.track(name, adapters[name], 1.0)
+    return cache, store, adapters
+
+
+def _layer():
+    return torch.zeros(16, 16, dtype=torch.int8)
+
+
+def test_bake_writes_once_every_layer_is_recorded(mpl):
+    cache, store, adapters = _store(mpl, 1 << 20, ["a", "b"])
+    store.record("a", adapters["a"], _layer())
+    assert not cache.written.is_set()
+    store.record("b", adapters["b"], _layer())
+    assert cache.written.wait(5)
+    assert sorted(cache.writes[0]) == ["a", "b"]
+
+
+def test_bake_stops_copying_past_the_cache_limit(mpl):
+    cache, store, adapters = _store(mpl, 300, ["a", "b", "c"])
+    store.record("a", adapters["a"], _layer())
+    store.record("b", adapters["b"], _layer())  # 256 + 256 > 300：放弃记录
+    store.record("c", adapters["c"], _layer())
+    store.flush()
+    assert store._recorded == {} and store._recorded_bytes == 0
+    assert not cache.written.wait(0.2)
+
+
+def test_bake_flushes_partial_coverage_when_a_layer_repeats(mpl):
+    cache, store, adapters = _store(mpl, 1 << 20, ["a", "b", "c"])
+    store.record("a", adapters["a"], _layer())
+    store.record("b", adapters["b"], _layer())
+    # lowvram 下 c 从未被补丁，下一轮又从 a 开始
+    store.record("a", adapters["a"], _layer())
+    assert cache.written.wait(5)
+    assert sorted(cache.writes[0]) == ["a", "b"]
+
+
+def test_bake_flush_writes_pending_layers(mpl):
+    cache, store, adapters = _store(mpl, 1 << 20, ["a", "b"])
+    store.record("a", adapters["a"], _layer())
+    store.flush()
+    assert cache.written.wait(5)
+    assert list(cache.writes[0]) == ["a"]
+    store.flush()
+    assert len(cache.writes) == 1
@@ -0,0 +1,73 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+def _layer(rows=96, cols=80, rank=4, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    weight = torch.randint(-128, 128, (rows, cols), generator=g, dtype=torch.int8)
+    # 整数值的 up/down 让 fp32 矩阵乘结果与求和顺序无关，分块与整层可以逐位比较
+    up = torch.randint(-3, 4, (rows, rank), generator=g).to(torch.float32)
+    down = torch.randint(-3, 4, (rank, cols), generator=g).to(torch.float32) * 0.125
+    weight_scale = torch.rand(rows, generator=g) * 0.02 + 0.005
+    return weight, up, down, weight_scale
+
+
+def _untiled(mpl, weight, up, down, scale, weight_scale, seed):
+    """整层计算的参考结果：一次性完成 up·down、随机舍入和 INT8 加法"""
+    delta = torch.mm(up, down) * scale
+    delta_int8 = mpl.stochastic_round_int8_delta(delta, weight_scale, seed)
+    return torch.clamp(weight.to(torch.int16) + delta_int8.to(torch.int16), -128, 127).to(torch.int8)
+
+
+@pytest.mark.parametrize("tile_rows", [1, 7, 32, 96])
+def test_tiled_patch_matches_untiled(mpl, tile_rows):
+    weight, up, down, weight_scale = _layer()
+    cols = weight.shape[1]
+    w_scale = mpl.normalize_weight_scale(weight_scale, weight.shape[0], cols)
+
+    tiled = mpl.tiled_int8_lora_patch(weight, up, down, 0.75, w_scale, 1234, torch.device("cpu"),
+                                      tile_bytes=tile_rows * cols * 40)
+    expected = _untiled(mpl, weight, up, down, 0.75, weight_scale, 1234)
+
+    assert tiled.dtype == torch.int8
+    assert torch.equal(tiled, expected)
+
+
+def test_tiled_patch_temporaries_stay_within_tile_budget(mpl, monkeypatch):
+    weight, up, down, weight_scale = _layer(rows=256, cols=64)
+    cols = weight.shape[1]
+    tile_bytes = 16 * cols * 40
+    largest = []
+    original = mpl.stochastic_round_int8_delta
+
+    def spy(x, *args, **kwargs):
+        largest.append(x.numel())
+        return original(x, *args, **kwargs)
+
+    monkeypatch.setattr(mpl, "stochastic_round_int8_delta", spy)
+    w_scale = mpl.normalize_weight_scale(weight_scale, weight.shape[0], cols)
+    mpl.tiled_int8_lora_patch(weight, up, down, 1.0, w_scale, 7, torch.device("cpu"), tile_bytes)
+
+    # 每个分块的临时张量按 ~40 字节/元素估算，分块元素数不能超过预算
+    assert len(largest) == 256 // 16
+    assert max(largest) * 40 <= tile_bytes
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="需要 CUDA 才能测量显存峰值")
+def test_tiled_patch_peak_cuda_memory_is_bounded(mpl):
+    weight, up, down, weight_scale = _layer(rows=4096, cols=4096, rank=16)
+    device = torch.device("cuda")
+    down = down.to(device)
+    w_scale = mpl.normalize_weight_scale(weight_scale, weight.shape[0], weight.shape[1])
+    tile_bytes = 16 * 1024 * 1024
+
+    torch.cuda.synchronize()
+    torch.cuda.reset_peak_memory_stats()
+    base = torch.cuda.memory_allocated()
+    mpl.tiled_int8_lora_patch(weight, up, down, 1.0, w_scale, 7, device, tile_bytes)
+    torch.cuda.synchronize()
+    peak = torch.cuda.max_memory_allocated() - base
+
+    # 整层 fp32 增量本身就有 64MB；分块后峰值应保持在分块预算的小倍数内
+    assert peak <= 2 * tile_bytes
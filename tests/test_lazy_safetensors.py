@@ -0,0 +1,74 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+safetensors_torch = pytest.importorskip("safetensors.torch")
+
+
+class _Model:
+    model_type = type("ModelType", (), {"name": "ModelType.EPS"})()
+
+
+def _write(tmp_path, name="lazy.safetensors"):
+    tensors = {
+        "lora_unet_a.lora_up.weight": torch.randn(32, 4),
+        "lora_unet_a.lora_down.weight": torch.randn(4, 32),
+        "lora_te_b.lora_up.weight": torch.randn(64, 4),
+    }
+    path = str(tmp_path / name)
+    safetensors_torch.save_file(tensors, path)
+    return path, tensors
+
+
+def test_only_accessed_tensors_are_materialized(mpl, tmp_path):
+    path, tensors = _write(tmp_path)
+    lora = mpl.LazySafetensorsDict(path)
+    try:
+        assert len(lora) == 3 and set(lora) == set(tensors)
+        assert "lora_te_b.lora_up.weight" in lora
+        assert lora.bytes_touched == 0 and lora._loaded == {}
+
+        up = lora["lora_unet_a.lora_up.weight"]
+        torch.testing.assert_close(up, tensors["lora_unet_a.lora_up.weight"])
+        assert lora["lora_unet_a.lora_up.weight"] is up
+        assert set(lora._loaded) == {"lora_unet_a.lora_up.weight"}
+        assert lora.bytes_touched == up.numel() * up.element_size()
+
+        with pytest.raises(KeyError):
+            lora["missing"]
+    finally:
+        lora.close()
+    assert lora._handle is None
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_patch_cache_closes_lazy_handle_after_patching(mpl, tmp_path, monkeypatch, fail):
+    path, tensors = _write(tmp_path)
+    seen = []
+
+    def load_lora(lora, key_map, log_missing=True):
+        seen.append(lora)
+        # 只读取 UNet 的键，文本编码器的张量不应被加载
+        patches = {k: ("lora", (lora[k],)) for k in lora if k.startswith("lora_unet_")}
+        if fail:
+            raise RuntimeError("load_lora failed")
+        return patches
+
+    monkeypatch.setattr(mpl.comfy.lora, "model_lora_keys_unet", lambda model, key_map: key_map, raising=False)
+    monkeypatch.setattr(mpl.comfy.lora, "load_lora", load_lora, raising=False)
+    cache = mpl.LoraPatchCache(max_entries=4, lazy_safetensors=True)
+    patcher = type("Patcher", (), {})()
+    patcher.model = _Model()
+
+    if fail:
+        with pytest.raises(RuntimeError):
+            cache.get_patch_dict(path, patcher)
+    else:
+        patch_dict = cache.get_patch_dict(path, patcher)
+        assert len(patch_dict) == 2
+        unet_bytes = sum(t.numel() * t.element_size() for k, t in tensors.items() if k.startswith("lora_unet_"))
+        assert cache.load_reports[path]["bytes_touched"] == unet_bytes
+
+    lazy, = seen
+    assert isinstance(lazy, mpl.LazySafetensorsDict)
+    assert lazy._handle is None
+    assert "lora_te_b.lora_up.weight" not in lazy._loaded
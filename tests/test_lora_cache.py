@@ -0,0 +1,182 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+def _write_lora(mpl, name, rank=4, dim=16):
+    path = os.path.join(mpl.TEST_LORA_DIR, name)
+    torch.save({
+        "lora_unet_layer.lora_up.weight": torch.randn(dim, rank),
+        "lora_unet_layer.lora_down.weight": torch.randn(rank, dim),
+        "lora_unet_layer.alpha": torch.tensor(float(rank)),
+    }, path)
+    return path
+
+
+def test_state_dict_cache_cold_load_reads_file_once(mpl):
+    import comfy.utils
+    path = _write_lora(mpl, "cold.pt")
+    cache = mpl.LoraStateDictCache(64 * 1024 * 1024)
+    calls_before = len(comfy.utils.load_calls)
+
+    first = cache.load(path)
+    second = cache.load(path)
+
+    assert set(first) == set(second)
+    assert torch.equal(first["lora_unet_layer.lora_up.weight"], second["lora_unet_layer.lora_up.weight"])
+    assert len(comfy.utils.load_calls) - calls_before == 1
+    stats = cache.get_stats()
+    assert (stats["misses"], stats["hits"], stats["entries"]) == (1, 1, 1)
+
+
+def test_state_dict_cache_reloads_modified_file(mpl):
+    path = _write_lora(mpl, "modified.pt")
+    cache = mpl.LoraStateDictCache(64 * 1024 * 1024)
+    cache.load(path)
+
+    _write_lora(mpl, "modified.pt", rank=8)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    reloaded = cache.load(path)
+
+    assert reloaded["lora_unet_layer.lora_up.weight"].shape[1] == 8
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_state_dict_cache_evicts_over_budget(mpl):
+    paths = [_write_lora(mpl, f"budget_{i}.pt", dim=64) for i in range(3)]
+    one = mpl._tensor_dict_nbytes(torch.load(paths[0], weights_only=True))
+    cache = mpl.LoraStateDictCache(one * 2)
+    for path in paths:
+        cache.load(path)
+
+    stats = cache.get_stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] == 1
+
+
+class _Model:
+    model_type = type("ModelType", (), {"name": "ModelType.EPS"})()
+
+
+def test_patch_cache_evicts_by_bytes(mpl, monkeypatch):
+    monkeypatch.setattr(mpl.comfy.lora, "model_lora_keys_unet", lambda model, key_map: key_map, raising=False)
+    monkeypatch.setattr(mpl.comfy.lora, "load_lora",
+                        lambda lora, key_map, log_missing=True: {k: ("lora", (v,)) for k, v in lora.items()},
+                        raising=False)
+    paths = [_write_lora(mpl, f"patch_{i}.pt", dim=64) for i in range(3)]
+    one = mpl._tensor_dict_nbytes(torch.load(paths[0], weights_only=True))
+    cache = mpl.LoraPatchCache(max_entries=32, lazy_safetensors=False, max_bytes=one * 2)
+    patcher = type("Patcher", (), {})()
+    patcher.model = _Model()
+
+    for path in paths:
+        cache.get_patch_dict(path, patcher)
+
+    stats = cache.get_stats()
+    assert stats["patch_dicts"] == 2
+    assert 0 < stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] == 1
+    cache.get_patch_dict(paths[-1], patcher)
+    assert cache.get_stats()["hits"] == 1
+
+
+class _Handle:
+    pass
+
+
+def test_prefix_cache_releases_outputs_when_input_dies(mpl):
+    import gc
+    cache = mpl.LoraPrefixCache(4)
+    model, clip = _Handle(), _Handle()
+    out_model, out_clip = _Handle(), _Handle()
+    out_ref = __import__("weakref").ref(out_model)
+    cache.store(model, clip, "none", [("a", 1.0, None)], out_model, out_clip)
+    assert cache.lookup(model, clip, "none", [("a", 1.0, None)])[0] == 1
+
+    del model, out_model
+    gc.collect()
+    assert out_ref() is None
+
+
+def test_last_output_does_not_keep_inputs_alive(mpl):
+    import gc
+    import weakref
+    model, clip, out_model = _Handle(), _Handle(), _Handle()
+    model_ref, out_ref = weakref.ref(model), weakref.ref(out_model)
+    holder = mpl.MagicPowerLoraLoader._remember_output("fp", model, clip, out_model, None)
+    assert holder[1]() is model and holder[3] is out_model
+
+    del model, out_model
+    gc.collect()
+    assert model_ref() is None and out_ref() is None
+    assert holder[3] is None
+
+
+def _keys(*entries):
+    return [(name, weight, stat) for name, weight, stat in entries]
+
+
+def test_prefix_cache_reuses_longest_prefix_after_tail_edit(mpl):
+    cache = mpl.LoraPrefixCache(8)
+    model, clip = _Handle(), _Handle()
+    stack = _keys(("a", 1.0, (10, 100)), ("b", 0.5, (20, 200)), ("c", 0.8, (30, 300)))
+    outputs = [(_Handle(), _Handle()) for _ in stack]
+    for n, (out_model, out_clip) in enumerate(outputs, 1):
+        cache.store(model, clip, "none", stack[:n], out_model, out_clip)
+
+    assert cache.lookup(model, clip, "none", stack) == (3, *outputs[2])
+    # 只改最后一个 LoRA 的权重：复用前两个的结果
+    edited = stack[:2] + _keys(("c", 0.3, (30, 300)))
+    assert cache.lookup(model, clip, "none", edited) == (2, *outputs[1])
+    # 追加新的 LoRA：复用整个已缓存的堆栈
+    appended = stack + _keys(("d", 1.0, (40, 400)))
+    assert cache.lookup(model, clip, "none", appended) == (3, *outputs[2])
+
+
+def test_prefix_cache_misses_when_an_earlier_entry_changes(mpl):
+    cache = mpl.LoraPrefixCache(8)
+    model, clip = _Handle(), _Handle()
+    stack = _keys(("a", 1.0, (10, 100)), ("b", 0.5, (20, 200)))
+    cache.store(model, clip, "none", stack[:1], _Handle(), _Handle())
+    cache.store(model, clip, "none", stack, _Handle(), _Handle())
+
+    strength = _keys(("a", 0.9, (10, 100))) + stack[1:]
+    mtime = _keys(("a", 1.0, (10, 101))) + stack[1:]
+    size = _keys(("a", 1.0, (11, 100))) + stack[1:]
+    for changed in (strength, mtime, size):
+        assert cache.lookup(model, clip, "none", changed) == (0, model, clip)
+    assert cache.lookup(model, clip, "stochastic", stack)[0] == 0
+    assert cache.lookup(model, _Handle(), "none", stack)[0] == 0
+    assert cache.get_stats()["misses"] == 5
+
+
+def test_apply_loras_only_reapplies_the_changed_tail(mpl, monkeypatch):
+    applied = []
+
+    def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
+        applied.append(strength_model)
+        return _Handle(), _Handle()
+
+    monkeypatch.setattr(mpl.comfy.sd, "load_lora_for_models", load_lora_for_models, raising=False)
+    monkeypatch.setattr(mpl, "LORA_PREFIX_CACHE", mpl.LoraPrefixCache(16))
+    names = [_write_lora(mpl, f"prefix_tail_{i}.pt") for i in range(3)]
+    model, clip = _Handle(), _Handle()
+
+    def run(weights):
+        del applied[:]
+        stack = [{"name": os.path.basename(path), "weight": w} for path, w in zip(names, weights)]
+        mpl.MagicPowerLoraLoader().apply_loras(model, clip, mpl.json.dumps(stack))
+        return list(applied)
+
+    assert run([1.0, 0.5, 0.8]) == [1.0, 0.5, 0.8]
+    assert run([1.0, 0.5, 0.3]) == [0.3]
+    assert run([0.9, 0.5, 0.3]) == [0.9, 0.5, 0.3]
+
+    # 前面的 LoRA 文件被覆盖（mtime 变化）时，整个堆栈重新应用
+    st = os.stat(names[0])
+    os.utime(names[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert run([0.9, 0.5, 0.3]) == [0.9, 0.5, 0.3]
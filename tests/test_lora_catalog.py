@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+
+class _Request:
+    def __init__(self, data=None):
+        self._data = data or {}
+        self.query = {}
+        self.headers = {}
+
+    async def json(self):
+        return self._data
+
+
+@pytest.fixture
+def library(mpl, tmp_path, monkeypatch):
+    import folder_paths
+    root = tmp_path / "loras"
+    (root / "magicloradate").mkdir(parents=True)
+    (root / "style.safetensors").write_bytes(b"\0")
+    (root / "magicloradate" / "style.txt").write_text("magic trigger", encoding="utf-8")
+    (root / "style.txt").write_text("same trigger", encoding="utf-8")
+    (root / "style.json").write_text('{"baseModel": "SDXL"}', encoding="utf-8")
+    monkeypatch.setattr(folder_paths, "lora_dirs", [str(root)])
+    monkeypatch.setattr(mpl, "LORA_PREVIEW_INDEX", mpl.LoraPreviewIndex())
+    catalog = mpl.LoraCatalog(str(tmp_path / "lora_catalog.db"))
+    monkeypatch.setattr(mpl, "LORA_CATALOG", catalog)
+    return root, catalog
+
+
+def _rows(catalog, lora_name):
+    with catalog._lock:
+        conn = catalog._connect_locked()
+        return sorted(conn.execute("SELECT file_type, location FROM sidecars WHERE lora_name = ?", (lora_name,)))
+
+
+def test_sidecars_are_mirrored_and_resynced_incrementally(mpl, library):
+    root, catalog = library
+    entry = catalog.get_bulk(["style.safetensors"])["style.safetensors"]
+    assert entry["exists"] is True
+    assert entry["files"] == {"txt": "magic trigger", "json": '{"baseModel": "SDXL"}', "log": ""}
+    assert entry["magicloradate_files"] == {"txt": True, "json": False, "log": False}
+    assert entry["same_files"] == {"txt": True, "json": True, "log": False}
+    assert _rows(catalog, "style.safetensors") == [("json", "same"), ("txt", "magicloradate"), ("txt", "same")]
+    reads = catalog.reads
+
+    # 未变化的文件不再读取
+    catalog.get_bulk(["style.safetensors"])
+    assert catalog.reads == reads
+
+    (root / "magicloradate" / "style.txt").write_text("edited trigger words", encoding="utf-8")
+    (root / "style.json").unlink()
+    entry = catalog.get_bulk(["style.safetensors"], ["txt", "json"])["style.safetensors"]
+    assert catalog.reads == reads + 1
+    assert entry["files"] == {"txt": "edited trigger words", "json": ""}
+    assert _rows(catalog, "style.safetensors") == [("txt", "magicloradate"), ("txt", "same")]
+
+
+def test_bulk_route_marks_missing_loras(mpl, library):
+    async def bulk(data):
+        return await mpl.get_lora_files_bulk(_Request(data))
+
+    response = asyncio.run(bulk({"lora_names": ["style.safetensors", "gone.safetensors", "style.safetensors"]}))
+    files = json.loads(response.text)["files"]
+    assert response.status == 200
+    assert list(files) == ["style.safetensors", "gone.safetensors"]
+    assert files["gone.safetensors"] == {"exists": False}
+    assert files["style.safetensors"]["files"]["txt"] == "magic trigger"
+
+    assert asyncio.run(bulk({"lora_names": "style.safetensors"})).status == 400
+
+
+def test_delete_lora_complete_removes_catalog_rows(mpl, library):
+    root, catalog = library
+    catalog.get_bulk(["style.safetensors"])
+    assert _rows(catalog, "style.safetensors")
+
+    response = asyncio.run(mpl.delete_lora_complete(_Request({"lora_name": "style.safetensors"})))
+    assert response.status == 200
+    assert _rows(catalog, "style.safetensors") == []
+    assert not os.path.exists(root / "magicloradate")
+    assert catalog.get_bulk(["style.safetensors"]) == {"style.safetensors": {"exists": False}}
+    assert _rows(catalog, "style.safetensors") == []
@@ -0,0 +1,27 @@
+import os
+
+
+def _touch(path, size, mtime):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_prune_fused_loras_evicts_least_recently_used(mpl, tmp_path):
+    for i, name in enumerate(["old", "mid", "new"]):
+        _touch(tmp_path / f"{name}.safetensors", 1000, 1_000_000 + i)
+    _touch(tmp_path / "writing.safetensors.tmp", 5000, 1)
+
+    removed = mpl.prune_fused_loras(str(tmp_path), 2000, keep=str(tmp_path / "new.safetensors"))
+
+    assert removed == 1
+    assert sorted(os.listdir(tmp_path)) == ["mid.safetensors", "new.safetensors", "writing.safetensors.tmp"]
+
+
+def test_prune_fused_loras_never_removes_kept_file(mpl, tmp_path):
+    _touch(tmp_path / "keep.safetensors", 3000, 1_000_000)
+    _touch(tmp_path / "other.safetensors", 1000, 2_000_000)
+
+    mpl.prune_fused_loras(str(tmp_path), 1000, keep=str(tmp_path / "keep.safetensors"))
+
+    assert os.listdir(tmp_path) == ["keep.safetensors"]
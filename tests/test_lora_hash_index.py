@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+import time
+
+
+def _files(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"lora_{i}.safetensors"
+        path.write_bytes(os.urandom(64))
+        paths.append(str(path))
+    return paths
+
+
+def test_hash_index_batches_saves_until_flush(mpl, tmp_path):
+    index_path = tmp_path / "index.json"
+    index = mpl.LoraHashIndex(str(index_path), save_delay=60)
+    paths = _files(tmp_path, 50)
+
+    for path in paths:
+        assert index.get_sha256(path) == hashlib.sha256(open(path, "rb").read()).hexdigest()
+    assert not index_path.exists()
+
+    index.flush()
+    saved = json.loads(index_path.read_text(encoding="utf-8"))
+    assert len(saved) == 50
+    assert index._timer is None
+
+
+def test_hash_index_debounced_save(mpl, tmp_path):
+    index_path = tmp_path / "index.json"
+    index = mpl.LoraHashIndex(str(index_path), save_delay=0.05)
+    path = _files(tmp_path, 1)[0]
+    index.get_sha256(path)
+
+    deadline = time.monotonic() + 5
+    while not index_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert os.path.abspath(path) in json.loads(index_path.read_text(encoding="utf-8"))
+
+    reloaded = mpl.LoraHashIndex(str(index_path))
+    assert reloaded.lookup(path)["autov2"] == index.get_autov2(path)
@@ -0,0 +1,74 @@
+import os
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+class _Handle:
+    pass
+
+
+def test_prefetcher_returns_results_in_stack_order(mpl):
+    jobs = [(f"lora_{i}", 1) for i in range(5)]
+    prefetcher = mpl.LoraPrefetcher(jobs, lambda path: path.upper(), lookahead=2, max_inflight_bytes=100)
+    try:
+        # 第 0 项由调用方自己加载，不预取
+        results = [prefetcher.wait(i) for i in range(len(jobs))]
+    finally:
+        prefetcher.close()
+    assert results == [None, "LORA_1", "LORA_2", "LORA_3", "LORA_4"]
+
+
+def test_prefetcher_bounds_inflight_bytes(mpl):
+    release = threading.Event()
+    started = []
+
+    def load(path):
+        started.append(path)
+        release.wait(5)
+        return path
+
+    jobs = [(f"lora_{i}", 10) for i in range(5)]
+    prefetcher = mpl.LoraPrefetcher(jobs, load, lookahead=4, max_inflight_bytes=25, max_workers=4)
+    try:
+        prefetcher.wait(0)
+        # 1、2 已提交（20 字节），再提交 3 会超过 25 字节上限
+        assert sorted(prefetcher._futures) == [1, 2]
+        assert prefetcher._inflight == 20
+
+        release.set()
+        assert prefetcher.wait(1) == "lora_1"
+        assert sorted(prefetcher._futures) == [2, 3]
+        assert prefetcher._inflight == 20
+        assert [prefetcher.wait(i) for i in (2, 3, 4)] == ["lora_2", "lora_3", "lora_4"]
+        assert prefetcher._inflight == 0
+    finally:
+        release.set()
+        prefetcher.close()
+
+
+def test_prefetched_lora_is_not_loaded_twice_when_cache_keeps_nothing(mpl, monkeypatch):
+    import comfy.utils
+    applied = []
+
+    def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
+        applied.append(sorted(lora))
+        return model, clip
+
+    monkeypatch.setattr(mpl.comfy.sd, "load_lora_for_models", load_lora_for_models, raising=False)
+    # 缓存预算为 0：预取结果无法留在 LORA_CACHE 中，只能直接交给应用函数
+    monkeypatch.setattr(mpl, "LORA_CACHE", mpl.LoraStateDictCache(0))
+    monkeypatch.setattr(mpl, "LORA_PREFIX_CACHE", mpl.LoraPrefixCache(0))
+    names = [f"prefetch_once_{i}.pt" for i in range(3)]
+    for i, name in enumerate(names):
+        torch.save({f"lora_unet_layer_{i}.alpha": torch.tensor(1.0)}, os.path.join(mpl.TEST_LORA_DIR, name))
+    stack = mpl.json.dumps([{"name": name, "weight": 1.0} for name in names])
+
+    calls_before = len(comfy.utils.load_calls)
+    mpl.MagicPowerLoraLoader().apply_loras(_Handle(), _Handle(), stack)
+
+    loaded = [os.path.basename(path) for path in comfy.utils.load_calls[calls_before:]]
+    assert sorted(loaded) == names
+    assert applied == [[f"lora_unet_layer_{i}.alpha"] for i in range(3)]
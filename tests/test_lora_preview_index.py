@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+
+class _Request:
+    def __init__(self, headers=None):
+        self.query = {}
+        self.headers = headers or {}
+
+
+def _settle(*dirs):
+    # 目录 mtime 必须早于 SETTLE_NS 才会被缓存；每次用不同的时间，保证修改后 mtime 一定变化
+    _settle.tick = getattr(_settle, "tick", 0) + 1
+    past = time.time_ns() - 60 * 10**9 - _settle.tick * 10**6
+    for d in dirs:
+        os.utime(d, ns=(past, past))
+
+
+@pytest.fixture
+def library(mpl, tmp_path, monkeypatch):
+    import folder_paths
+    root = tmp_path / "loras"
+    (root / "sub" / "magicloradate").mkdir(parents=True)
+    (root / "a.safetensors").write_bytes(b"\0")
+    (root / "sub" / "b.safetensors").write_bytes(b"\0")
+    (root / "sub" / "magicloradate" / "b.png").write_bytes(b"png")
+    _settle(root, root / "sub", root / "sub" / "magicloradate")
+    monkeypatch.setattr(folder_paths, "lora_dirs", [str(root)])
+    index = mpl.LoraPreviewIndex()
+    monkeypatch.setattr(mpl, "LORA_PREVIEW_INDEX", index)
+    return root, index
+
+
+def test_refresh_is_incremental_and_etag_is_stable(mpl, library):
+    root, index = library
+    images, etag = index.refresh()
+    assert images == {"sub/b.safetensors": "sub/b.png"}
+    scans = index.scans
+
+    assert index.refresh() == (images, etag)
+    assert index.scans == scans
+
+    # 新增预览图：只重新扫描发生变化的目录
+    (root / "a.png").write_bytes(b"png")
+    _settle(root)
+    images, new_etag = index.refresh()
+    assert images == {"a.safetensors": "a.png", "sub/b.safetensors": "sub/b.png"}
+    assert new_etag != etag
+    assert index.scans == scans + 1
+
+    # 删除预览图
+    (root / "sub" / "magicloradate" / "b.png").unlink()
+    _settle(root / "sub" / "magicloradate")
+    images, removed_etag = index.refresh()
+    assert images == {"a.safetensors": "a.png"}
+    assert removed_etag not in (etag, new_etag)
+
+    # 内容恢复到之前的状态时 ETag 也相同
+    (root / "sub" / "magicloradate" / "b.png").write_bytes(b"png")
+    _settle(root / "sub" / "magicloradate")
+    assert index.refresh()[1] == new_etag
+
+
+def test_images_route_answers_304_for_matching_etag(mpl, library):
+    root, index = library
+
+    async def get(headers=None):
+        return await mpl.get_lora_images(_Request(headers))
+
+    first = asyncio.run(get())
+    etag = first.headers["ETag"]
+    assert first.status == 200
+    assert json.loads(first.text) == {"sub/b.safetensors": "sub/b.png"}
+
+    cached = asyncio.run(get({"If-None-Match": etag}))
+    assert cached.status == 304 and cached.headers["ETag"] == etag
+
+    (root / "a.png").write_bytes(b"png")
+    _settle(root)
+    changed = asyncio.run(get({"If-None-Match": etag}))
+    assert changed.status == 200 and changed.headers["ETag"] != etag
+    assert "a.safetensors" in json.loads(changed.text)
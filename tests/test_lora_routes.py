@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+
+
+class _Request:
+    def __init__(self, data=None, query=None):
+        self._data = data or {}
+        self.query = query or {}
+        self.headers = {}
+
+    async def json(self):
+        return self._data
+
+
+def test_lora_list_stays_fast_during_metadata_fetches(mpl, monkeypatch):
+    name = "net_busy.safetensors"
+    with open(os.path.join(mpl.TEST_LORA_DIR, name), "wb") as f:
+        f.write(b"\0" * 16)
+
+    def slow_civitai(file_hash, *args, **kwargs):
+        time.sleep(0.5)  # 模拟网络请求与重试退避
+        return None
+
+    monkeypatch.setattr(mpl, "fetch_civitai_data_by_hash", slow_civitai)
+    monkeypatch.setattr(mpl.LORA_HASH_INDEX, "get_sha256", lambda path: "0" * 64)
+
+    async def scenario():
+        fetches = [asyncio.ensure_future(mpl.fetch_metadata(_Request({"lora_name": name}))) for _ in range(16)]
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        response = await mpl.get_lora_list(_Request())
+        elapsed = time.perf_counter() - start
+        results = await asyncio.gather(*fetches)
+        return response, elapsed, results
+
+    response, elapsed, results = asyncio.run(scenario())
+    assert response.status == 200 and name in response.text
+    assert elapsed < 0.25
+    assert all(r.status == 200 for r in results)
+
+
+def test_preset_store_round_trip(mpl):
+    store = mpl.LoraPresetStore()
+    store.save("my preset", {"folders": [{"loras": [{"name": "a"}]}]})
+    content, etag = store.get("my preset")
+    assert content["folders"][0]["loras"][0]["name"] == "a" and etag
+    assert store.delete("my preset")
+    assert store.get("my preset") == (None, None)
+
+
+def test_preset_names_cannot_escape_preset_dir(mpl, tmp_path):
+    import pytest
+    store = mpl.LoraPresetStore()
+    outside = os.path.join(os.path.dirname(mpl.get_preset_dir()), "secret.json")
+    with open(outside, "w") as f:
+        f.write("{}")
+
+    bad_names = ["../secret", "..", "a/../../secret", "..\\secret", "sub/x", ""]
+    if os.name == "nt":
+        bad_names.append("C:x")
+    for name in bad_names:
+        with pytest.raises(ValueError):
+            store.get(name)
+        with pytest.raises(ValueError):
+            store.save(name, {"folders": []})
+        with pytest.raises(ValueError):
+            store.delete(name)
+    assert os.path.exists(outside)
+
+    async def requests():
+        get = await mpl.get_preset(_Request(query={"name": "../secret"}))
+        delete = await mpl.delete_preset(_Request({"name": "../secret"}))
+        save = await mpl.save_preset(_Request({"name": "../secret", "content": {"x": 1}}))
+        return get, delete, save
+
+    assert [r.status for r in asyncio.run(requests())] == [400, 400, 400]
+    assert os.path.exists(outside)
+
+
+def test_existing_colon_named_preset_still_loads(mpl):
+    import pytest
+    if os.name == "nt":
+        pytest.skip("Windows 文件名不能含 ':'")
+    preset_dir = mpl.get_preset_dir()
+    os.makedirs(preset_dir, exist_ok=True)
+    with open(os.path.join(preset_dir, "SDXL: portrait.json"), "w", encoding="utf-8") as f:
+        f.write('{"folders": []}')
+
+    content, etag = mpl.LoraPresetStore().get("SDXL: portrait")
+    assert content == {"folders": []} and etag
+    response = asyncio.run(mpl.get_preset(_Request(query={"name": "SDXL: portrait"})))
+    assert response.status == 200
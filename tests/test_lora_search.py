@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+
+class _Request:
+    def __init__(self, query=None):
+        self.query = query or {}
+        self.headers = {}
+
+
+LIBRARY = {
+    "anime/Pixel-Art Style.safetensors": {".txt": "pixelart, retro", ".json": "基础模型: SDXL 1.0"},
+    "anime/pixie girl.safetensors": {".json": json.dumps({"baseModel": "SDXL 1.0"})},
+    "realistic/portrait-master.safetensors": {".json": json.dumps({"baseModel": "SD 1.5"})},
+    "realistic/cinematic pixels.safetensors": {".json": json.dumps({"baseModel": "SD 1.5"})},
+}
+
+
+@pytest.fixture
+def library(mpl, tmp_path, monkeypatch):
+    import folder_paths
+    root = tmp_path / "loras"
+    for name, sidecars in LIBRARY.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"\0" * 16)
+        for ext, content in sidecars.items():
+            path.with_suffix(ext).write_text(content, encoding="utf-8")
+    monkeypatch.setattr(folder_paths, "lora_dirs", [str(root)])
+    index = mpl.LoraSearchIndex(0)
+    monkeypatch.setattr(mpl, "LORA_SEARCH_INDEX", index)
+    return index
+
+
+def _search(mpl, **query):
+    response = asyncio.run(mpl.search_loras(_Request({k: str(v) for k, v in query.items()})))
+    return response.status, json.loads(response.text)
+
+
+def _names(result):
+    return [item["name"] for item in result["items"]]
+
+
+def test_exact_match_ranks_above_prefix(mpl, library):
+    status, result = _search(mpl, q="pixel")
+    assert status == 200
+    # "pixel" 完全匹配文件名优先，"pixels" 只是前缀匹配；"pixie" 不匹配
+    assert _names(result) == ["anime/Pixel-Art Style.safetensors", "realistic/cinematic pixels.safetensors"]
+    assert result["items"][0]["score"] > result["items"][1]["score"]
+    assert result["items"][0]["trigger_words"] == "pixelart, retro"
+
+
+def test_substring_and_fuzzy_matches(mpl, library):
+    _, result = _search(mpl, q="xel")
+    assert sorted(_names(result)) == ["anime/Pixel-Art Style.safetensors", "realistic/cinematic pixels.safetensors"]
+
+    # 拼写错误只能靠模糊匹配命中，得分低于精确匹配
+    _, fuzzy = _search(mpl, q="portrat")
+    assert _names(fuzzy) == ["realistic/portrait-master.safetensors"]
+    _, exact = _search(mpl, q="portrait")
+    assert fuzzy["items"][0]["score"] < exact["items"][0]["score"]
+
+
+def test_terms_are_anded_across_fields(mpl, library):
+    _, result = _search(mpl, q="pixel anime")
+    assert _names(result) == ["anime/Pixel-Art Style.safetensors"]
+    _, result = _search(mpl, q="sdxl girl")
+    assert _names(result) == ["anime/pixie girl.safetensors"]
+
+
+def test_facets_are_counted_before_filters(mpl, library):
+    _, result = _search(mpl, q="pixel", folder="anime")
+    assert result["total"] == 1
+    assert result["facets"]["folder"] == {"anime": 1, "realistic": 1}
+    assert result["facets"]["base_model"] == {"SDXL 1.0": 1, "SD 1.5": 1}
+
+    _, result = _search(mpl, base_model="SD 1.5")
+    assert result["total"] == 2
+    assert result["facets"]["base_model"] == {"SDXL 1.0": 2, "SD 1.5": 2}
+
+
+def test_pagination_bounds(mpl, library):
+    _, first = _search(mpl, page=1, page_size=3)
+    _, second = _search(mpl, page=2, page_size=3)
+    _, beyond = _search(mpl, page=9, page_size=3)
+    assert first["total"] == second["total"] == 4
+    assert len(first["items"]) == 3 and len(second["items"]) == 1 and beyond["items"] == []
+    assert set(_names(first) + _names(second)) == set(LIBRARY)
+
+    _, clamped = _search(mpl, page=0, page_size=100000)
+    assert (clamped["page"], clamped["page_size"]) == (1, mpl.SEARCH_MAX_PAGE_SIZE)
+    _, clamped = _search(mpl, page_size=0)
+    assert clamped["page_size"] == 1
+
+
+@pytest.mark.parametrize("query", [{"page": "abc"}, {"page_size": "1.5"}, {"page": -1}, {"page_size": -10}])
+def test_invalid_paging_returns_400(mpl, library, query):
+    status, result = _search(mpl, **query)
+    assert status == 400 and result["status"] == "error"
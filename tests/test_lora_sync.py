@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class _FakeCivitai:
+    """本地替身 HTTP 服务：只认识 known 中的哈希，其余返回 404，并记录每次请求的时间"""
+    current = None
+
+    def __init__(self, known, delay=0.0):
+        _FakeCivitai.current = self
+        self.known = known
+        self.delay = delay
+        self.requests = []
+        self.base = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/api/v1/model-versions/by-hash/{hash}", self.by_hash)
+        app.router.add_get("/api/v1/models/{model_id}", self.model)
+        return app
+
+    async def by_hash(self, request):
+        loop = asyncio.get_running_loop()
+        self.requests.append((loop.time(), request.match_info["hash"]))
+        await asyncio.sleep(self.delay)
+        name = self.known.get(request.match_info["hash"])
+        if name is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response({"id": 10, "modelId": 1, "trainedWords": [f"{name}_word"], "baseModel": "SDXL"})
+
+    async def model(self, request):
+        return web.json_response({"name": "Model", "description": "<p>desc</p>"})
+
+
+def _library(mpl, count):
+    lib_dir = os.path.join(mpl.TEST_LORA_DIR, "sync_lib")
+    os.makedirs(lib_dir, exist_ok=True)
+    names, known = [], {}
+    for i in range(count):
+        data = f"lora {i}".encode() * 8
+        name = f"sync_lib/item_{i}.safetensors"
+        with open(os.path.join(mpl.TEST_LORA_DIR, name), "wb") as f:
+            f.write(data)
+        names.append(name)
+        if i != 1:  # item_1 在 Civitai 上不存在
+            known[hashlib.sha256(data).hexdigest()] = f"item_{i}"
+    return names, known
+
+
+@pytest.fixture
+def sync_env(mpl, monkeypatch, tmp_path):
+    monkeypatch.setattr(mpl, "get_civitai_api_base", lambda: _FakeCivitai.current.base)
+    monkeypatch.setattr(mpl.LoraMetadataSyncJob, "STATE_PATH", str(tmp_path / "state.json"))
+    monkeypatch.setattr(mpl, "CIVITAI_CACHE", mpl.CivitaiResponseCache(str(tmp_path / "civitai"), 3600, 3600))
+    for key, value in {"sync_hash_workers": 1, "sync_civitai_concurrency": 1, "sync_civitai_rate": 20.0}.items():
+        monkeypatch.setitem(mpl._LORA_PERF, key, value)
+    return mpl
+
+
+def _run(civitai, scenario):
+    async def main():
+        server = TestServer(civitai.app())
+        await server.start_server()
+        civitai.base = str(server.make_url("/api/v1"))
+        try:
+            return await scenario()
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+
+def test_sync_rate_limit_404_and_catalog_refresh(sync_env):
+    mpl = sync_env
+    names, known = _library(mpl, 4)
+    civitai = _FakeCivitai(known)
+    options = {"download_image": False, "download_log": False}
+
+    async def scenario():
+        job = mpl.LoraMetadataSyncJob(names, options, "same_dir", resume=False)
+        await job.start()
+        return job
+
+    job = _run(civitai, scenario)
+
+    assert job.state == "completed"
+    assert job.counts["synced"] == 3 and job.counts["not_found"] == 1
+    times = sorted(t for t, _ in civitai.requests)
+    assert len(times) == 4
+    # 限速 20 次/秒：相邻请求至少间隔约 50ms
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.045
+    # 404 被负缓存
+    missing_hash = next(h for _, h in civitai.requests if h not in known)
+    fresh, body = mpl.CIVITAI_CACHE.lookup_fresh(f"{civitai.base}/model-versions/by-hash/{missing_hash}")
+    assert fresh and body is None
+    # 同步结束后目录已包含新写入的触发词
+    files = mpl.LORA_CATALOG.get_bulk([names[0]])[names[0]]
+    assert files["files"]["txt"] == "item_0_word"
+
+
+def test_sync_resumes_after_cancel(sync_env):
+    mpl = sync_env
+    names, known = _library(mpl, 4)
+    civitai = _FakeCivitai(known, delay=0.2)
+    options = {"download_image": False, "download_log": False, "download_json": False}
+
+    async def first_run():
+        job = mpl.LoraMetadataSyncJob(names, options, "same_dir", resume=False)
+        task = job.start()
+        while not job.done:
+            await asyncio.sleep(0.01)
+        job.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return job
+
+    first = _run(civitai, first_run)
+    assert first.state == "cancelled"
+    assert 0 < len(first.done) < len(names)
+    seen_first = len(civitai.requests)
+
+    async def second_run():
+        job = mpl.LoraMetadataSyncJob(names, options, "same_dir", resume=True)
+        await job.start()
+        return job
+
+    second = _run(civitai, second_run)
+    assert second.state == "completed"
+    assert second.counts["skipped"] == len(first.done)
+    assert set(second.done) == set(names)
+    # 已完成的条目不会再次查询
+    done_hashes = {hashlib.sha256(open(os.path.join(mpl.TEST_LORA_DIR, n), "rb").read()).hexdigest() for n in first.done}
+    assert not done_hashes & {h for _, h in civitai.requests[seen_first:]}
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _source(tmp_path, name="preview.png", color=(200, 10, 10)):
+    path = tmp_path / name
+    Image.new("RGB", (300, 200), color).save(path)
+    return str(path)
+
+
+def test_thumbnail_cleanup_keeps_other_formats_and_tmp_files(mpl, tmp_path):
+    service = mpl.LoraThumbnailService(str(tmp_path / "thumbs"), 1)
+    src = _source(tmp_path)
+    st = os.stat(src)
+    jpg_path = service._thumb_path(src, st, 256, "jpeg")
+    thumb_dir = os.path.dirname(jpg_path)
+    os.makedirs(thumb_dir)
+    keep = ["256_1.webp", "256_1.jpg.99.tmp", "2560_1.jpg", "128_1.jpg"]
+    for name in keep + ["256_1.jpg"]:
+        open(os.path.join(thumb_dir, name), "wb").close()
+
+    service._load(src, jpg_path, 256, "jpeg")
+
+    assert sorted(os.listdir(thumb_dir)) == sorted(keep + [os.path.basename(jpg_path)])
+
+
+def test_thumbnail_cache_evicts_least_recently_used(mpl, tmp_path):
+    service = mpl.LoraThumbnailService(str(tmp_path / "thumbs"), 1, max_bytes=1 << 30)
+    paths = []
+    for i in range(3):
+        src = _source(tmp_path, f"p{i}.png", (i * 60, 0, 0))
+        thumb = service._thumb_path(src, os.stat(src), 128, "jpeg")
+        service._load(src, thumb, 128, "jpeg")
+        os.utime(thumb, (1_000_000 + i, 1_000_000 + i))
+        paths.append(thumb)
+    sizes = [os.path.getsize(p) for p in paths]
+
+    # 上限刚好容纳后两个缩略图（淘汰到上限的 90%）
+    service.max_bytes = int((sizes[1] + sizes[2]) / 0.9) + 1
+    service._prune()
+
+    assert [os.path.exists(p) for p in paths] == [False, True, True]
+    assert not os.path.exists(os.path.dirname(paths[0]))
+    assert service.get_stats()["bytes"] == sizes[1] + sizes[2]
+    assert service.get_stats()["evictions"] == 1
@@ -0,0 +1,74 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+class _QuantLinear(torch.nn.Module):
+    def __init__(self, rows, cols, weight_scale, seed=0):
+        super().__init__()
+        g = torch.Generator().manual_seed(seed)
+        self.weight = torch.nn.Parameter(torch.randint(-128, 128, (rows, cols), generator=g, dtype=torch.int8),
+                                         requires_grad=False)
+        self.weight_scale = weight_scale
+        self._is_quantized = True
+
+
+def _model(seed=0, weight_scale=0.01):
+    model = torch.nn.Module()
+    model.block = torch.nn.Module()
+    model.block.proj = _QuantLinear(8, 16, weight_scale, seed)
+    model.block.norm = torch.nn.LayerNorm(16)
+    return model
+
+
+def test_model_hash_separates_finetunes_with_equal_scales(mpl):
+    a, b, a_copy = _model(seed=1), _model(seed=2), _model(seed=1)
+    hash_a = mpl.QuantizationIndex(a).model_hash()
+    assert hash_a != mpl.QuantizationIndex(b).model_hash()
+    assert hash_a == mpl.QuantizationIndex(a_copy).model_hash()
+
+
+def test_index_is_rebuilt_for_a_new_model_object(mpl):
+    import gc
+    model = _model()
+    index = mpl.QuantizationIndex.get(model)
+    assert mpl.QuantizationIndex.get(model) is index
+
+    # 结构完全相同的新模型对象（如重新加载的 checkpoint）得到新的索引
+    other = _model()
+    other_index = mpl.QuantizationIndex.get(other)
+    assert other_index is not index
+    assert other_index.lookup("block.proj").module is other.block.proj
+
+    count = len(mpl.QuantizationIndex._indexes)
+    del model, index
+    gc.collect()
+    assert len(mpl.QuantizationIndex._indexes) == count - 1
+
+
+def test_lookup_strips_prefix_and_reads_scalar_and_per_channel_scales(mpl):
+    scalar = mpl.QuantizationIndex.get(_model(weight_scale=0.02))
+    info = scalar.lookup("diffusion_model.block.proj")
+    assert info is scalar.lookup("block.proj")
+    assert info.quantized and info.weight_scale == 0.02
+    assert scalar.has_int8
+
+    per_channel = torch.rand(8, 1) + 0.5
+    model = _model(weight_scale=per_channel)
+    index = mpl.QuantizationIndex.get(model)
+    assert torch.equal(index.lookup("diffusion_model.block.proj").weight_scale, per_channel)
+    # weight_scale 读取模块上的当前值，模块更新 scale 后无需重建索引
+    model.block.proj.weight_scale = per_channel * 2
+    assert torch.equal(index.lookup("block.proj").weight_scale, per_channel * 2)
+
+    norm = index.lookup("diffusion_model.block.norm")
+    assert norm is not None and not norm.quantized
+    assert index.lookup("diffusion_model.block.missing") is None
+    assert index.lookup("diffusion_model.block") is None
+
+
+def test_float_model_is_not_int8(mpl):
+    model = torch.nn.Sequential(torch.nn.Linear(4, 4))
+    index = mpl.QuantizationIndex.get(model)
+    assert not index.has_int8
+    assert not index.lookup("0").quantized
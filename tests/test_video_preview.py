@@ -0,0 +1,107 @@
+import io
+import struct
+
+
+def _box(box_type, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _large_box(box_type, payload=b""):
+    return struct.pack(">I4sQ", 1, box_type, 16 + len(payload)) + payload
+
+
+class _Response:
+    def __init__(self, data, headers):
+        self.stream = io.BytesIO(data)
+        self.headers = headers
+        self.read_bytes = 0
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def read(self, n=-1):
+        chunk = self.stream.read(n)
+        self.read_bytes += len(chunk)
+        return chunk
+
+
+def test_sniff_video_recognises_mp4_and_webm_headers(mpl):
+    assert mpl.sniff_video(_box(b"ftyp", b"isom"))
+    assert mpl.sniff_video(b"\x1a\x45\xdf\xa3" + bytes(12))
+    assert not mpl.sniff_video(b"\x89PNG\r\n\x1a\n" + bytes(8))
+    assert not mpl.sniff_video(b"")
+
+
+def test_mp4_tail_moov_offset_detects_non_faststart_files(mpl):
+    ftyp = _box(b"ftyp", b"isom")
+    mdat = _box(b"mdat", bytes(100))
+    assert mpl.mp4_tail_moov_offset(ftyp + mdat) == len(ftyp) + len(mdat)
+    # mdat 尚未完整下载时也能根据 box 头算出 moov 的偏移
+    assert mpl.mp4_tail_moov_offset(ftyp + mdat[:16]) == len(ftyp) + len(mdat)
+    # faststart：moov 在 mdat 之前
+    assert mpl.mp4_tail_moov_offset(ftyp + _box(b"moov") + mdat) is None
+    # 64 位 size 的 mdat
+    large = _large_box(b"mdat", bytes(50))
+    assert mpl.mp4_tail_moov_offset(ftyp + large) == len(ftyp) + len(large)
+    assert mpl.mp4_tail_moov_offset(ftyp + large[:12]) is None
+    # 非法 size / 前缀过短
+    assert mpl.mp4_tail_moov_offset(struct.pack(">I4s", 4, b"ftyp")) is None
+    assert mpl.mp4_tail_moov_offset(b"\x00\x00") is None
+
+
+def test_sparse_video_file_reads_prefix_hole_and_tail(mpl):
+    f = mpl.SparseVideoFile(b"abcd", tail_offset=10, tail=b"XYZ")
+    assert f.size == 13
+    assert f.read() == b"abcd" + bytes(6) + b"XYZ"
+    assert f.read() == b""
+
+    f.seek(2)
+    assert f.read(4) == b"cd\x00\x00"
+    f.seek(-4, io.SEEK_END)
+    assert f.tell() == 9
+    assert f.read(10) == b"\x00XYZ"
+    f.seek(-100, io.SEEK_CUR)
+    assert f.tell() == 0
+
+    plain = mpl.SparseVideoFile(b"abcd")
+    assert plain.size == 4
+    assert io.BufferedReader(plain).read() == b"abcd"
+
+
+def test_stream_without_range_refuses_oversized_tail_moov(mpl, tmp_path, monkeypatch):
+    monkeypatch.setattr(mpl, "VIDEO_SPOOL_MAX_BYTES", 1024 * 1024)
+    data = _box(b"ftyp", b"isom") + _box(b"mdat", bytes(4 * 1024 * 1024)) + _box(b"moov")
+    response = _Response(data, {"Content-Length": str(len(data))})
+    head = response.read(64 * 1024)
+
+    dest = str(tmp_path / "preview.jpg")
+    assert mpl.stream_video_first_frame("http://x/v.mp4", response, head, dest, {}) is False
+    # 已知长度超过上限：不再继续下载，更不会把整个文件读进内存
+    assert response.read_bytes <= mpl.VIDEO_PROBE_START_BYTES
+    assert not list(tmp_path.iterdir())
+
+
+def test_stream_without_range_spools_to_disk_and_stops_at_cap(mpl, tmp_path, monkeypatch):
+    monkeypatch.setattr(mpl, "VIDEO_SPOOL_MAX_BYTES", 2 * 1024 * 1024)
+    spooled = []
+
+    def decode(source):
+        spooled.append(tmp_path.joinpath("preview.jpg.temp.mp4").stat().st_size)
+        return None
+
+    monkeypatch.setattr(mpl, "decode_video_file_first_frame", decode)
+    small = _box(b"ftyp", b"isom") + _box(b"mdat", bytes(1024 * 1024)) + _box(b"moov")
+    response = _Response(small, {})
+    head = response.read(64 * 1024)
+    dest = str(tmp_path / "preview.jpg")
+    assert mpl.stream_video_first_frame("http://x/v.mp4", response, head, dest, {}) is False
+    assert spooled == [len(small)]
+
+    # 长度未知：边读边落盘，超过上限立即放弃，不解码
+    big = _box(b"ftyp", b"isom") + _box(b"mdat", bytes(8 * 1024 * 1024)) + _box(b"moov")
+    response = _Response(big, {})
+    head = response.read(64 * 1024)
+    assert mpl.stream_video_first_frame("http://x/v.mp4", response, head, dest, {}) is False
+    assert spooled == [len(small)]
+    assert response.read_bytes <= mpl.VIDEO_SPOOL_MAX_BYTES + 1024 * 1024
+    assert not list(tmp_path.iterdir())
@@ -33,6 +33,35 @@ class MagicUtils:
         "presets": [512, 768, 832, 960, 1024, 1152, 1280, 1536, 2048],
         "dimensions": ["SDXL_1024x1024", "SD1.5_512x512"]
     }
+    # 强力LoRA加载器的性能相关设置（可在 userdata/lora_perf_settings.json 中覆盖）
+    DEFAULT_LORA_PERF = {
+        "state_dict_cache_mb": 4096,
+        "patch_dict_cache_entries": 32,
+        "patch_dict_cache_mb": 2048,
+        "lazy_safetensors": True,
+        "prefix_cache_entries": 16,
+        "prefetch_workers": 2,
+        "prefetch_lookahead": 2,
+        "prefetch_max_inflight_mb": 2048,
+        "dynamic_compose_cache_mb": 1024,
+        "cache_min_free_vram_mb": 1024,
+        "int8_tile_mb": 64,
+        "int8_bake_cache_mb": 0,
+        "fused_cache_mb": 4096,
+        "civitai_api_base": "https://civitai.com/api/v1",
+        "network_workers": 4,
+        "sync_hash_workers": 2,
+        "sync_civitai_concurrency": 4,
+        "sync_civitai_rate": 2.0,
+        "sync_download_concurrency": 4,
+        "civitai_cache_ttl_hours": 168,
+        "civitai_negative_ttl_hours": 24,
+        "civitai_cache_memory_mb": 64,
+        "civitai_cache_disk_mb": 512,
+        "thumbnail_workers": 2,
+        "thumbnail_cache_mb": 512,
+        "search_refresh_seconds": 5,
+    }
 
     @classmethod
     def ensure_user_dir(cls):
@@ -66,6 +95,8 @@ class MagicUtils:
     def get_resolutions_config(cls): return cls._load_dual_data("resolutions.txt", cls.DEFAULT_RESOLUTIONS)
     @classmethod
     def get_logic_config(cls): return cls._load_dual_data("logic_rules.json", cls.DEFAULT_LOGICS)
+    @classmethod
+    def get_lora_perf_config(cls): return cls._load_dual_data("lora_perf_settings.json", cls.DEFAULT_LORA_PERF)
 
 # --- API 路由 ---
 @PromptServer.instance.routes.get("/ma/get_config")
@@ -141,7 +141,12 @@ const loraLoaderTranslations = {
     "INT8 静态模式（Stochastic）": { zh: "INT8 静态模式（Stochastic）", en: "INT8 Static Mode (Stochastic)" },
     "使用随机舍入的 INT8 LoRA 适配器，适合单个或少量 LoRA，精度更高": { zh: "使用随机舍入的 INT8 LoRA 适配器，适合单个或少量 LoRA，精度更高", en: "Use stochastic rounding INT8 LoRA adapter, suitable for single or few LoRAs with higher precision" },
     "INT8 动态模式（Dynamic）": { zh: "INT8 动态模式（Dynamic）", en: "INT8 Dynamic Mode (Dynamic)" },
-    "运行时动态组合多个 LoRA，适合需要频繁切换或组合多个 LoRA 的场景": { zh: "运行时动态组合多个 LoRA，适合需要频繁切换或组合多个 LoRA 的场景", en: "Dynamically compose multiple LoRAs at runtime, suitable for scenarios requiring frequent switching or combining multiple LoRAs" }
+    "运行时动态组合多个 LoRA，适合需要频繁切换或组合多个 LoRA 的场景": { zh: "运行时动态组合多个 LoRA，适合需要频繁切换或组合多个 LoRA 的场景", en: "Dynamically compose multiple LoRAs at runtime, suitable for scenarios requiring frequent switching or combining multiple LoRAs" },
+    "LoRA 堆栈融合": { zh: "LoRA 堆栈融合", en: "LoRA Stack Fusion" },
+    "将多个 LoRA 合并为一个低秩 LoRA（SVD 降秩），减少补丁时间和动态模式的推理开销。融合结果会缓存到 userdata/fused_loras，下次直接加载。": { zh: "将多个 LoRA 合并为一个低秩 LoRA（SVD 降秩），减少补丁时间和动态模式的推理开销。融合结果会缓存到 userdata/fused_loras，下次直接加载。", en: "Merge multiple LoRAs into a single low-rank LoRA (SVD rank reduction) to cut patch time and dynamic-mode inference cost. Fused results are cached in userdata/fused_loras and reloaded directly next time." },
+    "不融合": { zh: "不融合", en: "No Fusion" },
+    "目标秩 (rank)": { zh: "目标秩 (rank)", en: "Target Rank" },
+    "能量阈值 (energy)": { zh: "能量阈值 (energy)", en: "Energy Threshold" }
 };
 
 // 节点翻译映射表 - Magic Logic Compute
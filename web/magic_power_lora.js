@@ -21,6 +21,17 @@ async function loadLoraImageList() {
 // 初始化时加载图片列表
 loadLoraImageList();
 
+// 一次请求读取多个LoRA的 txt/json/log 内容，返回 { loraName: { exists, files: { txt, json, log } } }
+async function fetchLoraFilesBulk(loraNames, fileTypes) {
+    const resp = await api.fetchApi('/ma/lora/get_lora_files_bulk', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ lora_names: loraNames, file_types: fileTypes })
+    });
+    const result = await resp.json();
+    return result.status === 'success' ? (result.files || {}) : {};
+}
+
 app.registerExtension({
     name: "Magic.Power.Lora",
     async beforeRegisterNodeDef(nodeType, nodeData, app) {
@@ -54,10 +65,22 @@ app.registerExtension({
                 int8ModeWidget.computeSize = () => [0, 0];
                 this._int8ModeWidget = int8ModeWidget;
 
+                // LoRA 堆栈融合设置（隐藏的 widget）
+                let fuseStackWidget = this.widgets.find(w => w.name === "fuse_stack");
+                if (!fuseStackWidget) {
+                    fuseStackWidget = this.addWidget("text", "fuse_stack", "none", () => {}, {});
+                }
+                fuseStackWidget.hidden = true;
+                fuseStackWidget.computeSize = () => [0, 0];
+                this._fuseStackWidget = fuseStackWidget;
+
                 // 初始化 INT8 模式（从属性中读取）
                 if (!this.int8Mode) {
                     this.int8Mode = this.properties["int8_mode"] || "none";
                 }
+                if (!this.fuseStack) {
+                    this.fuseStack = this.properties["fuse_stack"] || "none";
+                }
 
                 this._stackWidget = stackWidget;
                 this.size = [400, 600];
@@ -314,8 +337,17 @@ app.registerExtension({
                     this._int8ModeWidget.value = int8Mode;
                 }
                 
+                // 更新融合设置 widget
+                if (!this._fuseStackWidget) {
+                    this._fuseStackWidget = this.widgets?.find(w => w.name === "fuse_stack");
+                }
+                if (this._fuseStackWidget) {
+                    this._fuseStackWidget.value = this.fuseStack || this.properties["fuse_stack"] || "none";
+                }
+                
                 this.properties["lora_data_state"] = JSON.stringify(this.loraData);
                 this.properties["int8_mode"] = this.int8Mode || "none";
+                this.properties["fuse_stack"] = this.fuseStack || "none";
             };
 
             const onConfigure = nodeType.prototype.onConfigure;
@@ -334,8 +366,16 @@ app.registerExtension({
                         int8ModeWidget.hidden = true;
                         int8ModeWidget.computeSize = () => [0, 0];
                     }
+                    const fuseStackWidget = this.widgets.find(w => w.name === "fuse_stack");
+                    if (fuseStackWidget) {
+                        fuseStackWidget.hidden = true;
+                        fuseStackWidget.computeSize = () => [0, 0];
+                    }
                 }
                 
+                // 恢复融合设置
+                this.fuseStack = this.properties["fuse_stack"] || "none";
+                
                 // 恢复 INT8 模式设置
                 if (this.properties["int8_mode"]) {
                     this.int8Mode = this.properties["int8_mode"];
@@ -391,6 +431,10 @@ app.registerExtension({
                     this.int8Mode = this.widgets_values[3];
                     this.properties["int8_mode"] = this.int8Mode;
                 }
+                if (this.widgets_values && this.widgets_values.length > 4 && this.widgets_values[4]) {
+                    this.fuseStack = this.widgets_values[4];
+                    this.properties["fuse_stack"] = this.fuseStack;
+                }
                 setTimeout(() => { this.createDOMInterface(); this.renderEmbeddedList(); }, 100);
                 return r;
             };
@@ -1130,42 +1174,13 @@ app.registerExtension({
                 };
                 
                 try {
-                    // 并行读取三个文件
-                    const [txtResp, jsonResp, logResp] = await Promise.all([
-                        api.fetchApi('/ma/lora/get_lora_file', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ lora_filename: loraName, file_type: 'txt' })
-                        }).catch(() => null),
-                        api.fetchApi('/ma/lora/get_lora_file', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ lora_filename: loraName, file_type: 'json' })
-                        }).catch(() => null),
-                        api.fetchApi('/ma/lora/get_lora_file', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ lora_filename: loraName, file_type: 'log' })
-                        }).catch(() => null)
-                    ]);
-                    
-                    if (txtResp) {
-                        const txtData = await txtResp.json();
-                        if (txtData.status === 'success' && txtData.content) {
-                            fileContents.txt = txtData.content;
-                        }
-                    }
-                    if (jsonResp) {
-                        const jsonData = await jsonResp.json();
-                        if (jsonData.status === 'success' && jsonData.content) {
-                            fileContents.json = jsonData.content;
-                        }
-                    }
-                    if (logResp) {
-                        const logData = await logResp.json();
-                        if (logData.status === 'success' && logData.content) {
-                            fileContents.log = logData.content;
-                        }
+                    // 一次请求读取三个文件
+                    const bulk = await fetchLoraFilesBulk([loraName]);
+                    const entry = bulk[loraName];
+                    if (entry && entry.files) {
+                        fileContents.txt = entry.files.txt || '';
+                        fileContents.json = entry.files.json || '';
+                        fileContents.log = entry.files.log || '';
                     }
                 } catch (e) {
                     console.error("读取本地文件时出错:", e);
@@ -2178,6 +2193,7 @@ app.registerExtension({
                 const timestamp = new Date().getTime();
                 const safeName = encodeURIComponent(loraName);
                 const newImageUrl = api.apiURL(`/ma/lora/image?name=${safeName}&t=${timestamp}`);
+                const newThumbUrl = api.apiURL(`/ma/lora/image?name=${safeName}&size=256&t=${timestamp}`);
                 
                 // 刷新"添加Lora"窗口中的图片 - 直接查找所有卡片
                 const allCards = document.querySelectorAll('[title]');
@@ -2198,7 +2214,7 @@ app.registerExtension({
                             // 强制重新加载图片
                             const tempImg = new Image();
                             tempImg.onload = () => {
-                                img.src = newImageUrl;
+                                img.src = newThumbUrl;
                                 img.style.opacity = "1";
                                 if (spinner) {
                                     spinner.remove();
@@ -2206,12 +2222,12 @@ app.registerExtension({
                             };
                             tempImg.onerror = () => {
                                 // 即使加载失败也更新URL，让浏览器重新尝试
-                                img.src = newImageUrl;
+                                img.src = newThumbUrl;
                                 if (spinner) {
                                     spinner.remove();
                                 }
                             };
-                            tempImg.src = newImageUrl;
+                            tempImg.src = newThumbUrl;
                         }
                     }
                 });
@@ -2886,9 +2902,6 @@ app.registerExtension({
                     // 刷新全局图片列表缓存（类似参考代码的loadImageList）
                     await loadLoraImageList();
                     
-                    // 生成时间戳来强制刷新所有图片缓存
-                    const cacheTimestamp = new Date().getTime();
-                    
                     const resp = await api.fetchApi("/ma/lora/list");
                     const data = await resp.json();
                     const allFiles = data.files || [];
@@ -3248,8 +3261,8 @@ app.registerExtension({
                         spinner.className = "mpl-spinner"; 
                         imgBox.appendChild(spinner);
                             const safeName = encodeURIComponent(f);
-                            // 添加时间戳来强制刷新缓存
-                            img.src = api.apiURL(`/ma/lora/image?name=${safeName}&t=${cacheTimestamp}`);
+                            // 请求服务端缩略图；服务端带 ETag，未变化时浏览器直接用缓存
+                            img.src = api.apiURL(`/ma/lora/image?name=${safeName}&size=256`);
                             img.onload = () => { img.style.opacity = "1"; spinner.remove(); };
                             img.onerror = () => {
                                 img.style.display = "none"; spinner.remove();
@@ -3546,59 +3559,31 @@ app.registerExtension({
                             return null;
                         };
                         
-                        // 并行读取所有选中lora的.log文件，获取preferred weight
-                        const weightPromises = Array.from(selectedFiles).map(async (fileName) => {
-                            try {
-                                const response = await api.fetchApi('/ma/lora/get_lora_file', {
-                                    method: 'POST',
-                                    headers: { 'Content-Type': 'application/json' },
-                                    body: JSON.stringify({ lora_filename: fileName, file_type: 'log' })
-                                });
-                                const result = await response.json();
-                                if (result.status === 'success' && result.content) {
-                                    const preferredWeight = parsePreferredWeight(result.content);
-                                    return { fileName, preferredWeight };
-                                }
-                            } catch (e) {
-                                console.error(`读取${fileName}的log文件时出错:`, e);
-                            }
-                            return { fileName, preferredWeight: null };
-                        });
-                        
-                        const weightResults = await Promise.all(weightPromises);
+                        // 一次请求读取所有选中lora的.log（preferred weight）与.txt（触发词）
+                        let bulkFiles = {};
+                        try {
+                            bulkFiles = await fetchLoraFilesBulk(Array.from(selectedFiles), autoAddTag ? ['log', 'txt'] : ['log']);
+                        } catch (e) {
+                            console.error("批量读取lora文件时出错:", e);
+                        }
+                        const bulkContent = (fileName, type) => {
+                            const entry = bulkFiles[fileName];
+                            return (entry && entry.files && entry.files[type]) || '';
+                        };
                         
                         // 创建weight映射，方便查找
                         const weightMap = new Map();
-                        weightResults.forEach(({ fileName, preferredWeight }) => {
-                            weightMap.set(fileName, preferredWeight);
+                        selectedFiles.forEach(fileName => {
+                            const logContent = bulkContent(fileName, 'log');
+                            weightMap.set(fileName, logContent ? parsePreferredWeight(logContent) : null);
                         });
                         
-                        // 如果启用了自动添加触发词，需要先读取所有选中lora的.txt文件
+                        // 如果启用了自动添加触发词，使用读取到的.txt文件
                         if (autoAddTag) {
-                            // 并行读取所有选中lora的.txt文件
-                            const readPromises = Array.from(selectedFiles).map(async (fileName) => {
-                                try {
-                                    const response = await api.fetchApi('/ma/lora/get_lora_file', {
-                                        method: 'POST',
-                                        headers: { 'Content-Type': 'application/json' },
-                                        body: JSON.stringify({ lora_filename: fileName, file_type: 'txt' })
-                                    });
-                                    const result = await response.json();
-                                    if (result.status === 'success' && result.content) {
-                                        return { fileName, tags: result.content.trim() };
-                                    }
-                                } catch (e) {
-                                    console.error(`读取${fileName}的txt文件时出错:`, e);
-                                }
-                                return { fileName, tags: '' };
-                            });
-                            
-                            const tagResults = await Promise.all(readPromises);
-                            
                             // 创建tag映射，方便查找
                             const tagMap = new Map();
-                            tagResults.forEach(({ fileName, tags }) => {
-                                tagMap.set(fileName, tags);
+                            selectedFiles.forEach(fileName => {
+                                tagMap.set(fileName, bulkContent(fileName, 'txt').trim());
                             });
                             
                             // 添加lora，使用读取到的tags和preferred weight
@@ -3840,6 +3825,71 @@ app.registerExtension({
                 int8Section.appendChild(modeContainer);
                 
                 settingsContainer.appendChild(int8Section);
+                
+                // LoRA 堆栈融合设置区域
+                const currentFuse = this.fuseStack || this.properties["fuse_stack"] || "none";
+                const [currentFuseMode, currentFuseValue] = currentFuse.includes(":") ? currentFuse.split(":") : ["none", ""];
+                
+                const fuseSection = document.createElement("div");
+                fuseSection.style.cssText = "display: flex; flex-direction: column; gap: 12px;";
+                
+                const fuseTitle = document.createElement("div");
+                fuseTitle.textContent = "LoRA 堆栈融合";
+                fuseTitle.style.cssText = `
+                    font-size: 14px;
+                    font-weight: 600;
+                    color: #fff;
+                    margin-bottom: 8px;
+                `;
+                
+                const fuseDesc = document.createElement("div");
+                fuseDesc.textContent = "将多个 LoRA 合并为一个低秩 LoRA（SVD 降秩），减少补丁时间和动态模式的推理开销。融合结果会缓存到 userdata/fused_loras，下次直接加载。";
+                fuseDesc.style.cssText = `
+                    font-size: 12px;
+                    color: #aaa;
+                    margin-bottom: 12px;
+                    line-height: 1.5;
+                `;
+                
+                const fuseRow = document.createElement("div");
+                fuseRow.style.cssText = "display: flex; align-items: center; gap: 10px; padding: 8px; background: #333; border-radius: 4px;";
+                const fuseModeSelect = document.createElement("select");
+                fuseModeSelect.style.cssText = "flex: 1; background: #222; color: #eee; border: 1px solid #555; border-radius: 4px; padding: 4px;";
+                [["none", "不融合"], ["rank", "目标秩 (rank)"], ["energy", "能量阈值 (energy)"]].forEach(([value, text]) => {
+                    const opt = document.createElement("option");
+                    opt.value = value;
+                    opt.textContent = text;
+                    fuseModeSelect.appendChild(opt);
+                });
+                fuseModeSelect.value = ["rank", "energy"].includes(currentFuseMode) ? currentFuseMode : "none";
+                const fuseValueInput = document.createElement("input");
+                fuseValueInput.type = "number";
+                fuseValueInput.style.cssText = "width: 100px; background: #222; color: #eee; border: 1px solid #555; border-radius: 4px; padding: 4px;";
+                const updateFuseInput = () => {
+                    const mode = fuseModeSelect.value;
+                    fuseValueInput.disabled = mode === "none";
+                    if (mode === "rank") {
+                        fuseValueInput.step = "1";
+                        fuseValueInput.min = "1";
+                        if (!fuseValueInput.value || Number(fuseValueInput.value) < 1) fuseValueInput.value = "64";
+                    } else if (mode === "energy") {
+                        fuseValueInput.step = "0.01";
+                        fuseValueInput.min = "0.01";
+                        fuseValueInput.max = "1";
+                        if (!fuseValueInput.value || Number(fuseValueInput.value) > 1) fuseValueInput.value = "0.99";
+                    }
+                };
+                fuseValueInput.value = currentFuseValue;
+                fuseModeSelect.addEventListener("change", () => { fuseValueInput.value = ""; updateFuseInput(); });
+                updateFuseInput();
+                fuseRow.appendChild(fuseModeSelect);
+                fuseRow.appendChild(fuseValueInput);
+                
+                fuseSection.appendChild(fuseTitle);
+                fuseSection.appendChild(fuseDesc);
+                fuseSection.appendChild(fuseRow);
+                
+                settingsContainer.appendChild(fuseSection);
                 content.appendChild(settingsContainer);
                 
                 // 按钮容器
@@ -3874,6 +3924,11 @@ app.registerExtension({
                         this._int8ModeWidget.value = selectedMode;
                     }
                     
+                    // 保存融合设置
+                    const fuseMode = fuseModeSelect.value;
+                    this.fuseStack = fuseMode === "none" ? "none" : `${fuseMode}:${fuseValueInput.value}`;
+                    this.properties["fuse_stack"] = this.fuseStack;
+                    
                     // 触发更新
                     this.updateWidget();
                     
@@ -4048,12 +4103,12 @@ app.registerExtension({
                     try {
                         content.innerHTML = ""; // 清空内容
                         
-                    const r = await api.fetchApi(`/ma/lora/get_presets?t=${Date.now()}`);
+                    // 只拉取名称列表（服务端带 ETag，未变化时浏览器直接用缓存），预设内容在发送时按需读取
+                    const r = await api.fetchApi("/ma/lora/preset_names");
                     const d = await r.json();
-                        const presets = d.presets || {};
-                        const keys = Object.keys(presets);
+                        const presets = d.presets || [];
                         
-                        if (!keys.length) {
+                        if (!presets.length) {
                             const emptyMsg = document.createElement("div");
                             emptyMsg.textContent = "暂无预设";
                             emptyMsg.style.cssText = `
@@ -4067,18 +4122,7 @@ app.registerExtension({
                         }
                         
                         // 创建预设列表
-                        keys.forEach(presetName => {
-                            const presetData = presets[presetName];
-                            
-                            // 计算LoRA数量
-                            let loraCount = 0;
-                            if (presetData.folders) {
-                                presetData.folders.forEach(folder => {
-                                    if (folder.loras) {
-                                        loraCount += folder.loras.length;
-                                    }
-                                });
-                            }
+                        presets.forEach(({ name: presetName, lora_count: loraCount }) => {
                             
                             const item = document.createElement("div");
                             item.style.cssText = `
@@ -4129,11 +4173,18 @@ app.registerExtension({
                             `;
                             sendBtn.onmouseenter = () => sendBtn.style.background = "#5CBF60";
                             sendBtn.onmouseleave = () => sendBtn.style.background = "#4CAF50";
-                            sendBtn.onclick = () => {
-                                if (presetData.folders) {
-                                    this.loraData.folders.push(...presetData.folders);
-                                    this.renderEmbeddedList();
-                                    this.updateWidget();
+                            sendBtn.onclick = async () => {
+                                try {
+                                    const pr = await api.fetchApi(`/ma/lora/get_preset?name=${encodeURIComponent(presetName)}`);
+                                    const presetData = (await pr.json()).preset || {};
+                                    if (presetData.folders) {
+                                        this.loraData.folders.push(...presetData.folders);
+                                        this.renderEmbeddedList();
+                                        this.updateWidget();
+                                    }
+                                } catch (e) {
+                                    alert("读取预设失败: " + e);
+                                    return;
                                 }
                                 document.body.removeChild(overlay);
                             };